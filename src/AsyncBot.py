@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""AsyncBot.py: Bot on an asyncio event loop instead of threads.
+
+The connection is an AsyncHandleClient and the timers (timer1_Tick and the DecisionScheduler)
+use loop.call_later, so a bot costs no OS thread and many of them can be gathered on one loop:
+
+    await asyncio.gather(*(AsyncBot(host, port, 'native').run() for _ in range(n)))
+
+Decisions run on the loop thread, one bot at a time. With a decision budget the brain runs
+on a thread of its own (GameAI.start_search) and the decision is a task awaiting it, so the
+other bots on the loop go on while it thinks.
+"""
+
+import asyncio
+import time
+import typing
+
+from Bot import Bot
+from Socket.AsyncHandleClient import AsyncHandleClient
+import Socket.Protocol as Protocol
+
+
+class AsyncBot(Bot):
+
+    # Decision awaiting its budget, if any
+    deciding: typing.Optional[asyncio.Task] = None
+
+    def create_client(self) -> AsyncHandleClient:
+        return AsyncHandleClient()
+
+    def start(self):
+        # Connecting needs the event loop, see run()
+        pass
+
+    def call_later(self, delay, callback):
+        return self.client.loop.call_later(delay, callback)
+
+    def DoDecision(self):
+        if self.gameAi.decision_budget is None:
+            super().DoDecision()
+            return
+        # The scheduler starts no other decision until this one is sent
+        self.scheduler.deciding = True
+        self.deciding = self.client.loop.create_task(self.decide())
+
+    async def decide(self):
+        t0 = time.perf_counter()
+        try:
+            self.sendDecision(await self.gameAi.GetDecisionAsync())
+        finally:
+            # DecisionScheduler.fire only timed the start of it
+            self.scheduler.total_decide_seconds += time.perf_counter() - t0
+            if self.deciding is asyncio.current_task():
+                self.deciding = None
+                self.scheduler.deciding = False
+
+    def stop_deciding(self):
+        """Drop the decision in progress; a search it started is left to GameAI.settle()."""
+        if self.deciding is not None:
+            self.deciding.cancel()
+            self.deciding = None
+            self.scheduler.deciding = False
+
+    def ReceiveGameStatus(self, g: Protocol.GameStatus):
+        # A decision of the last game must not be sent in the next one
+        if self.gameStatus != g.status:
+            self.stop_deciding()
+        super().ReceiveGameStatus(g)
+
+    async def run(self):
+        """Connect, then play until the server closes the connection."""
+        await self.client.connect(self.host, self.port)
+        self.schedule_tick()
+        try:
+            await self.client.wait_closed()
+        finally:
+            self.running = False
+            self.timer1.cancel()
+            self.scheduler.stop()
+            self.stop_deciding()
+            self.client.disconnect()
+            self.gameAi.close()
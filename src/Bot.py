@@ -20,8 +20,10 @@ __email__ = "abaffa@inf.puc-rio.br"
 
 from threading import Timer
 from GameAI import GameAI
+from DecisionScheduler import DecisionScheduler
 import Socket.HandleClient
 from Socket.HandleClient import HandleClient
+import Socket.Protocol as Protocol
 from dto.PlayerInfo import PlayerInfo
 from dto.ScoreBoard import ScoreBoard
 import datetime
@@ -34,7 +36,10 @@ import logging
 class Bot():
 
     name = "THE_BOT" # BOT NAME
+    color = (255, 120, 45) # BOT COLOR
     host = "atari.icad.puc-rio.br" # SERVER
+    port = 8888 # SERVER PORT
+    brain_backend = "prolog" # DECISION ENGINE (see brain.BACKENDS)
 
     client: typing.Optional[HandleClient] = None
     gameAi: typing.Optional[GameAI] = None
@@ -42,6 +47,11 @@ class Bot():
     
     running = True
     thread_interval = 0.25 # USE BETWEEN 0.1 and 1 (0.1 real setting, 1 debug settings and makes the bot slower)
+    action_interval = 0.25 # MINIMUM SECONDS BETWEEN ACTIONS (decisions wait for the server's replies, but not for less than this)
+    decision_budget: typing.Optional[float] = None # SECONDS A DECISION MAY TAKE BEFORE A FALLBACK ACTION IS SENT (None: no limit)
+    speculative = False # WORK OUT THE NEXT DECISION WHILE WAITING FOR THE SERVER'S REPLIES
+    map_size: typing.Optional[typing.Tuple[int, int]] = None # (WIDTH, HEIGHT) OF THE CAVE (None: the brain's default, 60x35)
+    max_risk: typing.Optional[float] = None # NATIVE BRAIN: PIT/TELEPORTER PROBABILITY IT MAY RISK ONCE NOTHING SAFE IS LEFT TO EXPLORE (None: never)
 
     playerList: typing.Dict[int, PlayerInfo] = {} #new Dictionary<long, PlayerInfo>
     scoreList: typing.List[ScoreBoard] = [] #List<ScoreBoard>
@@ -56,240 +66,201 @@ class Bot():
     # <summary>
     # Bot Constructor
     # </summary>
-    def __init__(self):
+    # <param name="host">server address, defaults to Bot.host</param>
+    # <param name="port">server port, defaults to Bot.port</param>
+    # <param name="brain_backend">decision engine, defaults to Bot.brain_backend</param>
+    # <param name="map_interval">seconds between cave maps, None to draw them only when debugging</param>
+    # <param name="action_interval">minimum seconds between actions, defaults to Bot.action_interval</param>
+    # <param name="name">bot name, defaults to Bot.name</param>
+    # <param name="color">bot color (R, G, B), defaults to Bot.color</param>
+    # <param name="record_path">file to record the session to (Socket/SessionLog.py), None not to</param>
+    # <param name="decision_budget">seconds a decision may take, defaults to Bot.decision_budget</param>
+    # <param name="speculative">speculative decisions (GameAI.speculate), defaults to Bot.speculative</param>
+    # <param name="map_size">(width, height) of the cave, defaults to Bot.map_size</param>
+    # <param name="max_risk">danger the native brain may risk exploring, defaults to Bot.max_risk</param>
+    def __init__(self, host: typing.Optional[str] = None, port: typing.Optional[int] = None,
+                 brain_backend: typing.Optional[str] = None, map_interval: typing.Optional[float] = None,
+                 action_interval: typing.Optional[float] = None, name: typing.Optional[str] = None,
+                 color: typing.Optional[typing.Tuple[int, int, int]] = None,
+                 record_path: typing.Optional[str] = None, decision_budget: typing.Optional[float] = None,
+                 speculative: typing.Optional[bool] = None, map_size: typing.Optional[typing.Tuple[int, int]] = None,
+                 max_risk: typing.Optional[float] = None):
+
+        if host is not None:
+            self.host = host
+        if port is not None:
+            self.port = port
+        if brain_backend is not None:
+            self.brain_backend = brain_backend
+        if action_interval is not None:
+            self.action_interval = action_interval
+        if name is not None:
+            self.name = name
+        if color is not None:
+            self.color = color
+        if decision_budget is not None:
+            self.decision_budget = decision_budget
+        if speculative is not None:
+            self.speculative = speculative
+        if map_size is not None:
+            self.map_size = map_size
+        if max_risk is not None:
+            self.max_risk = max_risk
+
+        # Per bot, so several bots can share a process
+        self.playerList = {}
+        self.scoreList = []
+        self.msg = []
+
+        self.client = self.create_client()
+        if record_path is not None:
+            self.client.record(record_path)
+        self.gameAi = GameAI(self.brain_backend, map_interval, self.decision_budget, self.speculative, self.map_size, self.max_risk)
+        self.scheduler = DecisionScheduler(self.DoDecision, self.call_later, self.action_interval)
+
+        self.dispatcher = Protocol.Dispatcher()
+        self.register_handlers()
+        self.client.append_cmd_handler(self.ReceiveCommand)
+        self.client.append_chg_handler(self.SocketStatusChange)
 
-        self.client = HandleClient()
-        self.gameAi = GameAI()
+        self.start()
 
-        # duration is in seconds
-        self.timer1 = Timer(self.thread_interval, self.timer1_Tick)
 
-        self.client.append_cmd_handler(self.ReceiveCommand)
-        self.client.append_chg_handler(self.SocketStatusChange)
+    # <summary>
+    # Create the server connection (not connected yet)
+    # </summary>
+    def create_client(self) -> HandleClient:
+        return HandleClient()
+
+
+    # <summary>
+    # Connect and start the decision timer
+    # </summary>
+    def start(self):
+        self.client.connect(self.host, self.port)
+        self.schedule_tick()
 
-        self.client.connect(self.host)
-        self.timer1.start()
+
+    # <summary>
+    # Run a callback once, some seconds from now
+    # </summary>
+    # <returns>handle with cancel()</returns>
+    def call_later(self, delay: float, callback: typing.Callable[[], None]):
+        timer = Timer(delay, callback)
+        timer.start()
+        return timer
+
+
+    # <summary>
+    # Run timer1_Tick once, thread_interval seconds from now
+    # </summary>
+    def schedule_tick(self):
+        # duration is in seconds
+        self.timer1 = self.call_later(self.thread_interval, self.timer1_Tick)
 
     
     def convertFromString(self, c: str):
+        return Protocol.parse_color(c)
 
-        c = c.replace('[','')
-        c = c.replace(']','')
-        p = c.split(',')
 
-        #A = int(p[0][((p[0].find('=')) + 1):])
-        R = int(p[1][((p[1].find('=')) + 1):])
-        G = int(p[2][((p[2].find('=')) + 1):])
-        B = int(p[3][((p[3].find('=')) + 1):])
+    # <summary>
+    # Register a handler for each message type (Socket/Protocol.py)
+    # </summary>
+    def register_handlers(self):
+        self.dispatcher.register(Protocol.Observation, self.ReceiveObservation)
+        self.dispatcher.register(Protocol.Status, self.ReceiveStatus)
+        self.dispatcher.register(Protocol.Player, self.ReceivePlayer)
+        self.dispatcher.register(Protocol.GameStatus, self.ReceiveGameStatus)
+        self.dispatcher.register(Protocol.Scoreboard, self.ReceiveScoreboard)
+        self.dispatcher.register(Protocol.Notification, lambda m: self.addMessage(m.text))
+        self.dispatcher.register(Protocol.Hello, lambda m: self.addMessage(m.name + " has entered the game!"))
+        self.dispatcher.register(Protocol.Goodbye, lambda m: self.addMessage(m.name + " has left the game!"))
+        self.dispatcher.register(Protocol.ChangeName, lambda m: self.addMessage(m.old + " is now known as " + m.new + "."))
+        self.dispatcher.register(Protocol.Hit, self.ReceiveHit)
+        self.dispatcher.register(Protocol.Damage, self.ReceiveDamage)
 
-        return (R, G, B)
-    
     # <summary>
     # Receive Command From TCP Client
     # </summary>
-    # <param name="sender">Sender object</param>
-    # <param name="args">Event arguments</param>
-    def ReceiveCommand(self, cmd: str):
-
-        if len(cmd) == 0:
-            return
-        try:
-            ######################################################        
-
-            if cmd[0] ==  "o":
-                
-                if len(cmd) <= 1:
-                    self.gameAi.GetObservationsClean()
-                    return
-                
-                if cmd[1].strip() == "":
-                    self.gameAi.GetObservationsClean()
-                    return
-                
-                o: typing.List[str] = []
-
-                if cmd[1].find(",") > -1:
-                    os = cmd[1].split(',')
-                    for i in range(0,len(os)):
-                        o.append(os[i])
-                else:
-                    o.append(cmd[1])
-
-                self.gameAi.GetObservations(o)
-                
-            ######################################################        
-
-            elif cmd[0] ==  "s":
-                if len(cmd) <= 1:
-                    return
-                self.gameAi.SetStatus(int(cmd[1]),
-                                    int(cmd[2]),
-                                    cmd[3],
-                                    cmd[4],
-                                    int(cmd[5]),
-                                    int(cmd[6]))
-                
-            ######################################################        
-
-            elif cmd[0] == "player":
-                #lock (playerList)
-                
-                if len(cmd) != 8:
-                    return
-                if int(cmd[1]) not in self.playerList:
-                    self.playerList.append(int(cmd[1]), 
-                        PlayerInfo(
-                            int(cmd[1]),
-                            cmd[2],
-                            int(cmd[3]),
-                            int(cmd[4]),
-                            int(cmd[5]),
-                            int(cmd[6]),
-                            self.convertFromString(cmd[7])))
-                else:
-                    self.playerList[int(cmd[1])] = PlayerInfo(
-                        int(cmd[1]),
-                        cmd[2],
-                        int(cmd[3]),
-                        int(cmd[4]),
-                        int(cmd[5]),
-                        int(cmd[6]),
-                        self.convertFromString(cmd[7]))
-                
-            ######################################################        
-
-            elif cmd[0] == "g":
-                if len(cmd) != 3:
-                    return
-                if self.gameStatus != cmd[1]:
-                    self.playerList.clear()
-
-                if self.gameStatus != cmd[1]:
-                    logging.root.info("New Game Status: " + cmd[1])
-                    logging.root.info('Resetting AI')
-                    self.gameAi.reset()
-
-                self.gameStatus = cmd[1]
-                self.time = int(cmd[2])
-                
-            ######################################################        
-
-            elif cmd[0] == "u":
-                if len(cmd) <= 1:
-                    return
-                
-                for i in range(1, len(cmd)):
-                
-                    a = cmd[i].split('#')
-
-                    if len(a) == 4:
-                        self.scoreList.append(
-                            ScoreBoard(
-                            a[0],
-                            (a[1] == "connected"),
-                            int(a[2]),
-                            int(a[3]), (0, 0, 0)))
-                    
-                    elif len(a) == 5:
-                        self.scoreList.append(
-                            ScoreBoard(
-                            a[0],
-                            (a[1] == "connected"),
-                            int(a[2]),
-                            int(a[3]), self.convertFromString(a[4])))
-                
-
-                self.sscoreList = ""
-                for sb in self.scoreList:
-                    self.sscoreList += sb.name + "\n"
-                    self.sscoreList += ("connected" if sb.connected else "offline") + "\n"
-                    self.sscoreList += str(sb.energy) + "\n"
-                    self.sscoreList += str(sb.score) + "\n"
-                    self.sscoreList += "---\n"
-                
-                self.scoreList.clear()
-                
-                
-            ######################################################        
-
-            elif cmd[0] == "notification":
-                if len(cmd) <= 1:
-                    return
-
-                if len(self.msg) == 0:
-                    self.msgSeconds = 0
-                
-                self.msg.append(cmd[1])
-                
-            ######################################################        
-
-            elif cmd[0] == "hello":
-                if len(cmd) <= 1:
-                    return
-
-                if len(self.msg) == 0:
-                    self.msgSeconds = 0
-
-                self.msg.append(cmd[1] + " has entered the game!")
-                
-            ######################################################        
-
-            elif cmd[0] == "goodbye":
-                if len(cmd) < 1:
-                    return
-
-                if len(self.msg) == 0:
-                    self.msgSeconds = 0
-
-                self.msg.append(cmd[1] + " has left the game!")
-                
-            ######################################################        
-
-            elif cmd[0] == "changename":
-                if len(cmd) <= 1:
-                    return
-                if len(self.msg) == 0:
-                    self.msgSeconds = 0
-
-                self.msg.append(cmd[1] + " is now known as " + cmd[2] + ".")
-                
-                
-            ######################################################        
-
-            elif cmd[0] == "h":
-                if len(cmd) <= 1:
-                    return
-                self.gameAi.receiveShotHit(cmd[1])
-                self.msg.append("you hit " + cmd[1])                    
-                
-            ######################################################        
-
-            elif cmd[0] == "d":
-                if len(cmd) <= 1:
-                    return
-                self.gameAi.receiveGotHit(cmd[1])
-                msg = f'Ei, @{cmd[1]}, para de atirar em mim!'
-                self.client.sendSay(msg)
-                self.msg.append(cmd[1] + " hit you")                    
-                
-                
-            ######################################################        
-
-        except Exception as ex:
-            if ex != None:
-                logging.root.debug(ex)
-            pass
+    # <param name="cmd">line split on ';'</param>
+    def ReceiveCommand(self, cmd: typing.List[str]):
+        self.dispatcher.dispatch(cmd)
+
+    def ReceiveObservation(self, o: Protocol.Observation):
+        if len(o.items) == 0:
+            self.gameAi.GetObservationsClean()
+        else:
+            self.gameAi.GetObservations(o.items)
+        self.scheduler.received("o")
+
+    def ReceiveStatus(self, s: Protocol.Status):
+        self.gameAi.SetStatus(s.x, s.y, s.dir, s.state, s.score, s.energy)
+        self.scheduler.received("s")
+
+    def ReceivePlayer(self, p: Protocol.Player):
+        #lock (playerList)
+        player = self.playerList.get(p.node)
+        if player is None:
+            self.playerList[p.node] = PlayerInfo(p.node, p.name, p.x, p.y, p.dir, p.state, p.color)
+        else:
+            player.update(p.name, p.x, p.y, p.dir, p.state, p.color)
+
+    def ReceiveGameStatus(self, g: Protocol.GameStatus):
+        if self.gameStatus != g.status:
+            self.playerList.clear()
+            logging.root.info("New Game Status: " + g.status)
+            logging.root.info('Resetting AI')
+            self.gameAi.reset()
+
+        self.gameStatus = g.status
+        self.time = g.time
+        if self.gameStatus == "Game":
+            self.scheduler.enabled = True
+        else:
+            self.scheduler.stop()
+
+    def ReceiveScoreboard(self, u: Protocol.Scoreboard):
+        # Entries are reused from one scoreboard to the next
+        for i, e in enumerate(u.entries):
+            if i < len(self.scoreList):
+                self.scoreList[i].update(e.name, e.connected, e.score, e.energy, e.color)
+            else:
+                self.scoreList.append(ScoreBoard(e.name, e.connected, e.score, e.energy, e.color))
+        del self.scoreList[len(u.entries):]
+
+        self.sscoreList = "".join(
+            f'{sb.name}\n{"connected" if sb.connected else "offline"}\n{sb.energy}\n{sb.score}\n---\n'
+            for sb in self.scoreList)
+
+    def ReceiveHit(self, h: Protocol.Hit):
+        self.gameAi.receiveShotHit(h.target)
+        self.msg.append("you hit " + h.target)
+
+    def ReceiveDamage(self, d: Protocol.Damage):
+        self.gameAi.receiveGotHit(d.shooter)
+        msg = f'Ei, @{d.shooter}, para de atirar em mim!'
+        self.client.sendSay(msg)
+        self.msg.append(d.shooter + " hit you")
+
+    # <summary>
+    # Queue a message to be logged with the next ones
+    # </summary>
+    def addMessage(self, text: str):
+        if len(self.msg) == 0:
+            self.msgSeconds = 0
+        self.msg.append(text)
 
     def SocketStatusChange(self):
     
         if self.client.connected:
 
             logging.root.info("Connected")
-            self.client.sendName(self.name)
-            self.client.sendRGB(255,120,45)  # BOT COLOR
-            self.client.sendRequestGameStatus()
-            self.client.sendRequestUserStatus()
-            self.client.sendRequestObservation()
+            with self.client.batch():
+                self.client.sendName(self.name)
+                self.client.sendRGB(*self.color)
+                self.client.sendRequestGameStatus()
+                self.client.sendRequestUserStatus()
+                self.client.sendRequestObservation()
 
         else:
             logging.root.info("Disconnected")
@@ -316,40 +287,58 @@ class Bot():
     # </summary>
     def DoDecision(self):
 
-        decision = self.gameAi.GetDecision()
-        if decision == "virar_direita":
-            self.client.sendTurnRight()
-        elif decision == "virar_esquerda":
-            self.client.sendTurnLeft()
-        elif decision == "andar":
-            self.client.sendForward()
-        elif decision ==  "atacar":
-            self.client.sendShoot()
-        elif decision ==  "pegar":
-            self.client.sendGetItem()
-        elif decision ==  "andar_re":
-            self.client.sendBackward()
+        self.sendDecision(self.gameAi.GetDecision())
 
-        self.client.sendRequestUserStatus()
-        self.client.sendRequestObservation()
+
+    # <summary>
+    # Send a decision, with the requests for its outcome
+    # </summary>
+    # <param name="decision">command string from GameAI.GetDecision</param>
+    def sendDecision(self, decision: str):
+
+        # Action and requests go out in one write
+        with self.client.batch():
+            if decision == "virar_direita":
+                self.client.sendTurnRight()
+            elif decision == "virar_esquerda":
+                self.client.sendTurnLeft()
+            elif decision == "andar":
+                self.client.sendForward()
+            elif decision ==  "atacar":
+                self.client.sendShoot()
+            elif decision ==  "pegar":
+                self.client.sendGetItem()
+            elif decision ==  "andar_re":
+                self.client.sendBackward()
+
+            self.scheduler.sent()
+            self.client.sendRequestUserStatus()
+            self.client.sendRequestObservation()
+
+        # Out already: the next decision can be worked out while the replies are on their way
+        self.gameAi.speculate()
 
 
     def timer1_Tick(self):
         
-        self.msgSeconds += self.timer1.interval * 1000 # KEEP THIS AS IS - 1000 miliseconds = 1 second
+        self.msgSeconds += self.thread_interval * 1000 # KEEP THIS AS IS - 1000 miliseconds = 1 second
 
-        self.client.sendRequestGameStatus()
-        if self.gameStatus == "Game":
-            self.DoDecision()
+        # One write for everything sent this tick
+        with self.client.batch():
+            self.client.sendRequestGameStatus()
+            if self.gameStatus == "Game":
+                # Decisions follow the replies, see DecisionScheduler; this only starts them
+                # and notices replies that never came
+                self.scheduler.poll()
 
-        elif self.msgSeconds >= 5000: # 5 SECONDS
+            elif self.msgSeconds >= 5000: # 5 SECONDS
 
-            logging.root.info(self.gameStatus)
-            logging.root.info(self.GetTime())
-            logging.root.info("-----------------")
-            logging.root.info(self.sscoreList)
+                logging.root.info(self.gameStatus)
+                logging.root.info(self.GetTime())
+                logging.root.info("-----------------")
+                logging.root.info(self.sscoreList)
 
-            self.client.sendRequestScoreboard()
+                self.client.sendRequestScoreboard()
         
 
         if self.msgSeconds  >= 5000: # 5 SECONDS
@@ -361,9 +350,22 @@ class Bot():
 
                 self.msg.clear()
 
+            if self.scheduler.overruns > 0:
+                logging.root.info("Decisions: " + self.scheduler.report())
+            elif self.scheduler.decisions > 0:
+                logging.root.debug("Decisions: " + self.scheduler.report())
+            self.scheduler.reset_stats()
+            if self.gameAi.late_decisions > 0:
+                logging.root.info(f"Decision budget ran out {self.gameAi.late_decisions} times")
+            if self.gameAi.speculations > 0:
+                logging.root.debug(f"Speculative decisions: {self.gameAi.speculation_hits} of {self.gameAi.speculations} used")
+            self.gameAi.reset_stats()
+            if self.client.batches > 0:
+                logging.root.debug("Sent: " + self.client.send_report())
+            self.client.reset_send_stats()
+
             self.msgSeconds  = 0
         
         if self.running:
-            self.timer1 = Timer(self.thread_interval, self.timer1_Tick)
-            self.timer1.start()
+            self.schedule_tick()
 
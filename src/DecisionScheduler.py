@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""DecisionScheduler.py: Decide when the replies to the last decision are in.
+
+Every decision ends with requests for status ('q', answered by 's') and observations ('o').
+Instead of deciding on a fixed timer, whatever arrived by then, the scheduler waits for both
+replies and decides right away, but never sooner than min_interval after the previous
+action. Replies that take longer than timeout are an overrun: it is counted and the
+decision is made anyway (which asks again). Drift is how late a decision ran after it was due.
+"""
+
+import logging
+import threading
+import time
+import typing
+
+import metrics
+
+# call_later(delay, callback) -> handle with cancel(), e.g. threading.Timer or loop.call_later
+CallLater = typing.Callable[[float, typing.Callable[[], None]], typing.Any]
+Clock = typing.Callable[[], float]
+
+
+class DecisionScheduler():
+
+    # Replies each decision waits for
+    REPLIES = ('s', 'o')
+
+    def __init__(self, decide: typing.Callable[[], None], call_later: CallLater,
+                 min_interval: float = 0.25, timeout: float = 1.0, clock: Clock = time.monotonic) -> None:
+        self.decide = decide
+        self.call_later = call_later
+        # Seconds, for intervals and timeouts; Replay.py runs it on the recorded time
+        self.clock = clock
+        self.min_interval = min_interval
+        self.timeout = timeout
+        # Decide only while the game is on
+        self.enabled = False
+        self.awaiting: typing.Set[str] = set()
+        self.sent_at = float('-inf')
+        self.handle = None
+        self.due = 0.0
+        # A decision still going on after decide() returned (AsyncBot awaits its budget)
+        self.deciding = False
+        self.lock = threading.RLock()
+        self.reset_stats()
+        # Since the start, unlike the stats above
+        self.total_decisions = 0
+        self.total_overruns = 0
+        self.total_decide_seconds = 0.0
+
+    def reset_stats(self) -> None:
+        self.decisions = 0
+        self.overruns = 0
+        self.drift_total = 0.0
+        self.drift_max = 0.0
+        self.wait_total = 0.0
+
+    def sent(self) -> None:
+        """The decision and its requests went out."""
+        with self.lock:
+            self.awaiting = set(self.REPLIES)
+            self.sent_at = self.clock()
+
+    def received(self, reply: str) -> None:
+        """A reply came in, from the receiving thread or task."""
+        with self.lock:
+            if reply not in self.awaiting:
+                return
+            self.awaiting.discard(reply)
+            now = self.clock()
+            if metrics.enabled:
+                metrics.REPLY_SECONDS.labels(reply).observe(now - self.sent_at)
+            if self.awaiting:
+                return
+            self.wait_total += now - self.sent_at
+            self.ready(now)
+
+    def poll(self) -> None:
+        """Called regularly (timer1_Tick): start deciding, or recover from lost replies."""
+        with self.lock:
+            if not self.enabled or self.handle is not None or self.deciding:
+                return
+            now = self.clock()
+            if not self.awaiting:
+                # Nothing in flight: first decision of a game
+                self.ready(now)
+            elif now - self.sent_at >= self.timeout:
+                self.overruns += 1
+                self.total_overruns += 1
+                logging.root.debug(f'No {"/".join(sorted(self.awaiting))} reply after {now - self.sent_at:.3f}s, deciding anyway')
+                self.awaiting.clear()
+                self.ready(now)
+
+    def ready(self, now: float) -> None:
+        if not self.enabled:
+            return
+        self.due = max(now, self.sent_at + self.min_interval)
+        if self.due <= now:
+            self.fire()
+        else:
+            self.handle = self.call_later(self.due - now, self.fire)
+
+    def fire(self) -> None:
+        with self.lock:
+            self.handle = None
+            if not self.enabled:
+                return
+            drift = self.clock() - self.due
+            self.drift_total += drift
+            self.drift_max = max(self.drift_max, drift)
+            self.decisions += 1
+            self.total_decisions += 1
+            t0 = time.perf_counter()
+            self.decide()
+            self.total_decide_seconds += time.perf_counter() - t0
+
+    def stop(self) -> None:
+        with self.lock:
+            self.enabled = False
+            self.awaiting.clear()
+            if self.handle is not None:
+                self.handle.cancel()
+                self.handle = None
+
+    def report(self) -> str:
+        """Summary since the last reset_stats()."""
+        n = max(self.decisions, 1)
+        return (f'{self.decisions} decisions, {self.overruns} overruns, '
+                f'reply wait {1000 * self.wait_total / n:.1f} ms, '
+                f'drift {1000 * self.drift_total / n:.1f} ms (max {1000 * self.drift_max:.1f} ms)')
@@ -19,22 +19,72 @@ __email__ = "abaffa@inf.puc-rio.br"
 #############################################################
 
 import random
+import asyncio
+import concurrent.futures
+import threading
 from Map.Position import Position
 import typing
-import prolog.prologquery as ai
+import brain.types as ai
+from brain import create_brain
+from brain.viewer import MapViewer
+from brain import speculation
 import logging
+import time
+import metrics
 
 # <summary>
 # Game AI Example
 # </summary>
 class GameAI():
 
-    brain = ai.PrologQuery()
-    player = Position()
     state = "ready"
     dir = "north"
     score = 0
     energy = 0
+    # Last observations and enemy distance, sent to the brain with the status on the next decision
+    sensors: typing.Optional[ai.Sensors] = None
+    enemy_distance: typing.Optional[int] = None
+    # Got hit since the last decision
+    got_hit = False
+
+    # Decisions that ran out of budget (fallback action sent), since reset_stats() and in total
+    late_decisions = 0
+    total_late_decisions = 0
+    # Speculative decisions made and used, since reset_stats() and in total
+    speculations = 0
+    speculation_hits = 0
+    total_speculations = 0
+    total_speculation_hits = 0
+
+    # <summary>
+    # GameAI Constructor
+    # </summary>
+    # <param name="backend">decision engine, one of brain.BACKENDS</param>
+    # <param name="map_interval">seconds between cave maps, None to draw them only when debugging</param>
+    # <param name="decision_budget">seconds a decision may take before the fallback action is sent, None for no limit</param>
+    # <param name="speculative">work out the next decision while waiting for the server's replies</param>
+    # <param name="map_size">(width, height) of the cave, None for the brain's default; grown to fit any position the server reports</param>
+    # <param name="max_risk">native brain: danger it may risk once no safe cell is left to explore, None not to</param>
+    def __init__(self, backend: str = "prolog", map_interval: typing.Optional[float] = None,
+                 decision_budget: typing.Optional[float] = None, speculative: bool = False,
+                 map_size: typing.Optional[typing.Tuple[int, int]] = None, max_risk: typing.Optional[float] = None):
+        self.brain = create_brain(backend, map_size, max_risk)
+        # Per instance, as SetStatus updates it in place and several bots can share a process
+        self.player = Position()
+        self.show_map = map_interval is not None
+        self.viewer = MapViewer(map_interval if map_interval is not None else 0)
+
+        # With a budget the brain runs on a thread of its own, so a slow search can be left
+        # to finish while the bot acts; search is the one still running, if any
+        self.decision_budget = decision_budget
+        self.search: typing.Optional[concurrent.futures.Future] = None
+
+        # See speculate(); searches and speculations both give (brain, action)
+        self.speculative = speculative
+        self.speculation: typing.Optional[speculation.Speculation] = None
+        # Action sent last, and the last observations made on each cell, for predictions
+        self.sent_action: typing.Optional[str] = None
+        self.cell_sensors: typing.Dict[typing.Tuple[int, int], ai.Sensors] = {}
 
 
     # <summary>
@@ -48,10 +98,6 @@ class GameAI():
     # <param name="energy">player energy</param>
     def SetStatus(self, x: int, y: int, dir: str, state: str, score: int, energy: int):
         logging.root.debug(f'Got status x: {x}, y: {y}, dir: {dir}, state:{state}, score: {score}, energy: {energy}')
-        self.brain.set_position(x, y)
-        self.brain.set_facing(dir)
-        self.brain.set_energy(energy)
-        self.brain.set_score(score)
         self.player.x = x
         self.player.y = y
         self.dir = dir.lower()
@@ -64,7 +110,8 @@ class GameAI():
         pass
 
     def receiveGotHit(self, agent: str):
-        self.brain.set_got_hit()
+        # Passed on with the next decision, the brain may be busy now
+        self.got_hit = True
 
     # <summary>
     # Observations received
@@ -105,9 +152,8 @@ class GameAI():
             elif 'enemy' in s:
                 split_index = s.find('#')
                 if split_index > -1:
-                    distance = int(s[split_index + 1 : ])
-                    self.brain.set_detected_enemy(distance)
-        self.brain.set_observations(sensors)
+                    self.enemy_distance = int(s[split_index + 1 : ])
+        self.sensors = sensors
 
 
     # <summary>
@@ -115,8 +161,7 @@ class GameAI():
     # </summary>
     def GetObservationsClean(self):
         logging.root.debug('Got observations: ' + '[]')
-        sensors = ai.Sensors()
-        self.brain.set_observations(sensors)
+        self.sensors = ai.Sensors()
 
     # <summary>
     # Get list of observable adjacent positions
@@ -163,8 +208,37 @@ class GameAI():
     # <returns>command string to new decision</returns>
     def GetDecision(self):
 
-        action = self.brain.get_decision()
         decision = ''
+        if self.sensors is None:
+            return decision
+
+        t0 = time.perf_counter() if metrics.enabled else 0.0
+        return self.command(self.think(), t0)
+
+
+    # <summary>
+    # Get Decision, waiting for the decision budget without blocking the event loop (AsyncBot)
+    # </summary>
+    # <returns>command string to new decision</returns>
+    async def GetDecisionAsync(self):
+
+        if self.sensors is None:
+            return ''
+
+        t0 = time.perf_counter() if metrics.enabled else 0.0
+        return self.command(await self.think_async(), t0)
+
+
+    # <summary>
+    # Command string of the brain's action
+    # </summary>
+    # <param name="action">the brain's action</param>
+    # <param name="t0">perf_counter() when the decision started, for metrics</param>
+    def command(self, action: typing.Optional[ai.Action], t0: float) -> str:
+
+        decision = ''
+        self.enemy_distance = None
+        self.sent_action = action.action if action is not None else None
 
         try:
             if action.action == 'pick_up':
@@ -184,12 +258,258 @@ class GameAI():
         except Exception:
             pass
 
-        self.brain.print_map()
+        if metrics.enabled:
+            metrics.DECISION_SECONDS.observe(time.perf_counter() - t0)
+            metrics.DECISIONS.inc()
+            if decision == '':
+                metrics.IDLE_DECISIONS.inc()
+
         logging.root.debug(f'Got decision: {decision}')
         return decision
-    
+
+
+    # <summary>
+    # Status, observations and decision in a single call into the brain, within decision_budget
+    # </summary>
+    # <returns>the brain's action, or fallback_action() if the budget ran out</returns>
+    def think(self) -> typing.Optional[ai.Action]:
+
+        args = self.inputs()
+        speculative = self.take_speculation(args)
+        if self.decision_budget is None:
+            if speculative is not None and not self.failed(speculative):
+                return self.adopt(speculative.result())
+            return self.adopt((self.brain, self.decide(*args)))
+
+        deadline = time.monotonic() + self.decision_budget
+        if self.search is not None:
+            # Still on a decision the budget ran out on. Its action is stale by now (the
+            # fallback was sent instead), so only its work on the knowledge base is kept
+            if not self.wait(self.search, deadline):
+                self.got_hit = self.got_hit or args[-1]
+                return self.late()
+            if self.search.exception() is not None:
+                logging.root.debug(f'Late decision failed: {self.search.exception()!r}')
+            else:
+                self.adopt(self.search.result())
+            self.search = None
+
+        self.search = speculative if speculative is not None else self.start_search(args)
+        if not self.wait(self.search, deadline):
+            return self.late()
+        if self.search is speculative and self.failed(speculative):
+            # The real brain was left untouched: decide on it, with what is left of the budget
+            self.search = self.start_search(args)
+            if not self.wait(self.search, deadline):
+                return self.late()
+        search, self.search = self.search, None
+        return self.adopt(search.result())
+
+
+    # <summary>
+    # think() for the asyncio transport: with a budget, the waits are awaited on the event
+    # loop, so the other bots on it go on meanwhile. Without one the brain is called right
+    # here, on the loop thread, as the decision has to be waited for anyway.
+    # </summary>
+    # <returns>the brain's action, or fallback_action() if the budget ran out</returns>
+    async def think_async(self) -> typing.Optional[ai.Action]:
+
+        if self.decision_budget is None:
+            return self.think()
+
+        deadline = time.monotonic() + self.decision_budget
+        if self.speculation is not None and not self.speculation.forked.is_set():
+            # Still copying the brain (take_speculation would block until it is done)
+            await asyncio.get_running_loop().run_in_executor(None, self.speculation.forked.wait)
+        args = self.inputs()
+        speculative = self.take_speculation(args)
+        if self.search is not None:
+            if not await self.wait_async(self.search, deadline):
+                self.got_hit = self.got_hit or args[-1]
+                return self.late()
+            if self.search.exception() is not None:
+                logging.root.debug(f'Late decision failed: {self.search.exception()!r}')
+            else:
+                self.adopt(self.search.result())
+            self.search = None
+
+        self.search = speculative if speculative is not None else self.start_search(args)
+        if not await self.wait_async(self.search, deadline):
+            return self.late()
+        if self.search is speculative and self.failed(speculative):
+            self.search = self.start_search(args)
+            if not await self.wait_async(self.search, deadline):
+                return self.late()
+        search, self.search = self.search, None
+        return self.adopt(search.result())
+
+
+    def inputs(self) -> tuple:
+        """Arguments of decide() for the status and observations received since the last decision."""
+        args = (self.player.x, self.player.y, self.dir, self.energy, self.score,
+                self.sensors, self.enemy_distance, self.got_hit)
+        self.got_hit = False
+        self.cell_sensors[(self.player.x, self.player.y)] = self.sensors
+        return args
+
+
+    def decide(self, x: int, y: int, dir: str, energy: int, score: int, sensors: ai.Sensors,
+               enemy_distance: typing.Optional[int], got_hit: bool) -> typing.Optional[ai.Action]:
+        if x >= self.brain.width or y >= self.brain.height:
+            width, height = max(self.brain.width, x + 1), max(self.brain.height, y + 1)
+            logging.root.info(f'Position ({x}, {y}) is off the map, growing it to {width}x{height}')
+            self.brain.set_map_size(width, height)
+        if got_hit:
+            self.brain.set_got_hit()
+        return self.brain.tick(x, y, dir, energy, score, sensors, enemy_distance)
+
+
+    # <summary>
+    # Take the brain a search decided with (a speculative fork replaces the current one)
+    # </summary>
+    # <returns>the search's action</returns>
+    def adopt(self, result: typing.Tuple[typing.Any, typing.Optional[ai.Action]]) -> typing.Optional[ai.Action]:
+        brain, action = result
+        if brain is not self.brain:
+            self.brain.close()
+            self.brain = brain
+        # The map is drawn by the viewer thread, from a snapshot taken here
+        if self.show_map or logging.root.isEnabledFor(logging.DEBUG):
+            self.viewer.request(self.brain)
+        return action
+
+
+    def start_search(self, args: tuple) -> concurrent.futures.Future:
+        # A thread per search rather than an executor: executors take no work once the
+        # main thread has exited, and Program.py's main thread does right after connecting
+        search = concurrent.futures.Future()
+        brain = self.brain
+
+        def run():
+            if search.set_running_or_notify_cancel():
+                try:
+                    search.set_result((brain, self.decide(*args)))
+                except BaseException as ex:
+                    search.set_exception(ex)
+
+        threading.Thread(target=run, name='brain', daemon=True).start()
+        return search
+
+
+    # <summary>
+    # Start working out the next decision, on a fork of the brain, as if the action just
+    # sent works and the next cell looks as it did last time (brain/speculation.py)
+    # </summary>
+    def speculate(self):
+        if not self.speculative or self.sensors is None or self.search is not None or self.speculation is not None:
+            return
+        predicted, sensors = speculation.predict(self.sent_action, self.player.x, self.player.y, self.dir,
+                                                 self.energy, self.score, self.cell_sensors)
+        self.speculation = speculation.Speculation(self.brain, predicted, sensors)
+
+
+    def take_speculation(self, args: tuple) -> typing.Optional[concurrent.futures.Future]:
+        """The speculative search, if it was made for these inputs; discarded otherwise."""
+        if self.speculation is None:
+            return None
+        current, self.speculation = self.speculation, None
+        search = current.take(speculation.inputs(*args))
+        self.speculations += 1
+        self.total_speculations += 1
+        if search is not None:
+            self.speculation_hits += 1
+            self.total_speculation_hits += 1
+        if metrics.enabled:
+            metrics.SPECULATIONS.labels('hit' if search is not None else 'miss').inc()
+        return search
+
+
+    def failed(self, speculative: concurrent.futures.Future) -> bool:
+        """Waits for a speculative search, True if it raised (Speculation.run closed its fork)."""
+        if speculative.exception() is None:
+            return False
+        logging.root.debug(f'Speculative decision failed: {speculative.exception()!r}')
+        return True
+
+
+    def wait(self, search: concurrent.futures.Future, deadline: float) -> bool:
+        """True once search is done, False if it is still running at the deadline."""
+        try:
+            search.exception(timeout=max(deadline - time.monotonic(), 0))
+            return True
+        except concurrent.futures.TimeoutError:
+            return False
+
+
+    async def wait_async(self, search: concurrent.futures.Future, deadline: float) -> bool:
+        """wait(), on the event loop."""
+        try:
+            # Shielded: running out of time must leave the search running, not cancel it
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(search)),
+                                   max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            return False
+        except Exception:
+            # Failed, which is done too; the caller looks at search.exception()
+            pass
+        return True
+
+
+    # <summary>
+    # The budget ran out: count it and act without the brain
+    # </summary>
+    def late(self) -> ai.Action:
+        self.late_decisions += 1
+        self.total_late_decisions += 1
+        if metrics.enabled:
+            metrics.LATE_DECISIONS.inc()
+        logging.root.debug(f'No decision after {self.decision_budget:.3f}s, sending the fallback action')
+        return self.fallback_action()
+
+
+    # <summary>
+    # Best action without the brain: shoot an enemy in sight, otherwise turn. Both keep the
+    # agent on its cell, so the observations the brain misses meanwhile are of a cell it
+    # already knows, and no plan made before the fallback can lead it into a pit.
+    # </summary>
+    def fallback_action(self) -> ai.Action:
+        if self.enemy_distance is not None:
+            return ai.Action('shoot')
+        return ai.Action('turn_clockwise')
+
+
+    def reset_stats(self):
+        self.late_decisions = 0
+        self.speculations = 0
+        self.speculation_hits = 0
+
+
+    # <summary>
+    # Wait for a search still running (the brain is not safe to use meanwhile)
+    # </summary>
+    def settle(self):
+        if self.speculation is not None:
+            self.speculation.discard()
+            self.speculation = None
+        if self.search is not None:
+            concurrent.futures.wait([self.search])
+            if self.search.exception() is None and self.search.result()[0] is not self.brain:
+                self.search.result()[0].close()
+            self.search = None
+
+
+    def close(self):
+        self.settle()
+        self.brain.close()
+
     def reset(self):
+        self.settle()
         self.brain.reset()
+        self.sensors = None
+        self.enemy_distance = None
+        self.got_hit = False
+        self.sent_action = None
+        self.cell_sensors.clear()
         if logging.root.level >= logging.INFO:
             self.brain.disable_logging()
 
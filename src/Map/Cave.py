@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""Cave.py: Cave map used by the local stand-in server."""
+
+import random
+import typing
+
+# Cell contents, as written in map files
+WALL = '#'
+EMPTY = '.'
+PIT = 'P'
+TELEPORTER = 'T'
+GOLD_COIN = 'O'
+GOLD_RING = 'o'
+POWER_UP_10 = '1'
+POWER_UP_20 = '2'
+POWER_UP_50 = '5'
+ENEMY = 'E'
+
+# Score gained when picking up each treasure
+GOLD_VALUE = {GOLD_COIN: 1000, GOLD_RING: 500}
+
+# Energy gained when picking up each power up
+POWER_UP_VALUE = {POWER_UP_10: 10, POWER_UP_20: 20, POWER_UP_50: 50}
+
+CELLS = [WALL, EMPTY, PIT, TELEPORTER, ENEMY, *GOLD_VALUE, *POWER_UP_VALUE]
+
+# Same orientation as pitfall.pl: north decreases y, east increases x
+DIRECTIONS = ['north', 'east', 'south', 'west']
+DELTAS = {
+    'north': (0, -1),
+    'east': (1, 0),
+    'south': (0, 1),
+    'west': (-1, 0),
+}
+
+# Grid size the decision engine assumes (see minX/maxX/minY/maxY in pitfall.pl)
+DEFAULT_WIDTH = 60
+DEFAULT_HEIGHT = 35
+
+
+class Cave():
+    """Static layout of a match: walls, pits, teleporters, items and enemies.
+
+    Cells outside the grid behave as walls, as the sides of the labyrinth do
+    on the real server.
+    """
+
+    def __init__(self, width: int = DEFAULT_WIDTH, height: int = DEFAULT_HEIGHT) -> None:
+        self.width = width
+        self.height = height
+        self.grid = [[EMPTY] * width for _ in range(height)]
+
+    @staticmethod
+    def loads(text: str) -> 'Cave':
+        lines = [line.rstrip('\r\n') for line in text.splitlines()]
+        lines = [line for line in lines if line and not line.startswith(';')]
+        if len(lines) == 0:
+            raise ValueError('Empty cave map')
+        width = max(len(line) for line in lines)
+        cave = Cave(width, len(lines))
+        for y, line in enumerate(lines):
+            for x, c in enumerate(line.ljust(width, EMPTY)):
+                if c not in CELLS:
+                    raise ValueError(f'Unknown cell {c!r} at ({x}, {y})')
+                cave.grid[y][x] = c
+        return cave
+
+    @staticmethod
+    def load(path: str) -> 'Cave':
+        with open(path, 'r', encoding='utf-8') as f:
+            return Cave.loads(f.read())
+
+    def dumps(self) -> str:
+        return '\n'.join(''.join(row) for row in self.grid) + '\n'
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.dumps())
+
+    @staticmethod
+    def generate(
+        width: int = DEFAULT_WIDTH, height: int = DEFAULT_HEIGHT, seed: typing.Optional[int] = None,
+        walls: float = 0.12, pits: int = 25, teleporters: int = 8, gold: int = 20,
+        power_ups: int = 10, enemies: int = 0,
+    ) -> 'Cave':
+        """Random cave with `walls` as a fraction of the cells and the given item counts."""
+        rng = random.Random(seed)
+        cave = Cave(width, height)
+        cells = [(x, y) for y in range(height) for x in range(width)]
+        rng.shuffle(cells)
+
+        wall_count = int(len(cells) * walls)
+        contents = [WALL] * wall_count + [PIT] * pits + [TELEPORTER] * teleporters + [ENEMY] * enemies
+        contents += [rng.choice(list(GOLD_VALUE)) for _ in range(gold)]
+        contents += [rng.choice(list(POWER_UP_VALUE)) for _ in range(power_ups)]
+        if len(contents) >= len(cells):
+            raise ValueError('Cave too small for the requested contents')
+
+        for (x, y), c in zip(cells, contents):
+            cave.grid[y][x] = c
+        return cave
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x: int, y: int) -> str:
+        if not self.in_bounds(x, y):
+            return WALL
+        return self.grid[y][x]
+
+    def set(self, x: int, y: int, c: str) -> None:
+        self.grid[y][x] = c
+
+    def is_blocked(self, x: int, y: int) -> bool:
+        return self.get(x, y) == WALL
+
+    def neighbours(self, x: int, y: int) -> typing.Iterator[typing.Tuple[int, int]]:
+        for dx, dy in DELTAS.values():
+            if self.in_bounds(x + dx, y + dy):
+                yield x + dx, y + dy
+
+    def cells(self, c: str) -> typing.List[typing.Tuple[int, int]]:
+        return [(x, y) for y in range(self.height) for x in range(self.width) if self.grid[y][x] == c]
+
+    def copy(self) -> 'Cave':
+        cave = Cave(self.width, self.height)
+        cave.grid = [list(row) for row in self.grid]
+        return cave
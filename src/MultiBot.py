@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+"""MultiBot.py: Runs many bots against one server, spread over a pool of processes.
+
+Every bot has its own connection, handlers and brain. Bots are dealt round-robin to
+--processes workers; in each one they share an asyncio event loop (AsyncBot), and with the
+prolog brain one SWI-Prolog runtime, each bot's knowledge base living in its own engine
+(prolog/engines.py). Every few seconds the workers send their bots' counters to the parent,
+which prints them next to the totals.
+
+Usage (from src/):
+    python MultiBot.py --host 127.0.0.1 --bots 8 --brain native --processes 4
+    python MultiBot.py --host 127.0.0.1 --bots 3 --names ana,bia,caio --colors 255,0,0 0,255,0 0,0,255
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import typing
+
+import brain
+from AsyncBot import AsyncBot
+from Bot import Bot
+
+Color = typing.Tuple[int, int, int]
+
+
+class BotSpec():
+    """What a worker needs to start one bot."""
+    __slots__ = ('name', 'color')
+
+    def __init__(self, name: str, color: Color) -> None:
+        self.name = name
+        self.color = color
+
+
+class BotStats():
+    """Counters of one bot, sent from its worker to the parent."""
+    __slots__ = ('name', 'pid', 'connected', 'seconds', 'decisions', 'overruns', 'late', 'decide_seconds')
+
+    def __init__(self, bot: AsyncBot, seconds: float) -> None:
+        self.name = bot.name
+        self.pid = os.getpid()
+        self.connected = bot.client.connected
+        self.seconds = seconds
+        self.decisions = bot.scheduler.total_decisions
+        self.overruns = bot.scheduler.total_overruns
+        self.late = bot.gameAi.total_late_decisions
+        self.decide_seconds = bot.scheduler.total_decide_seconds
+
+
+# Set in each worker by init_worker
+_stats_queue: typing.Optional[multiprocessing.Queue] = None
+
+
+def init_worker(stats_queue: multiprocessing.Queue, log_level: int) -> None:
+    global _stats_queue
+    _stats_queue = stats_queue
+    logging.basicConfig(level=log_level, format=f'[%(levelname)s] {os.getpid()}: %(message)s', force=True)
+
+
+def run_group(specs: typing.List[BotSpec], host: str, port: int, backend: str,
+              interval: float, budget: typing.Optional[float], speculative: bool,
+              map_size: typing.Optional[typing.Tuple[int, int]], max_risk: typing.Optional[float],
+              seconds: typing.Optional[float], report_every: float) -> int:
+    """Worker: play the bots in specs on one event loop. Returns how many were started."""
+    return asyncio.run(play(specs, host, port, backend, interval, budget, speculative, map_size, max_risk,
+                            seconds, report_every))
+
+
+async def play(specs: typing.List[BotSpec], host: str, port: int, backend: str,
+               interval: float, budget: typing.Optional[float], speculative: bool,
+               map_size: typing.Optional[typing.Tuple[int, int]], max_risk: typing.Optional[float],
+               seconds: typing.Optional[float], report_every: float) -> int:
+    bots = [AsyncBot(host, port, backend, None, interval, spec.name, spec.color,
+                     decision_budget=budget, speculative=speculative, map_size=map_size, max_risk=max_risk)
+            for spec in specs]
+    t0 = time.monotonic()
+
+    def report() -> None:
+        elapsed = time.monotonic() - t0
+        for bot in bots:
+            _stats_queue.put(BotStats(bot, elapsed))
+
+    async def reporter() -> None:
+        while True:
+            await asyncio.sleep(report_every)
+            report()
+
+    games = [asyncio.create_task(bot.run()) for bot in bots]
+    reporting = asyncio.create_task(reporter())
+    try:
+        await asyncio.wait(games, timeout=seconds)
+        for bot, game in zip(bots, games):
+            if game.done() and game.exception() is not None:
+                logging.root.warning(f'{bot.name} stopped: {game.exception()!r}')
+    finally:
+        reporting.cancel()
+        report()
+        for bot, game in zip(bots, games):
+            bot.client.disconnect()
+            game.cancel()
+    return len(bots)
+
+
+def parse_color(text: str) -> Color:
+    r, g, b = (int(c) for c in text.split(','))
+    return (r, g, b)
+
+
+def bot_specs(count: int, names: typing.List[str], colors: typing.List[Color]) -> typing.List[BotSpec]:
+    """Named and coloured from the lists, cycling the colours; Bot.name_<n> once names run out."""
+    specs = []
+    for i in range(count):
+        name = names[i] if i < len(names) else f'{Bot.name}_{i + 1}'
+        color = colors[i % len(colors)] if len(colors) > 0 else Bot.color
+        specs.append(BotSpec(name, color))
+    return specs
+
+
+def split(specs: typing.List[BotSpec], groups: int) -> typing.List[typing.List[BotSpec]]:
+    """Round-robin, so groups differ by one bot at most."""
+    return [specs[i::groups] for i in range(groups) if i < len(specs)]
+
+
+def format_stats(stats: typing.Dict[str, BotStats]) -> str:
+    lines = [f'{"bot":<16}{"pid":>8}{"conn":>6}{"decisions":>11}{"dec/s":>8}{"ms/dec":>9}{"overruns":>10}{"late":>6}']
+    total_rate = 0.0
+    total_decisions = 0
+    for name in sorted(stats):
+        s = stats[name]
+        rate = s.decisions / s.seconds if s.seconds > 0 else 0.0
+        ms = 1000 * s.decide_seconds / s.decisions if s.decisions > 0 else 0.0
+        total_rate += rate
+        total_decisions += s.decisions
+        lines.append(f'{s.name:<16}{s.pid:>8}{"yes" if s.connected else "no":>6}{s.decisions:>11}'
+                     f'{rate:>8.1f}{ms:>9.2f}{s.overruns:>10}{s.late:>6}')
+    lines.append(f'{"total":<16}{"":>8}{"":>6}{total_decisions:>11}{total_rate:>8.1f}')
+    return '\n'.join(lines)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Run many bots against one server')
+    parser.add_argument('--host', default=Bot.host)
+    parser.add_argument('--port', type=int, default=Bot.port)
+    parser.add_argument('--bots', type=int, default=2, help='number of bots')
+    parser.add_argument('--names', default='', help='comma separated bot names (default THE_BOT_1, THE_BOT_2, ...)')
+    parser.add_argument('--colors', nargs='*', default=[], metavar='R,G,B', help='bot colours, cycled')
+    parser.add_argument('--brain', choices=brain.BACKENDS, default=Bot.brain_backend, help='decision engine')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--interval', type=float, default=Bot.action_interval, metavar='SECONDS', help='minimum time between actions')
+    parser.add_argument('--budget', type=float, metavar='SECONDS', help='time limit of each decision (default: none)')
+    parser.add_argument('--speculate', action='store_true', help='speculative decisions (GameAI.speculate)')
+    parser.add_argument('--map-size', type=brain.map_size, metavar='WxH', help='cave size (default: 60x35)')
+    parser.add_argument('--max-risk', type=float, metavar='P', help='native brain: danger it may risk once nothing safe is left to explore')
+    parser.add_argument('--seconds', type=float, help='stop after this long (default: until the server disconnects)')
+    parser.add_argument('--report', type=float, default=5.0, metavar='SECONDS', help='stats interval')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the bots')
+    args = parser.parse_args(argv)
+    if args.max_risk is not None and args.brain != 'native':
+        parser.error('--max-risk needs --brain native')
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    names = [n for n in args.names.split(',') if n != '']
+    specs = bot_specs(args.bots, names, [parse_color(c) for c in args.colors])
+    groups = split(specs, max(1, min(args.processes, args.bots)))
+    logging.root.info(f'{len(specs)} bots in {len(groups)} processes')
+
+    stats_queue = multiprocessing.Queue()
+    stats: typing.Dict[str, BotStats] = {}
+    with multiprocessing.Pool(len(groups), initializer=init_worker,
+                              initargs=(stats_queue, logging.getLevelName(args.log_level.upper()))) as pool:
+        result = pool.starmap_async(run_group, [
+            (group, args.host, args.port, args.brain, args.interval, args.budget, args.speculate, args.map_size, args.max_risk, args.seconds, args.report)
+            for group in groups])
+        next_report = time.monotonic() + args.report
+        try:
+            while not result.ready() or not stats_queue.empty():
+                try:
+                    s = stats_queue.get(timeout=0.2)
+                    stats[s.name] = s
+                except queue.Empty:
+                    pass
+                if time.monotonic() >= next_report and len(stats) > 0:
+                    print(format_stats(stats), flush=True)
+                    next_report += args.report
+            result.get()
+        except KeyboardInterrupt:
+            pool.terminate()
+    print(format_stats(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,18 +19,51 @@ __email__ = "abaffa@inf.puc-rio.br"
 #############################################################
 
 from Bot import Bot
+import brain
 
 if __name__ == "__main__":
+    import argparse
     import logging
     import sys
 
     LOG_FORMAT = format='[%(levelname)s] %(message)s'
 
     print('args:', sys.argv.__repr__())
-    if len(sys.argv) > 1:
-        LOG_FILE = sys.argv[1]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log_file', nargs='?')
+    parser.add_argument('--host', default=Bot.host, help='server address (e.g. 127.0.0.1 for Server/LocalServer.py)')
+    parser.add_argument('--port', type=int, default=Bot.port)
+    parser.add_argument('--brain', choices=brain.BACKENDS, default=Bot.brain_backend, help='decision engine')
+    parser.add_argument('--map', type=float, metavar='SECONDS', help='draw the cave map at most every SECONDS (always on with debug logging)')
+    parser.add_argument('--interval', type=float, default=Bot.action_interval, metavar='SECONDS', help='minimum time between actions')
+    parser.add_argument('--transport', choices=['thread', 'asyncio'], default='thread', help='socket and timer threads, or an asyncio event loop')
+    parser.add_argument('--budget', type=float, metavar='SECONDS', help='time limit of each decision, then a fallback action is sent (default: none)')
+    parser.add_argument('--speculate', action='store_true', help='work out the next decision while waiting for the server\'s replies')
+    parser.add_argument('--map-size', type=brain.map_size, metavar='WxH', help='cave size (default: 60x35, grown to fit the positions the server reports)')
+    parser.add_argument('--max-risk', type=float, metavar='P', help='native brain: once nothing safe is left to explore, explore the least dangerous cell if its pit/teleporter probability is at most P')
+    parser.add_argument('--record', metavar='FILE', help='record the session to FILE, to play it back with Replay.py')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', help='serve latency histograms at http://127.0.0.1:PORT/metrics')
+    args = parser.parse_args()
+    if args.max_risk is not None and args.brain != 'native':
+        parser.error('--max-risk needs --brain native')
+
+    if args.log_file is not None:
+        LOG_FILE = args.log_file
         logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format=LOG_FORMAT)
     else:
         logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
-    bot = Bot()
+    if args.metrics_port is not None:
+        import metrics
+        metrics.serve(args.metrics_port)
+        logging.root.info(f'Metrics at http://127.0.0.1:{args.metrics_port}/metrics')
+    if args.transport == 'asyncio':
+        import asyncio
+        from AsyncBot import AsyncBot
+        asyncio.run(AsyncBot(args.host, args.port, args.brain, args.map, args.interval, record_path=args.record,
+                                 decision_budget=args.budget, speculative=args.speculate, map_size=args.map_size,
+                                 max_risk=args.max_risk).run())
+    else:
+        bot = Bot(args.host, args.port, args.brain, args.map, args.interval, record_path=args.record,
+                  decision_budget=args.budget, speculative=args.speculate, map_size=args.map_size,
+                  max_risk=args.max_risk)
 
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""Replay.py: Plays a recorded session (Socket/SessionLog.py) back through a Bot, offline.
+
+The bytes the server sent are fed, read by read, to a ReplayClient, so they go through the
+same LineFramer, Protocol parsing, Bot handlers, DecisionScheduler and GameAI as in the
+match; what the bot sends is counted and compared with the recorded commands, but goes
+nowhere. Timers (timer1_Tick, the scheduler) run on the recorded clock: as fast as possible
+by default, or at the original pace with --paced.
+
+The server does not react to the replayed decisions, so once they differ from the recorded
+ones (a different build or brain) the bot keeps deciding on the recorded world. That is
+what makes two builds comparable: both decide on the same input.
+
+Usage (from src/):
+    python Program.py --host 127.0.0.1 --brain prolog --record game.pfs
+    python Replay.py game.pfs --brain prolog
+    python Replay.py game.pfs --brain prolog --profile
+    python Replay.py game.pfs --brain native --paced
+"""
+
+import argparse
+import heapq
+import itertools
+import logging
+import time
+import typing
+
+import brain
+from Bot import Bot
+from Socket.HandleClient import HandleClient
+from Socket.LineFramer import LineFramer
+from Socket.SessionLog import RECEIVED, SENT, Record, read_session
+
+# Commands that are actions, as opposed to requests and chat
+ACTIONS = frozenset(['w', 's', 'a', 'd', 't', 'e'])
+
+
+def action_commands(data: bytes) -> typing.List[str]:
+    return [c for c in data.decode('utf-8', 'replace').split('\n') if c in ACTIONS]
+
+
+class ReplayClient(HandleClient):
+    """HandleClient with no socket: lines come from feed() and commands are only counted."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.client_socket.close()
+        self.client_socket = None
+        self.framer = LineFramer()
+        self.actions: typing.List[str] = []
+
+    def connect(self, s: str = '', port: int = 0) -> None:
+        self.connected = True
+        self.active = True
+        self.processSocketStatusEvent()
+
+    def disconnect(self) -> None:
+        self.active = False
+        self.connected = False
+
+    def flush(self) -> None:
+        with self.send_lock:
+            if len(self.send_buffer) > 0:
+                self.actions.extend(action_commands(bytes(self.send_buffer)))
+                self.send_calls += 1
+                self.sent_bytes += len(self.send_buffer)
+            self.send_buffer.clear()
+
+    def feed(self, data: bytes) -> None:
+        """Bytes as one read from the server returned them."""
+        self.framer.feed(data)
+        for line in self.framer.lines():
+            self.processLine(line)
+
+
+class ReplayTimer():
+
+    def __init__(self, callback: typing.Callable[[], None]) -> None:
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def run(self) -> None:
+        if not self.cancelled:
+            self.callback()
+
+
+class ReplayBot(Bot):
+    """Bot on the recorded clock: `now` is the session time of the record being replayed."""
+
+    def __init__(self, brain_backend: str, action_interval: typing.Optional[float] = None, paced: bool = False,
+                 decision_budget: typing.Optional[float] = None, speculative: bool = False,
+                 map_size: typing.Optional[typing.Tuple[int, int]] = None, max_risk: typing.Optional[float] = None) -> None:
+        self.paced = paced
+        self.now = 0.0
+        self.started = time.monotonic()
+        self.timers: typing.List[typing.Tuple[float, int, ReplayTimer]] = []
+        self.order = itertools.count()
+        super().__init__(brain_backend=brain_backend, action_interval=action_interval,
+                         decision_budget=decision_budget, speculative=speculative, map_size=map_size, max_risk=max_risk)
+        self.scheduler.clock = lambda: self.now
+
+    def create_client(self) -> ReplayClient:
+        return ReplayClient()
+
+    def call_later(self, delay: float, callback: typing.Callable[[], None]) -> ReplayTimer:
+        timer = ReplayTimer(callback)
+        heapq.heappush(self.timers, (self.now + delay, next(self.order), timer))
+        return timer
+
+    def wait_until(self, t: float) -> None:
+        if self.paced:
+            delay = self.started + t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def advance(self, t: float) -> None:
+        """Run the timers due by session time t, in order, then move the clock to t."""
+        while len(self.timers) > 0 and self.timers[0][0] <= t:
+            due, _, timer = heapq.heappop(self.timers)
+            self.wait_until(due)
+            self.now = due
+            timer.run()
+        self.wait_until(t)
+        self.now = t
+
+    def play(self, records: typing.Iterable[Record]) -> 'ReplayResult':
+        result = ReplayResult()
+        self.started = time.monotonic()
+        for kind, t, payload in records:
+            result.records += 1
+            result.seconds = t
+            if kind == SENT:
+                result.recorded_actions.extend(action_commands(payload))
+                continue
+            if kind != RECEIVED:
+                continue
+            self.advance(t)
+            result.received_bytes += len(payload)
+            self.client.feed(payload)
+        # Let the last replies be decided on
+        self.advance(self.now + self.thread_interval)
+        self.running = False
+        self.scheduler.stop()
+        self.client.disconnect()
+        result.wall_seconds = time.monotonic() - self.started
+        result.decisions = self.scheduler.total_decisions
+        result.overruns = self.scheduler.total_overruns
+        result.decide_seconds = self.scheduler.total_decide_seconds
+        result.late = self.gameAi.total_late_decisions
+        result.speculations = self.gameAi.total_speculations
+        result.speculation_hits = self.gameAi.total_speculation_hits
+        result.actions = self.client.actions
+        return result
+
+
+class ReplayResult():
+
+    def __init__(self) -> None:
+        self.records = 0
+        self.seconds = 0.0
+        self.received_bytes = 0
+        self.recorded_actions: typing.List[str] = []
+        self.wall_seconds = 0.0
+        self.decisions = 0
+        self.overruns = 0
+        self.decide_seconds = 0.0
+        self.late = 0
+        self.speculations = 0
+        self.speculation_hits = 0
+        self.actions: typing.List[str] = []
+
+    def first_divergence(self) -> typing.Optional[int]:
+        """Index of the first action that differs from the recorded one, None if none does."""
+        for i, (a, b) in enumerate(zip(self.recorded_actions, self.actions)):
+            if a != b:
+                return i
+        if len(self.recorded_actions) != len(self.actions):
+            return min(len(self.recorded_actions), len(self.actions))
+        return None
+
+    def report(self) -> str:
+        n = max(self.decisions, 1)
+        divergence = self.first_divergence()
+        return '\n'.join([
+            f'session: {self.records} records, {self.seconds:.1f} s, {self.received_bytes} bytes received',
+            f'replay:  {self.wall_seconds:.2f} s ({self.seconds / max(self.wall_seconds, 1e-9):.1f}x), '
+            f'{self.decisions} decisions, {self.decisions / max(self.wall_seconds, 1e-9):.1f} dec/s, '
+            f'{1000 * self.decide_seconds / n:.2f} ms/dec, {self.overruns} overruns, {self.late} late, '
+            f'{self.speculation_hits}/{self.speculations} speculative',
+            f'actions: {len(self.recorded_actions)} recorded, {len(self.actions)} replayed, '
+            + ('identical' if divergence is None else f'first difference at action {divergence}'),
+        ])
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Replay a recorded session offline')
+    parser.add_argument('session', help='log written with Program.py --record')
+    parser.add_argument('--brain', choices=brain.BACKENDS, default=Bot.brain_backend, help='decision engine')
+    parser.add_argument('--interval', type=float, default=Bot.action_interval, metavar='SECONDS', help='minimum time between actions')
+    parser.add_argument('--budget', type=float, metavar='SECONDS', help='time limit of each decision (default: none)')
+    parser.add_argument('--speculate', action='store_true', help='speculative decisions (GameAI.speculate)')
+    parser.add_argument('--map-size', type=brain.map_size, metavar='WxH', help='cave size (default: 60x35)')
+    parser.add_argument('--max-risk', type=float, metavar='P', help='native brain: danger it may risk once nothing safe is left to explore')
+    parser.add_argument('--paced', action='store_true', help='keep the recorded timing instead of replaying as fast as possible')
+    parser.add_argument('--profile', action='store_true', help='prolog: rank the pitfall.pl predicates (PrologQuery.profile())')
+    parser.add_argument('--top', type=int, default=30, help='rows of the --profile table')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the bot')
+    args = parser.parse_args(argv)
+    if args.profile and args.brain != 'prolog':
+        parser.error('--profile needs --brain prolog')
+    if args.max_risk is not None and args.brain != 'native':
+        parser.error('--max-risk needs --brain native')
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level.upper()), format='[%(levelname)s] %(message)s')
+    bot = ReplayBot(args.brain, args.interval, args.paced, args.budget, args.speculate, args.map_size, args.max_risk)
+    records = read_session(args.session)
+    if args.profile:
+        with bot.gameAi.brain.profile() as profile:
+            result = bot.play(records)
+    else:
+        result = bot.play(records)
+    print(result.report())
+    if args.profile:
+        print(profile.table(args.top))
+    bot.gameAi.close()
+
+
+if __name__ == '__main__':
+    main()
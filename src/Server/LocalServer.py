@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+
+"""LocalServer.py: Local stand-in for the game server, used to run and benchmark bots offline.
+
+Speaks the same line protocol as atari.icad.puc-rio.br:8888 (see Socket/HandleClient.py
+for the client side and Bot.ReceiveCommand for the parser).
+
+Usage (from src/):
+    python -m Server.LocalServer --seed 42            # server tick speed
+    python -m Server.LocalServer --map cave.txt --fast # full speed
+"""
+
+import argparse
+import collections
+import logging
+import random
+import socketserver
+import threading
+import time
+import typing
+
+import Map.Cave as cave_map
+from Map.Cave import Cave, DELTAS, DIRECTIONS
+
+# Costs and rewards, as described in the assignment
+ACTION_COST = 1
+SHOOT_COST = 10
+PICK_UP_COST = 5
+PIT_COST = 1000
+KILLED_COST = 10
+KILL_REWARD = 1000
+
+INITIAL_ENERGY = 100
+SHOT_DAMAGE = 10
+
+# An enemy standing next to a player hits it once every this many ticks
+ENEMY_ATTACK_TICKS = 5
+# Ticks a dead player waits before respawning
+RESPAWN_TICKS = 10
+
+ACTIONS = ['w', 's', 'a', 'd', 't', 'e']
+# Status queries answered in order with the actions sent before them
+QUERIES = ['o', 'q']
+
+# PlayerInfo.Direction and PlayerInfo.State values used in `player` lines
+DIRECTION_ID = {'north': 1, 'east': 2, 'south': 3, 'west': 4}
+STATE_ID = {'ready': 1, 'game': 2, 'dead': 3, 'gameover': 4}
+
+
+def format_color(color: typing.Tuple[int, int, int]) -> str:
+    # Same format as the C# server, parsed by Bot.convertFromString
+    return f'Color [A=255, R={color[0]}, G={color[1]}, B={color[2]}]'
+
+
+class Enemy():
+
+    def __init__(self, name: str, x: int, y: int) -> None:
+        self.name = name
+        self.x = x
+        self.y = y
+        self.energy = INITIAL_ENERGY
+
+
+class Player():
+
+    def __init__(self, node: int, session: 'ClientSession') -> None:
+        self.node = node
+        self.session = session
+        self.name = f'player{node}'
+        self.color = (255, 255, 255)
+        self.x, self.y = -1, -1
+        self.dir = 'north'
+        self.state = 'ready'
+        self.score = 0
+        self.energy = INITIAL_ENERGY
+        self.named = False
+        self.bumped = False
+        self.dead_ticks = 0
+        self.actions: typing.Deque[str] = collections.deque()
+
+    def send(self, msg: str) -> None:
+        self.session.send(msg)
+
+
+class GameServer():
+    """Game rules and match state, shared by every connected session.
+
+    With `fast` unset, the game loop runs one server tick every `tick` seconds and
+    applies at most one queued action per player each tick, like the real server.
+    Observation and status queries sent after a pending action are answered once it
+    has been applied, so a bot always sees the outcome of its last command.
+    With `fast` set, actions are applied as soon as they arrive and each one advances
+    the simulated clock by one tick, so a match lasts a fixed number of actions
+    instead of a fixed wall-clock time.
+    """
+
+    def __init__(
+        self, cave_factory: typing.Callable[[int], Cave], tick: float = 0.1, fast: bool = False,
+        game_seconds: float = 600, ready_seconds: float = 0, gameover_seconds: float = 5,
+        rounds: int = 0, seed: typing.Optional[int] = None,
+    ) -> None:
+        self.cave_factory = cave_factory
+        self.tick = tick
+        self.fast = fast
+        self.game_seconds = game_seconds
+        self.ready_seconds = ready_seconds
+        self.gameover_seconds = gameover_seconds
+        self.rounds = rounds
+        self.rng = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.players: typing.List[Player] = []
+        self.enemies: typing.List[Enemy] = []
+        self.next_node = 1
+        self.round = 0
+        self.ticks = 0
+        self.running = True
+        self.new_round()
+
+    # Match lifecycle
+    # ---------------
+
+    def new_round(self) -> None:
+        self.round += 1
+        self.cave = self.cave_factory(self.round)
+        self.enemies = []
+        for i, (x, y) in enumerate(self.cave.cells(cave_map.ENEMY)):
+            self.cave.set(x, y, cave_map.EMPTY)
+            self.enemies.append(Enemy(f'enemy{i + 1}', x, y))
+        self.time = 0.0
+        self.status = 'Ready'
+        for p in self.players:
+            p.state = 'ready'
+            p.score = 0
+        logging.root.info(f'Round {self.round}: {self.cave.width}x{self.cave.height} cave')
+        if self.ready_seconds <= 0:
+            self.start_game()
+
+    def start_game(self) -> None:
+        self.status = 'Game'
+        self.time = 0.0
+        for p in self.players:
+            self.spawn(p)
+        self.broadcast('notification;Game started')
+
+    def end_game(self) -> None:
+        self.status = 'Gameover'
+        self.time = 0.0
+        for p in self.players:
+            p.state = 'gameover'
+            self.drop_actions(p)
+        self.broadcast('notification;Game over')
+
+    def step(self) -> None:
+        """Advance the simulated clock by one server tick."""
+        self.ticks += 1
+        self.time += self.tick
+
+        if self.status == 'Ready':
+            if self.time >= self.ready_seconds:
+                self.start_game()
+
+        elif self.status == 'Game':
+            if not self.fast:
+                for p in self.players:
+                    if len(p.actions) > 0:
+                        self.apply_action(p, p.actions.popleft())
+                    while len(p.actions) > 0 and p.actions[0] in QUERIES:
+                        self.answer_query(p, p.actions.popleft())
+            self.update_players()
+            if self.time >= self.game_seconds:
+                self.end_game()
+
+        elif self.status == 'Gameover':
+            if self.time >= self.gameover_seconds and (self.rounds == 0 or self.round < self.rounds):
+                self.new_round()
+
+    def run(self) -> None:
+        """Paced game loop, one step every `tick` seconds."""
+        next_tick = time.monotonic()
+        while self.running:
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self.lock:
+                self.step()
+
+    # Players
+    # -------
+
+    def join(self, session: 'ClientSession') -> Player:
+        with self.lock:
+            p = Player(self.next_node, session)
+            self.next_node += 1
+            self.players.append(p)
+            if self.status == 'Game':
+                self.spawn(p)
+            return p
+
+    def leave(self, p: Player) -> None:
+        with self.lock:
+            if p in self.players:
+                self.players.remove(p)
+                self.broadcast(f'goodbye;{p.name}')
+
+    def spawn(self, p: Player) -> None:
+        p.x, p.y = self.random_free_cell()
+        p.dir = self.rng.choice(DIRECTIONS)
+        p.state = 'game'
+        p.energy = INITIAL_ENERGY
+        p.bumped = False
+        p.dead_ticks = 0
+
+    def random_free_cell(self) -> typing.Tuple[int, int]:
+        while True:
+            x = self.rng.randrange(self.cave.width)
+            y = self.rng.randrange(self.cave.height)
+            if self.cave.get(x, y) == cave_map.EMPTY and self.occupant(x, y) is None:
+                return x, y
+
+    def occupant(self, x: int, y: int) -> typing.Union[Player, Enemy, None]:
+        for e in self.enemies:
+            if e.x == x and e.y == y:
+                return e
+        for p in self.players:
+            if p.state == 'game' and p.x == x and p.y == y:
+                return p
+        return None
+
+    def kill(self, p: Player, cost: int) -> None:
+        p.state = 'dead'
+        p.energy = 0
+        p.score -= cost
+        p.dead_ticks = RESPAWN_TICKS
+        self.drop_actions(p)
+
+    def damage(self, target: typing.Union[Player, Enemy], attacker_name: str, attacker: typing.Optional[Player]) -> None:
+        target.energy -= SHOT_DAMAGE
+        if isinstance(target, Player):
+            target.send(f'd;{attacker_name}')
+        if attacker is not None:
+            attacker.send(f'h;{target.name}')
+        if target.energy > 0:
+            return
+        if isinstance(target, Player):
+            self.kill(target, KILLED_COST)
+        else:
+            self.enemies.remove(target)
+        if attacker is not None:
+            attacker.score += KILL_REWARD
+            self.broadcast(f'notification;{attacker.name} killed {target.name}')
+
+    def update_players(self) -> None:
+        for p in self.players:
+            if p.state == 'dead':
+                p.dead_ticks -= 1
+                if p.dead_ticks <= 0:
+                    self.spawn(p)
+        if self.ticks % ENEMY_ATTACK_TICKS != 0:
+            return
+        for e in self.enemies:
+            for p in self.players:
+                if p.state == 'game' and abs(p.x - e.x) + abs(p.y - e.y) == 1:
+                    self.damage(p, e.name, None)
+
+    # Actions
+    # -------
+
+    def apply_action(self, p: Player, action: str) -> None:
+        if p.state != 'game':
+            return
+        # Impact is only felt right after the move that hit the wall
+        p.bumped = False
+        p.score -= ACTION_COST
+        if action == 'w':
+            self.move(p, DELTAS[p.dir])
+        elif action == 's':
+            dx, dy = DELTAS[p.dir]
+            self.move(p, (-dx, -dy))
+        elif action == 'a':
+            p.dir = DIRECTIONS[(DIRECTIONS.index(p.dir) - 1) % 4]
+        elif action == 'd':
+            p.dir = DIRECTIONS[(DIRECTIONS.index(p.dir) + 1) % 4]
+        elif action == 't':
+            self.pick_up(p)
+        elif action == 'e':
+            self.shoot(p)
+
+    def move(self, p: Player, delta: typing.Tuple[int, int]) -> None:
+        x, y = p.x + delta[0], p.y + delta[1]
+        if self.cave.is_blocked(x, y) or self.occupant(x, y) is not None:
+            p.bumped = True
+            return
+        p.bumped = False
+        p.x, p.y = x, y
+        cell = self.cave.get(x, y)
+        if cell == cave_map.PIT:
+            self.kill(p, PIT_COST)
+        elif cell == cave_map.TELEPORTER:
+            p.x, p.y = self.random_free_cell()
+
+    def pick_up(self, p: Player) -> None:
+        p.score -= PICK_UP_COST - ACTION_COST
+        cell = self.cave.get(p.x, p.y)
+        if cell in cave_map.GOLD_VALUE:
+            p.score += cave_map.GOLD_VALUE[cell]
+        elif cell in cave_map.POWER_UP_VALUE:
+            p.energy = min(INITIAL_ENERGY, p.energy + cave_map.POWER_UP_VALUE[cell])
+        else:
+            return
+        self.cave.set(p.x, p.y, cave_map.EMPTY)
+
+    def target_ahead(self, p: Player) -> typing.Tuple[typing.Union[Player, Enemy, None], int]:
+        dx, dy = DELTAS[p.dir]
+        x, y, distance = p.x + dx, p.y + dy, 1
+        while not self.cave.is_blocked(x, y):
+            target = self.occupant(x, y)
+            if target is not None:
+                return target, distance
+            x, y, distance = x + dx, y + dy, distance + 1
+        return None, 0
+
+    def shoot(self, p: Player) -> None:
+        p.score -= SHOOT_COST - ACTION_COST
+        target, _ = self.target_ahead(p)
+        if target is not None:
+            self.damage(target, p.name, p)
+
+    # Replies
+    # -------
+
+    def observations(self, p: Player) -> typing.List[str]:
+        o: typing.List[str] = []
+        if p.state != 'game':
+            return o
+        if p.bumped:
+            # Reported once, so a bot that does not act after the impact is not told again
+            o.append('blocked')
+            p.bumped = False
+        around = list(self.cave.neighbours(p.x, p.y))
+        if any(self.occupant(x, y) is not None for x, y in around):
+            o.append('steps')
+        if any(self.cave.get(x, y) == cave_map.PIT for x, y in around):
+            o.append('breeze')
+        if any(self.cave.get(x, y) == cave_map.TELEPORTER for x, y in around):
+            o.append('flash')
+        cell = self.cave.get(p.x, p.y)
+        if cell in cave_map.GOLD_VALUE:
+            o.append('redLight')
+        elif cell in cave_map.POWER_UP_VALUE:
+            o.append('blueLight')
+        target, distance = self.target_ahead(p)
+        if target is not None:
+            o.append(f'enemy#{distance}')
+        return o
+
+    def handle_command(self, p: Player, line: str) -> None:
+        cmd = line.split(';')
+        with self.lock:
+            if cmd[0] in ACTIONS:
+                if self.status != 'Game':
+                    return
+                if self.fast:
+                    self.apply_action(p, cmd[0])
+                    self.step()
+                else:
+                    p.actions.append(cmd[0])
+
+            elif cmd[0] in QUERIES:
+                if len(p.actions) > 0:
+                    p.actions.append(cmd[0])
+                else:
+                    self.answer_query(p, cmd[0])
+
+            elif cmd[0] == 'g':
+                if self.fast and self.status != 'Game':
+                    self.step()
+                p.send(f'g;{self.status};{int(self.time)}')
+
+            elif cmd[0] == 'p':
+                for o in self.players:
+                    p.send(f'player;{o.node};{o.name};{o.x};{o.y};{DIRECTION_ID[o.dir]};{STATE_ID[o.state]};{format_color(o.color)}')
+
+            elif cmd[0] == 'u':
+                scores = [
+                    f'{o.name}#connected#{o.score}#{o.energy}#{format_color(o.color)}'
+                    for o in self.players
+                ]
+                p.send(';'.join(['u'] + scores))
+
+            elif cmd[0] == 'name' and len(cmd) > 1:
+                old, p.name = p.name, cmd[1]
+                if p.named:
+                    self.broadcast(f'changename;{old};{p.name}')
+                else:
+                    p.named = True
+                    self.broadcast(f'hello;{p.name}')
+
+            elif cmd[0] == 'color' and len(cmd) > 3:
+                p.color = (int(cmd[1]), int(cmd[2]), int(cmd[3]))
+
+            elif cmd[0] == 'say' and len(cmd) > 1:
+                self.broadcast(f'notification;{p.name}: {cmd[1]}')
+
+    def drop_actions(self, p: Player) -> None:
+        """Forget the pending actions, still answering the queries queued behind them."""
+        queries = [a for a in p.actions if a in QUERIES]
+        p.actions.clear()
+        for query in queries:
+            self.answer_query(p, query)
+
+    def answer_query(self, p: Player, query: str) -> None:
+        if query == 'o':
+            p.send('o;' + ','.join(self.observations(p)))
+        else:
+            p.send(f's;{p.x};{p.y};{p.dir};{p.state};{p.score};{p.energy}')
+
+    def broadcast(self, msg: str) -> None:
+        for p in self.players:
+            p.send(msg)
+
+
+class ClientSession(socketserver.StreamRequestHandler):
+
+    def setup(self) -> None:
+        super().setup()
+        self.write_lock = threading.Lock()
+
+    def handle(self) -> None:
+        game: GameServer = self.server.game
+        player = game.join(self)
+        logging.root.info(f'{self.client_address} connected as node {player.node}')
+        try:
+            for raw in self.rfile:
+                line = raw.decode('utf-8', errors='replace').strip('\r\n\0')
+                if line == 'quit':
+                    break
+                if len(line) > 0:
+                    game.handle_command(player, line)
+        except OSError as ex:
+            logging.root.debug(ex)
+        finally:
+            game.leave(player)
+            logging.root.info(f'{self.client_address} disconnected')
+
+    def send(self, msg: str) -> None:
+        try:
+            with self.write_lock:
+                self.wfile.write((msg + '\n').encode('utf-8'))
+        except OSError as ex:
+            logging.root.debug(ex)
+
+
+class LocalServer(socketserver.ThreadingTCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: typing.Tuple[str, int], game: GameServer) -> None:
+        super().__init__(address, ClientSession)
+        self.game = game
+
+    def serve(self) -> None:
+        if not self.game.fast:
+            threading.Thread(target=self.game.run, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self.game.running = False
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Local stand-in game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--map', help='cave map file (see Map/Cave.py for the cell legend)')
+    parser.add_argument('--seed', type=int, help='seed for generated caves and spawns')
+    parser.add_argument('--enemies', type=int, default=0, help='enemies in generated caves')
+    parser.add_argument('--tick', type=float, default=0.1, help='server tick, in seconds')
+    parser.add_argument('--fast', action='store_true', help='apply commands as soon as they arrive')
+    parser.add_argument('--game-seconds', type=float, default=600)
+    parser.add_argument('--ready-seconds', type=float, default=0)
+    parser.add_argument('--gameover-seconds', type=float, default=5)
+    parser.add_argument('--rounds', type=int, default=0, help='number of matches to play, 0 for no limit')
+    args = parser.parse_args(argv)
+
+    if args.map is not None:
+        cave = Cave.load(args.map)
+        cave_factory = lambda _: cave.copy()
+    else:
+        seed = args.seed
+        cave_factory = lambda round: Cave.generate(
+            seed=None if seed is None else seed + round, enemies=args.enemies)
+
+    game = GameServer(
+        cave_factory, tick=args.tick, fast=args.fast, game_seconds=args.game_seconds,
+        ready_seconds=args.ready_seconds, gameover_seconds=args.gameover_seconds,
+        rounds=args.rounds, seed=args.seed)
+    server = LocalServer((args.host, args.port), game)
+    logging.root.info(f'Listening on {args.host}:{args.port}')
+    server.serve()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    main()
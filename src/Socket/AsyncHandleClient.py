@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""AsyncHandleClient.py: HandleClient on an asyncio event loop.
+
+Same handlers and send* commands as HandleClient, but no thread of its own: lines are read
+with StreamReader.readline by a reader task, and commands are queued and written by a single
+writer task, so sendMsg never blocks. Any number of clients can share one event loop.
+
+The writer takes everything queued by the time it runs, so the commands of one tick (one
+callback on the loop) go out in a single write; batch() needs no flush here.
+"""
+
+import asyncio
+import logging
+import socket
+import typing
+
+from Socket.HandleClient import HandleClient
+import metrics
+
+
+# <summary>
+# TCP Client Class, asyncio version
+# </summary>
+class AsyncHandleClient(HandleClient):
+
+    loop: typing.Optional[asyncio.AbstractEventLoop] = None
+    reader: typing.Optional[asyncio.StreamReader] = None
+    writer: typing.Optional[asyncio.StreamWriter] = None
+
+    def __init__(self):
+        # No socket here: asyncio.open_connection creates it in connect
+        super().__init__()
+        self.client_socket.close()
+        self.client_socket = None
+        self.outbox: typing.Optional[asyncio.Queue] = None
+        self.tasks: typing.List[asyncio.Task] = []
+        self.closed: typing.Optional[asyncio.Event] = None
+
+
+    # <summary>
+    # Connects to a url or ip address, from a coroutine on the loop that will run the client
+    # </summary>
+    # <param name="s">url or ip address</param>
+    # <param name="port">server port</param>
+    async def connect(self, s: str, port: int = 8888):
+
+        if not self.connected:
+
+            self.loop = asyncio.get_running_loop()
+            self.outbox = asyncio.Queue()
+            self.closed = asyncio.Event()
+            self.reader, self.writer = await asyncio.open_connection(s, port)
+            sock = self.writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            self.connected = True
+            self.active = True
+            self.KeepAlive()
+
+            self.tasks = [self.loop.create_task(self.writeLoop()),
+                          self.loop.create_task(self.readLoop())]
+
+
+    # <summary>
+    # Disconnects socket
+    # </summary>
+    def disconnect(self):
+
+        if self.connected:
+            for task in self.tasks:
+                task.cancel()
+            self.writer.close()
+
+        self.KeepAlive()
+        self.active = False
+        self.connected = False
+        self.stop_recording()
+        if self.closed is not None:
+            self.closed.set()
+
+
+    # <summary>
+    # Nothing to do, the writer task coalesces whatever is queued
+    # </summary>
+    def flush(self):
+        pass
+
+
+    # <summary>
+    # Wait until the connection is closed, by either side
+    # </summary>
+    async def wait_closed(self):
+        await self.closed.wait()
+
+
+    # <summary>
+    # Queue a raw command to the server, from any thread
+    # </summary>
+    # <param name="serverResponse">raw command</param>
+    def sendMsg(self, serverResponse: str):
+
+        if not self.connected:
+            return
+        send_cmd = (serverResponse + "\n").encode("utf-8")
+        self.sent_commands += 1
+        try:
+            if asyncio.get_running_loop() is self.loop:
+                self.outbox.put_nowait(send_cmd)
+                return
+        except RuntimeError:
+            pass
+        self.loop.call_soon_threadsafe(self.outbox.put_nowait, send_cmd)
+
+
+    async def writeLoop(self):
+
+        try:
+            while True:
+                chunks = [await self.outbox.get()]
+                while not self.outbox.empty():
+                    chunks.append(self.outbox.get_nowait())
+                if metrics.enabled:
+                    metrics.SEND_BACKLOG.observe(len(chunks))
+                send_cmd = b''.join(chunks)
+                if self.recorder is not None:
+                    self.recorder.sent(send_cmd)
+                self.writer.write(send_cmd)
+                self.send_calls += 1
+                self.sent_bytes += len(send_cmd)
+                await self.writer.drain()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logging.root.debug(ex)
+            self.lost()
+
+
+    async def readLoop(self):
+
+        self.processSocketStatusEvent()
+
+        try:
+            while self.active:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                if self.recorder is not None:
+                    self.recorder.received(line)
+                self.processLine(line.decode('utf-8'))
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logging.root.debug(ex)
+        self.lost()
+
+
+    # <summary>
+    # Connection closed by the server or broken: report it and stop both tasks
+    # </summary>
+    def lost(self):
+
+        if not self.connected:
+            return
+        self.connected = False
+        self.KeepAlive()
+        for task in self.tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        self.writer.close()
+        self.stop_recording()
+        self.closed.set()
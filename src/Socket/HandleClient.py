@@ -18,6 +18,7 @@ __version__ = "1.0.0"
 __email__ = "abaffa@inf.puc-rio.br"
 #############################################################
 
+import contextlib
 import socket
 import sys
 #from multiprocessing import Process
@@ -26,6 +27,10 @@ import time
 import typing
 import logging
 
+from Socket.LineFramer import LineFramer
+from Socket.SessionLog import SessionRecorder
+import metrics
+
 CommandHandler = typing.Callable[[str], None]
 StatusChangeHandler = typing.Callable[[], None]
 
@@ -65,23 +70,38 @@ class HandleClient():
 
     def __init__(self): 
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Handlers belong to this connection, so several clients can live in one process
+        self.__cmd_event_handlers = []
+        self.__chg_event_handlers = []
+
+        # Commands sent inside batch() wait here and go out in one write
+        self.send_buffer = bytearray()
+        self.send_lock = threading.Lock()
+        self.batch_depth = threading.local()
+        self.reset_send_stats()
+
+        # Session log being written, see record()
+        self.recorder: typing.Optional[SessionRecorder] = None
 
     def append_cmd_handler(self, cmd_handler: CommandHandler):
-        HandleClient.__cmd_event_handlers.append(cmd_handler)
+        self.__cmd_event_handlers.append(cmd_handler)
 
     def append_chg_handler(self, chg_handler: StatusChangeHandler):
-        HandleClient.__chg_event_handlers.append(chg_handler)
+        self.__chg_event_handlers.append(chg_handler)
 
 
     # <summary>
     # Connects socket to a url or ip address
     # </summary>
     # <param name="s">url or ip address</param>
-    def connect(self, s: str):
+    # <param name="port">server port</param>
+    def connect(self, s: str, port: int = 8888):
     
         if not self.connected:
         
-            server_address = (s, 8888)
+            server_address = (s, port)
+            # Commands are small and already batched, don't let Nagle hold them back
+            self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.client_socket.connect(server_address)
             
             self.connected = True
@@ -104,6 +124,22 @@ class HandleClient():
         self.KeepAlive()
         self.active = False
         self.connected = False
+        self.stop_recording()
+
+
+    # <summary>
+    # Log everything received and sent from now on (Socket/SessionLog.py), for Replay.py
+    # </summary>
+    # <param name="path">new log file</param>
+    def record(self, path: str):
+        self.stop_recording()
+        self.recorder = SessionRecorder(path)
+
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
 
 
     # <summary>
@@ -217,17 +253,70 @@ class HandleClient():
     # <param name="serverResponse">raw command</param>
     def sendMsg(self, serverResponse: str):
 
+        if self.connected:
+            send_cmd = serverResponse + "\n"
+            send_cmd = send_cmd.encode("utf-8")
+            with self.send_lock:
+                self.send_buffer += send_cmd
+                self.sent_commands += 1
+
+            if getattr(self.batch_depth, 'value', 0) == 0:
+                self.flush()
+
+    # <summary>
+    # Write all buffered commands at once
+    # </summary>
+    def flush(self):
+
         try:
-        
-            if self.connected:
-                send_cmd = serverResponse + "\n"
-                send_cmd = send_cmd.encode("utf-8")
-                self.client_socket.send(send_cmd)
+
+            with self.send_lock:
+                if len(self.send_buffer) > 0 and self.connected:
+                    if metrics.enabled:
+                        metrics.SEND_BACKLOG.observe(self.send_buffer.count(b'\n'))
+                    # Read once, stop_recording() may run on another thread
+                    recorder = self.recorder
+                    if recorder is not None:
+                        recorder.sent(self.send_buffer)
+                    self.client_socket.sendall(self.send_buffer)
+                    self.send_calls += 1
+                    self.sent_bytes += len(self.send_buffer)
+                self.send_buffer.clear()
 
         except Exception as ex:
             logging.root.debug(ex)
             self.KeepAlive()
 
+    # <summary>
+    # Hold the commands sent in a with block (e.g. one tick) and flush them together at the end
+    # </summary>
+    @contextlib.contextmanager
+    def batch(self):
+
+        depth = getattr(self.batch_depth, 'value', 0)
+        self.batch_depth.value = depth + 1
+        try:
+            yield self
+        finally:
+            self.batch_depth.value = depth
+            if depth == 0:
+                self.batches += 1
+                self.flush()
+
+    def reset_send_stats(self):
+        self.batches = 0
+        self.sent_commands = 0
+        self.send_calls = 0
+        self.sent_bytes = 0
+
+    # <summary>
+    # Commands, writes and bytes per batch since reset_send_stats()
+    # </summary>
+    def send_report(self) -> str:
+        n = max(self.batches, 1)
+        return (f'{self.sent_commands / n:.1f} commands, {self.send_calls / n:.2f} writes, '
+                f'{self.sent_bytes / n:.1f} bytes per tick')
+
     # <summary>
     # Keep socket alive - verify current status
     # </summary>
@@ -248,7 +337,7 @@ class HandleClient():
         #if (handler != null)
         #    EventArgs e = new EventArgs();
         #    handler(this, e);
-        for eventhandler in HandleClient.__chg_event_handlers: 
+        for eventhandler in self.__chg_event_handlers: 
             eventhandler()
 
     
@@ -272,7 +361,7 @@ class HandleClient():
                     # <summary>
                     # Command Event Arguments - helps sending received messages from socket to other classes
                     # </summary>
-                    for eventhandler in HandleClient.__cmd_event_handlers: 
+                    for eventhandler in self.__cmd_event_handlers: 
                         eventhandler(cmd)
 
             except Exception as ex: # (Exception ex)
@@ -289,33 +378,52 @@ class HandleClient():
             command = data[:index]
             data = data[(index+1):]
             
-            command = command.strip('\0').strip('\r').strip('\n')
-
-            if command.find(chr(1)) == -1 or command.find(chr(3)) == -1:
-                if len(command) > 0:
-                    self.processCommand(command)
+            self.processLine(command)
 
             index = data.find('\n')
 
 
         return data
+
+
+    # <summary>
+    # Process one line received from the server
+    # </summary>
+    # <param name="command">line, with or without its line break</param>
+    def processLine(self, command: str):
+        command = command.strip('\0').strip('\r').strip('\n')
+
+        if command.find(chr(1)) == -1 or command.find(chr(3)) == -1:
+            if len(command) > 0:
+                self.processCommand(command)
     
     
     def doLoop(self):
 
-        offset = ""
+        # Lines are cut and decoded in place, see LineFramer (ProcessBuffer did it on strings)
+        framer = LineFramer()
         self.processSocketStatusEvent()
 
         while (self.active):
-        
-            receiveBufferSize = 1024
 
             if self.connected:
 
                 try:
-                    recv_str = self.client_socket.recv(receiveBufferSize)
-                    data = offset + recv_str.decode('utf-8')
-                    offset = self.ProcessBuffer(data)
+                    n = framer.recv_from(self.client_socket)
+                    if n == 0:
+                        self.connected = False
+                        self.KeepAlive()
+                        self.stop_recording()
+                        break
+                    recorder = self.recorder
+                    if recorder is not None:
+                        with framer.view[framer.end - n:framer.end] as data:
+                            recorder.received(data)
+                    lines = framer.lines()
+                    if metrics.enabled:
+                        metrics.RECEIVE_BACKLOG.observe(len(lines))
+                    for line in lines:
+                        self.processLine(line)
 
                 except Exception as ex: # (Exception ex)
                     logging.root.debug(ex)
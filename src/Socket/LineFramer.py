@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""LineFramer.py: Splits the server's byte stream into lines without copying it around.
+
+HandleClient used to decode every chunk, prepend the leftover of the previous one and cut
+the string after each line, copying the rest of the data once per line. A LineFramer
+receives into one reusable bytearray (socket.recv_into), finds line breaks in place and
+decodes complete lines once, so a line split across reads (even in the middle of a
+UTF-8 character) is only decoded when it is whole.
+"""
+
+import socket
+import typing
+
+
+class LineFramer():
+
+    def __init__(self, size: int = 65536) -> None:
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        # Unread data is buffer[start:end]
+        self.start = 0
+        self.end = 0
+
+    def space(self) -> memoryview:
+        """Free part of the buffer, compacting or growing it if there is none left.
+
+        Release the view before asking again, the buffer cannot grow while it is exported.
+        """
+        if self.end == len(self.buffer):
+            if self.start > 0:
+                pending = self.end - self.start
+                self.view[:pending] = self.view[self.start:self.end]
+                self.start, self.end = 0, pending
+            else:
+                # A single line longer than the buffer
+                self.view.release()
+                self.buffer.extend(bytes(len(self.buffer)))
+                self.view = memoryview(self.buffer)
+        return self.view[self.end:]
+
+    def recv_from(self, sock: socket.socket) -> int:
+        """Receive straight into the buffer. Returns the number of bytes, 0 once closed."""
+        with self.space() as space:
+            n = sock.recv_into(space)
+        self.end += n
+        return n
+
+    def feed(self, data: bytes) -> None:
+        """Add data received some other way."""
+        data = memoryview(data)
+        while len(data) > 0:
+            with self.space() as space:
+                n = min(len(space), len(data))
+                space[:n] = data[:n]
+            self.end += n
+            data = data[n:]
+
+    def lines(self) -> typing.List[str]:
+        """Complete lines received so far, without their line breaks.
+
+        Everything up to the last line break is decoded in one go and split; the partial
+        line after it stays in the buffer.
+        """
+        last = self.buffer.rfind(b'\n', self.start, self.end)
+        if last < 0:
+            return []
+        text = str(self.view[self.start:last], 'utf-8', 'replace')
+        self.start = last + 1
+        if self.start == self.end:
+            self.start = self.end = 0
+        return text.split('\n')
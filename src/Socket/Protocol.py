@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""Protocol.py: Server lines parsed once into small typed messages.
+
+HandleClient hands every line over already split on ';'. PARSERS maps the first field
+to the function that turns the rest into one of the message records below (all with
+__slots__), and a Dispatcher calls the handlers registered for that message type.
+Lines that are malformed or of an unknown type give no message at all.
+"""
+
+import logging
+import typing
+
+
+class Status():
+    """s;x;y;dir;state;score;energy"""
+    __slots__ = ('x', 'y', 'dir', 'state', 'score', 'energy')
+
+    def __init__(self, x: int, y: int, dir: str, state: str, score: int, energy: int) -> None:
+        self.x = x
+        self.y = y
+        self.dir = dir
+        self.state = state
+        self.score = score
+        self.energy = energy
+
+
+class Observation():
+    """o;obs1,obs2,... (empty when nothing was observed)"""
+    __slots__ = ('items',)
+
+    def __init__(self, items: typing.List[str]) -> None:
+        self.items = items
+
+
+class Player():
+    """player;node;name;x;y;dir;state;color"""
+    __slots__ = ('node', 'name', 'x', 'y', 'dir', 'state', 'color')
+
+    def __init__(self, node: int, name: str, x: int, y: int, dir: int, state: int,
+                 color: typing.Tuple[int, int, int]) -> None:
+        self.node = node
+        self.name = name
+        self.x = x
+        self.y = y
+        self.dir = dir
+        self.state = state
+        self.color = color
+
+
+class GameStatus():
+    """g;status;time"""
+    __slots__ = ('status', 'time')
+
+    def __init__(self, status: str, time: int) -> None:
+        self.status = status
+        self.time = time
+
+
+class ScoreEntry():
+    """name#connected#score#energy[#color], one per player on a scoreboard line"""
+    __slots__ = ('name', 'connected', 'score', 'energy', 'color')
+
+    def __init__(self, name: str, connected: bool, score: int, energy: int,
+                 color: typing.Tuple[int, int, int]) -> None:
+        self.name = name
+        self.connected = connected
+        self.score = score
+        self.energy = energy
+        self.color = color
+
+
+class Scoreboard():
+    """u;entry;entry;..."""
+    __slots__ = ('entries',)
+
+    def __init__(self, entries: typing.List[ScoreEntry]) -> None:
+        self.entries = entries
+
+
+class Notification():
+    """notification;text"""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class Hello():
+    """hello;name"""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class Goodbye():
+    """goodbye;name"""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class ChangeName():
+    """changename;old;new"""
+    __slots__ = ('old', 'new')
+
+    def __init__(self, old: str, new: str) -> None:
+        self.old = old
+        self.new = new
+
+
+class Hit():
+    """h;target: our shot hit target"""
+    __slots__ = ('target',)
+
+    def __init__(self, target: str) -> None:
+        self.target = target
+
+
+class Damage():
+    """d;shooter: shooter hit us"""
+    __slots__ = ('shooter',)
+
+    def __init__(self, shooter: str) -> None:
+        self.shooter = shooter
+
+
+Message = typing.Union[Status, Observation, Player, GameStatus, Scoreboard, Notification,
+                       Hello, Goodbye, ChangeName, Hit, Damage]
+
+_colors: typing.Dict[str, typing.Tuple[int, int, int]] = {}
+
+
+def parse_color(c: str) -> typing.Tuple[int, int, int]:
+    """'Color [A=255, R=1, G=2, B=3]' -> (1, 2, 3). Players keep their colour, so parses are cached."""
+    color = _colors.get(c)
+    if color is None:
+        p = c.replace('[', '').replace(']', '').split(',')
+        color = (int(p[1][p[1].find('=') + 1:]),
+                 int(p[2][p[2].find('=') + 1:]),
+                 int(p[3][p[3].find('=') + 1:]))
+        if len(_colors) < 1024:
+            _colors[c] = color
+    return color
+
+
+def parse_status(cmd: typing.List[str]) -> typing.Optional[Status]:
+    if len(cmd) < 7:
+        return None
+    return Status(int(cmd[1]), int(cmd[2]), cmd[3], cmd[4], int(cmd[5]), int(cmd[6]))
+
+
+def parse_observation(cmd: typing.List[str]) -> Observation:
+    if len(cmd) <= 1 or cmd[1].strip() == '':
+        return Observation([])
+    return Observation(cmd[1].split(','))
+
+
+def parse_player(cmd: typing.List[str]) -> typing.Optional[Player]:
+    if len(cmd) != 8:
+        return None
+    return Player(int(cmd[1]), cmd[2], int(cmd[3]), int(cmd[4]), int(cmd[5]), int(cmd[6]), parse_color(cmd[7]))
+
+
+def parse_game_status(cmd: typing.List[str]) -> typing.Optional[GameStatus]:
+    if len(cmd) != 3:
+        return None
+    return GameStatus(cmd[1], int(cmd[2]))
+
+
+def parse_scoreboard(cmd: typing.List[str]) -> typing.Optional[Scoreboard]:
+    if len(cmd) <= 1:
+        return None
+    entries = []
+    for i in range(1, len(cmd)):
+        a = cmd[i].split('#')
+        if len(a) == 4:
+            entries.append(ScoreEntry(a[0], a[1] == 'connected', int(a[2]), int(a[3]), (0, 0, 0)))
+        elif len(a) == 5:
+            entries.append(ScoreEntry(a[0], a[1] == 'connected', int(a[2]), int(a[3]), parse_color(a[4])))
+    return Scoreboard(entries)
+
+
+def one_field(message: typing.Callable[[str], Message]) -> typing.Callable[[typing.List[str]], typing.Optional[Message]]:
+    """Parser for the 'type;value' lines."""
+    def parse(cmd: typing.List[str]) -> typing.Optional[Message]:
+        return message(cmd[1]) if len(cmd) > 1 else None
+    return parse
+
+
+def parse_changename(cmd: typing.List[str]) -> typing.Optional[ChangeName]:
+    if len(cmd) < 3:
+        return None
+    return ChangeName(cmd[1], cmd[2])
+
+
+PARSERS: typing.Dict[str, typing.Callable[[typing.List[str]], typing.Optional[Message]]] = {
+    's': parse_status,
+    'o': parse_observation,
+    'player': parse_player,
+    'g': parse_game_status,
+    'u': parse_scoreboard,
+    'notification': one_field(Notification),
+    'hello': one_field(Hello),
+    'goodbye': one_field(Goodbye),
+    'changename': parse_changename,
+    'h': one_field(Hit),
+    'd': one_field(Damage),
+}
+
+
+def parse(cmd: typing.List[str]) -> typing.Optional[Message]:
+    """Message for a line split on ';', None if it is unknown or malformed."""
+    parser = PARSERS.get(cmd[0]) if len(cmd) > 0 else None
+    if parser is None:
+        return None
+    try:
+        return parser(cmd)
+    except (ValueError, IndexError) as ex:
+        logging.root.debug(f'Bad {cmd[0]} line: {ex}')
+        return None
+
+
+class Dispatcher():
+    """Handlers by message type. Use dispatch as a HandleClient command handler."""
+
+    def __init__(self) -> None:
+        self.handlers: typing.Dict[type, typing.List[typing.Callable[[typing.Any], None]]] = {}
+
+    def register(self, message_type: type, handler: typing.Callable[[typing.Any], None]) -> None:
+        self.handlers.setdefault(message_type, []).append(handler)
+
+    def dispatch(self, cmd: typing.List[str]) -> None:
+        message = parse(cmd)
+        if message is None:
+            return
+        for handler in self.handlers.get(type(message), ()):
+            try:
+                handler(message)
+            except Exception as ex:
+                logging.root.debug(ex)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""SessionLog.py: Compact binary log of a server session, for replaying it offline.
+
+A log is MAGIC followed by records appended as they happen, each a 9 byte header
+(RECORD: kind, microseconds since the previous record, payload length) and the payload:
+the bytes as received from the server (RECEIVED, one record per read) or the commands
+as written to it (SENT, one record per write). Timestamps come from time.monotonic_ns.
+The file is flushed at least every FLUSH_SECONDS, so a bot that gets killed loses at most
+that much; a record cut short ends the log.
+
+    recorder = SessionRecorder('game.pfs')   # or HandleClient.record('game.pfs')
+    for kind, seconds, payload in read_session('game.pfs'): ...
+"""
+
+import struct
+import threading
+import time
+import typing
+
+MAGIC = b'PFSESS1\n'
+RECORD = struct.Struct('<BII')
+
+RECEIVED = 0
+SENT = 1
+
+FLUSH_SECONDS = 1.0
+
+Record = typing.Tuple[int, float, bytes]
+
+
+class SessionRecorder():
+    """Appends the records of one session to a new file. Safe to use from several threads."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.lock = threading.Lock()
+        self.last_ns = time.monotonic_ns()
+        self.flushed_ns = self.last_ns
+
+    def write(self, kind: int, data: typing.Union[bytes, bytearray, memoryview]) -> None:
+        with self.lock:
+            if self.file is None:
+                return
+            now = time.monotonic_ns()
+            # Deltas over 71 minutes (a stalled connection) are clamped
+            delta = min((now - self.last_ns) // 1000, 0xFFFFFFFF)
+            self.last_ns = now
+            self.file.write(RECORD.pack(kind, delta, len(data)))
+            self.file.write(data)
+            if now - self.flushed_ns >= FLUSH_SECONDS * 1e9:
+                self.file.flush()
+                self.flushed_ns = now
+
+    def received(self, data: typing.Union[bytes, bytearray, memoryview]) -> None:
+        self.write(RECEIVED, data)
+
+    def sent(self, data: typing.Union[bytes, bytearray, memoryview]) -> None:
+        self.write(SENT, data)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_session(path: str) -> typing.Iterator[Record]:
+    """(kind, seconds since the first record, payload) of every record in the log."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a session log')
+        seconds = 0.0
+        first = True
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, delta, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            # The first delta is the time from opening the log to the connection
+            seconds = 0.0 if first else seconds + delta / 1e6
+            first = False
+            yield kind, seconds, payload
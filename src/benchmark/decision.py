@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+"""decision.py: Micro-benchmark for the decision engines (prolog.prologquery.PrologQuery, brain.native.NativeQuery).
+
+Plays a synthetic match against a cave from Map/Cave.py: every tick the agent status and
+sensors are fed to the brain the same way GameAI does, the decision is timed phase by
+phase (sense/1 and the three steps of learn/3, plus print_cave/0) and applied back to the
+cave. Before the timed ticks, a fraction of the cave around the agent is made known by
+running update_knowledge/1 on it, to reproduce the knowledge base of a late match.
+The brain is sized to each cave (set_map_size/2), and the cells its knowledge base holds
+facts about are reported with the timings, to see both grow with the map.
+
+Usage (from src/):
+    python -m benchmark.decision --sizes 20x12,40x24,60x35 --known 0,0.5,0.9 --ticks 300
+    python -m benchmark.decision --brain native --sizes 60x35,120x70,250x250,500x500 --known 0,0.25
+    python -m benchmark.decision --brain native
+    python -m benchmark.decision --sizes 60x35 --known 0.5 --profile
+"""
+
+import argparse
+import collections
+import time
+import typing
+
+import Map.Cave as cave_map
+from Map.Cave import Cave
+from Server.LocalServer import GameServer, Player
+from benchmark.stats import Samples
+import brain
+from brain.types import Sensors
+
+# Bot.thread_interval, in milliseconds
+BUDGET_MS = 250
+
+# Server command for each action returned by learn/3 (same mapping as GameAI.GetDecision)
+COMMANDS = {
+    'pick_up': 't',
+    'move_forward': 'w',
+    'move_backwards': 's',
+    'turn_clockwise': 'd',
+    'turn_anticlockwise': 'a',
+    'shoot': 'e',
+}
+
+
+class _NullSession():
+
+    def send(self, msg: str) -> None:
+        pass
+
+
+def sensors_from_observations(o: typing.List[str]) -> typing.Tuple[Sensors, typing.Optional[int]]:
+    """Same translation as GameAI.GetObservations, returning the enemy distance apart."""
+    sensors = Sensors()
+    enemy = None
+    for s in o:
+        if s == 'blocked':
+            sensors.impact = True
+        elif s == 'steps':
+            sensors.steps = True
+        elif s == 'breeze':
+            sensors.breeze = True
+        elif s == 'flash':
+            sensors.flash = True
+        elif s == 'blueLight':
+            sensors.potion = True
+        elif s == 'redLight':
+            sensors.glow = True
+        elif s.startswith('enemy#'):
+            enemy = int(s[s.find('#') + 1:])
+    return sensors, enemy
+
+
+class _PrologPhases():
+    """learn/3 split in its steps, as separate queries."""
+
+    def __init__(self, brain, render: bool) -> None:
+        self.brain = brain
+        self.render = render
+
+    def query(self, query: str) -> typing.Optional[dict]:
+        # With rendering on, keep the log/print_cave output off the report
+        if self.render:
+            query = f'with_output_to(string(_), ({query}))'
+        return self.brain.get_first_result(query)
+
+    def sense(self) -> bool:
+        return self.query('sense(_)') is not None
+
+    def update_knowledge(self, sensors: Sensors) -> None:
+        self.query(f'pitfall:update_knowledge({sensors})')
+
+    def update_goal(self) -> None:
+        self.query('pitfall:update_goal(Goal), nb_setval(benchmark_goal, Goal)')
+
+    def next_action(self) -> typing.Optional[str]:
+        result = self.query(
+            'nb_getval(benchmark_goal, Goal), pitfall:next_action(Goal, Action), pitfall:set_last_action(Action)')
+        return str(result['Action']) if result is not None else None
+
+    def print_cave(self) -> None:
+        self.query('print_cave')
+
+    def learn_blocked(self, pos: typing.Tuple[int, int]) -> None:
+        self.query(f'pitfall:learn(blocked, ({pos[0]}, {pos[1]}))')
+
+    def kb_cells(self) -> int:
+        result = self.query('aggregate_all(count, P, (pitfall:certain(_, P) ; pitfall:blocked_position(P)), N)')
+        return int(result['N']) if result is not None else 0
+
+
+class _NativePhases():
+
+    def __init__(self, brain, render: bool) -> None:
+        self.brain = brain
+        self.render = render
+        self.goal = None
+
+    def sense(self) -> bool:
+        self.brain.sense()
+        return True
+
+    def update_knowledge(self, sensors: Sensors) -> None:
+        self.brain.update_knowledge(sensors)
+
+    def update_goal(self) -> None:
+        self.goal = self.brain.update_goal()
+
+    def next_action(self) -> typing.Optional[str]:
+        action = self.brain.next_action(self.goal) if self.goal is not None else None
+        self.brain.last_action = action
+        return action
+
+    def print_cave(self) -> None:
+        if self.brain.verbose:
+            self.brain.render()
+
+    def learn_blocked(self, pos: typing.Tuple[int, int]) -> None:
+        self.brain.learn_blocked(pos)
+
+    def kb_cells(self) -> int:
+        kb = self.brain.kb
+        return len(kb.certain.keys() | kb.possible.keys() | kb.blocked)
+
+
+PHASES = {'prolog': _PrologPhases, 'native': _NativePhases}
+
+
+class DecisionBenchmark():
+
+    def __init__(
+        self, backend: str, brain, width: int, height: int, known: float, seed: int, render: bool = False,
+    ) -> None:
+        self.brain = brain
+        self.phases = PHASES[backend](brain, render)
+        self.known = known
+        cave = Cave.generate(
+            width, height, seed=seed,
+            pits=width * height // 80, teleporters=width * height // 250,
+            gold=width * height // 100, power_ups=width * height // 200,
+        )
+        self.game = GameServer(lambda _: cave, fast=True, game_seconds=float('inf'), seed=seed)
+        self.player: Player = self.game.join(_NullSession())
+        self.samples = Samples()
+
+    def feed_status(self) -> Sensors:
+        p = self.player
+        self.brain.set_position(p.x, p.y)
+        self.brain.set_facing(p.dir)
+        self.brain.set_energy(p.energy)
+        self.brain.set_score(p.score)
+        sensors, enemy = sensors_from_observations(self.game.observations(p))
+        if enemy is not None:
+            self.brain.set_detected_enemy(enemy)
+        self.brain.set_observations(sensors)
+        return sensors
+
+    def learn_cave(self) -> int:
+        """Run update_knowledge/1 over the first `known` fraction of the cells reachable from the agent."""
+        p = self.player
+        cave = self.game.cave
+        safe = [cave_map.EMPTY, *cave_map.GOLD_VALUE, *cave_map.POWER_UP_VALUE]
+        start = (p.x, p.y)
+        order = [start]
+        queue = collections.deque(order)
+        seen = {start}
+        while queue:
+            x, y = queue.popleft()
+            for n in cave.neighbours(x, y):
+                if n not in seen and cave.get(*n) in safe and self.game.occupant(*n) is None:
+                    seen.add(n)
+                    order.append(n)
+                    queue.append(n)
+
+        count = int(len(order) * self.known)
+        for x, y in order[:count]:
+            p.x, p.y = x, y
+            sensors = self.feed_status()
+            self.phases.update_knowledge(sensors)
+            for nx, ny in cave_map.DELTAS.values():
+                if cave.is_blocked(x + nx, y + ny):
+                    self.phases.learn_blocked((x + nx, y + ny))
+        p.x, p.y = start
+        return count
+
+    def tick(self) -> None:
+        samples = self.samples
+        phases = self.phases
+        t0 = time.perf_counter()
+        sensors = self.feed_status()
+        t1 = time.perf_counter()
+        sensed = phases.sense()
+        t2 = time.perf_counter()
+        phases.update_knowledge(sensors)
+        t3 = time.perf_counter()
+        phases.update_goal()
+        t4 = time.perf_counter()
+        action = phases.next_action()
+        t5 = time.perf_counter()
+        phases.print_cave()
+        t6 = time.perf_counter()
+
+        samples.add('set_status', t1 - t0)
+        samples.add('sense', t2 - t1)
+        samples.add('update_knowledge', t3 - t2)
+        samples.add('update_goal', t4 - t3)
+        samples.add('next_action', t5 - t4)
+        samples.add('print_cave', t6 - t5)
+        samples.add('total', t6 - t0)
+
+        if not sensed:
+            action = None
+        self.game.handle_command(self.player, COMMANDS.get(action, COMMANDS['turn_clockwise']))
+
+    def run(self, ticks: int) -> Samples:
+        for _ in range(ticks):
+            self.tick()
+        return self.samples
+
+
+def parse_size(value: str) -> typing.Tuple[int, int]:
+    w, h = value.lower().split('x')
+    return int(w), int(h)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Decision engine micro-benchmark')
+    parser.add_argument('--sizes', default='20x12,40x24,60x35', help='comma separated WxH caves')
+    parser.add_argument('--known', default='0,0.25,0.5,0.9', help='comma separated fractions of the cave known beforehand')
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--render', action='store_true', help='keep logging enabled so print_cave renders the map')
+    parser.add_argument('--brain', choices=brain.BACKENDS, default='prolog', help='decision engine')
+    parser.add_argument('--profile', action='store_true', help='prolog: rank the pitfall.pl predicates of the timed ticks')
+    parser.add_argument('--top', type=int, default=30, help='rows of the --profile table')
+    args = parser.parse_args(argv)
+    if args.profile and args.brain != 'prolog':
+        parser.error('--profile needs --brain prolog')
+
+    engine = brain.create_brain(args.brain)
+    for size in args.sizes.split(','):
+        width, height = parse_size(size)
+        for known in [float(k) for k in args.known.split(',')]:
+            engine.reset()
+            engine.set_map_size(width, height)
+            if not args.render:
+                engine.disable_logging()
+            bench = DecisionBenchmark(args.brain, engine, width, height, known, args.seed, args.render)
+            cells = bench.learn_cave()
+            if args.profile:
+                with engine.profile() as profile:
+                    samples = bench.run(args.ticks)
+                # The phases are separate queries here, not tick/8
+                profile.ticks = args.ticks
+            else:
+                samples = bench.run(args.ticks)
+            print(f'\n== {args.brain}: {width}x{height} cave, {known:.0%} known ({cells} cells), {args.ticks} ticks, '
+                  f'{bench.phases.kb_cells()} cells in the knowledge base')
+            print(samples.report(budget_ms=BUDGET_MS))
+            if args.profile:
+                print(profile.table(args.top))
+
+
+if __name__ == '__main__':
+    main()
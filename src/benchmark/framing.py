@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""framing.py: Receive-path throughput, in lines per second, for bursts of server lines.
+
+Sends a burst of scoreboard ('u') or player lines through a socket pair and times how fast
+the receiving side turns it into lines: the old way (recv(1024), decode, ProcessBuffer on
+strings) and with a LineFramer (recv_into a reusable buffer, split in place).
+
+Usage (from src/):
+    python -m benchmark.framing --lines 200000 --players 40
+"""
+
+import argparse
+import socket
+import threading
+import time
+import typing
+
+from Socket.HandleClient import HandleClient
+from Socket.LineFramer import LineFramer
+
+
+def player_line(i: int) -> str:
+    return f'player;{i};bot_{i};{i % 60};{i % 35};{i % 4};1;Color [A=255, R={i % 256}, G=120, B=45]'
+
+
+def scoreboard_line(players: int) -> str:
+    scores = [f'bot_{i}#connected#{10 * i}#100#Color [A=255, R={i % 256}, G=120, B=45]' for i in range(players)]
+    return ';'.join(['u'] + scores)
+
+
+class CountingClient(HandleClient):
+    """HandleClient whose lines are only counted."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.client_socket.close()
+        self.count = 0
+
+    def processLine(self, command: str):
+        self.count += 1
+
+
+def old_receive(sock: socket.socket) -> int:
+    # HandleClient.doLoop before LineFramer
+    client = CountingClient()
+    offset = ''
+    while True:
+        recv_str = sock.recv(1024)
+        if len(recv_str) == 0:
+            return client.count
+        data = offset + recv_str.decode('utf-8')
+        offset = client.ProcessBuffer(data)
+
+
+def framer_receive(sock: socket.socket) -> int:
+    framer = LineFramer()
+    count = 0
+    while framer.recv_from(sock) > 0:
+        for _ in framer.lines():
+            count += 1
+    return count
+
+
+def run(receive: typing.Callable[[socket.socket], int], payload: bytes) -> typing.Tuple[int, float]:
+    a, b = socket.socketpair()
+    sender = threading.Thread(target=lambda: (a.sendall(payload), a.close()))
+    t0 = time.perf_counter()
+    sender.start()
+    count = receive(b)
+    elapsed = time.perf_counter() - t0
+    sender.join()
+    b.close()
+    return count, elapsed
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Line framing throughput')
+    parser.add_argument('--lines', type=int, default=100000, help='lines per burst')
+    parser.add_argument('--players', type=int, default=20, help='players on each scoreboard line')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    bursts = {
+        'player': '\n'.join(player_line(i) for i in range(args.lines)) + '\n',
+        'scoreboard': '\n'.join(scoreboard_line(args.players) for _ in range(args.lines)) + '\n',
+    }
+    receivers = {'ProcessBuffer': old_receive, 'LineFramer': framer_receive}
+
+    print(f'{"burst":<12}{"receiver":<16}{"MB":>8}{"lines/s":>14}')
+    for burst, text in bursts.items():
+        payload = text.encode('utf-8')
+        for name, receive in receivers.items():
+            best = min(run(receive, payload)[1] for _ in range(args.repeat))
+            count, _ = run(receive, payload)
+            assert count == args.lines, f'{name} got {count} lines'
+            print(f'{burst:<12}{name:<16}{len(payload) / 1e6:>8.1f}{args.lines / best:>14,.0f}')
+
+
+if __name__ == '__main__':
+    main()
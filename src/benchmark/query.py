@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""query.py: Per-call cost of string queries against prepared queries (prolog/prepared.py).
+
+Runs the same pitfall.pl calls both ways on one PrologQuery, alternating between them so
+both see the same knowledge base: as a query string through get_first_result, converting
+the bindings the way PrologQuery used to, and through its PreparedQuery handles.
+
+Usage (from src/):
+    python -m benchmark.query --calls 2000
+"""
+
+import argparse
+import time
+import typing
+
+from benchmark.stats import Samples
+from brain.types import Sensors, Goal, Action
+from prolog.prologquery import PrologQuery
+
+
+def cases(brain: PrologQuery, sensors: Sensors) -> typing.Dict[str, typing.Tuple[typing.Callable, typing.Callable]]:
+    """name -> (string query call, prepared query call)"""
+
+    def string_position():
+        brain.get_first_result('set_agent_position((1, 1))')
+
+    def string_health():
+        result = brain.get_first_result('get_agent_health(Health)')
+        return int(result['Health'])
+
+    def string_tick():
+        result = brain.get_first_result(f'tick((1, 1), east, 100, 0, {sensors}, none, Goal, Action)')
+        return Goal.from_str(result['Goal']), Action.from_str(result['Action'])
+
+    return {
+        'set_agent_position': (string_position, lambda: brain._set_agent_position((1, 1))),
+        'get_agent_health': (string_health, lambda: brain._get_agent_health()),
+        'tick': (string_tick, lambda: brain._tick((1, 1), 'east', 100, 0, sensors, 'none')),
+    }
+
+
+def run(calls: int) -> Samples:
+    brain = PrologQuery()
+    brain.disable_logging()
+    samples = Samples()
+    for name, (string_call, prepared_call) in cases(brain, Sensors()).items():
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            string_call()
+            t1 = time.perf_counter()
+            prepared_call()
+            t2 = time.perf_counter()
+            samples.add(f'{name}/string', t1 - t0)
+            samples.add(f'{name}/prepared', t2 - t1)
+    return samples
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='String against prepared Prolog queries')
+    parser.add_argument('--calls', type=int, default=1000, help='calls per query and way')
+    args = parser.parse_args(argv)
+
+    samples = run(args.calls)
+    print(samples.report())
+    print()
+    for name in sorted({series.split('/')[0] for series in samples.series}):
+        saving = samples.mean(f'{name}/string') - samples.mean(f'{name}/prepared')
+        print(f'{name:<20} saves {1000 * saving:.3f} ms per call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""stats.py: Latency summaries shared by the benchmark scripts."""
+
+import math
+import typing
+
+
+def percentile(sorted_values: typing.Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Samples():
+    """Named series of latency samples, in seconds."""
+
+    def __init__(self) -> None:
+        self.series: typing.Dict[str, typing.List[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.series.setdefault(name, []).append(seconds)
+
+    def report(self, total: str = 'total', budget_ms: typing.Optional[float] = None) -> str:
+        """Table with p50/p95/p99/mean in milliseconds and each series' share of `total`, if recorded."""
+        total_time = sum(self.series.get(total, [])) or 1.0
+        lines = [f'{"phase":<18}{"calls":>8}{"p50":>10}{"p95":>10}{"p99":>10}{"mean":>10}{"share":>8}']
+        for name, values in self.series.items():
+            s = sorted(values)
+            mean = sum(s) / len(s)
+            share = '' if name == total or total not in self.series else f'{100 * sum(s) / total_time:7.1f}%'
+            lines.append(
+                f'{name:<18}{len(s):>8}{1000 * percentile(s, 50):>10.3f}{1000 * percentile(s, 95):>10.3f}'
+                f'{1000 * percentile(s, 99):>10.3f}{1000 * mean:>10.3f}{share:>8}'
+            )
+        if budget_ms is not None and total in self.series:
+            over = sum(1 for v in self.series[total] if 1000 * v > budget_ms)
+            lines.append(f'over {budget_ms:g} ms budget: {over}/{len(self.series[total])}')
+        return '\n'.join(lines)
+
+    def mean(self, name: str) -> float:
+        values = self.series.get(name, [])
+        return sum(values) / len(values) if len(values) > 0 else 0.0
@@ -0,0 +1,34 @@
+"""Decision engines ("brains") GameAI can run on."""
+
+import typing
+
+BACKENDS = ['prolog', 'native']
+
+
+def create_brain(backend: str = 'prolog', map_size: typing.Optional[typing.Tuple[int, int]] = None,
+                 max_risk: typing.Optional[float] = None):
+    """Instantiate the decision engine for `backend`, on a map of map_size cells (default 60x35).
+
+    max_risk lets the native brain explore cells that may hold a pit or a teleporter
+    (NativeQuery.risky_position_to_explore). Imports are deferred so each backend only
+    needs its own dependencies (pyswip and SWI-Prolog for `prolog`, NumPy for `native`).
+    """
+    if backend == 'prolog':
+        if max_risk is not None:
+            raise ValueError('max_risk needs the native brain')
+        from prolog.prologquery import PrologQuery
+        return PrologQuery() if map_size is None else PrologQuery(None, *map_size)
+    if backend == 'native':
+        from brain import grid
+        from brain.native import NativeQuery
+        width, height = map_size if map_size is not None else (grid.WIDTH, grid.HEIGHT)
+        return NativeQuery(width, height, max_risk)
+    raise ValueError(f'Unknown brain backend: {backend}')
+
+
+def map_size(value: str) -> typing.Tuple[int, int]:
+    """'WxH' as (width, height), for --map-size options."""
+    width, height = (int(n) for n in value.lower().split('x'))
+    if width <= 0 or height <= 0:
+        raise ValueError(value)
+    return width, height
@@ -0,0 +1,305 @@
+"""grid.py: Cell-indexed knowledge base used by the native brain.
+
+Every certain/2 fact of pitfall.pl is one bit of `certain`, possible_position/3 facts are
+bits of `possible` and blocked_position/1 is the `blocked` set, all keyed by (x, y). Only
+cells something is known about are stored, so memory grows with the explored part of
+the map, not with its area, and the map size is only the bounds valid() checks.
+
+The kinds the whole-map questions are about (BOARD_KINDS, and the blocked cells) are also
+kept as bitboards: one Python int per kind, bit y * stride + x set for every cell that has
+it. A row is stride = width + 1 bits, the extra bit always clear, so shifting by 1 moves
+every cell east or west and shifting by stride moves it south or north, and a cell on the
+edge shifts into the spare bit (or out of the board) instead of onto the next row. Then
+"no pit and no teleporter" is an AND over the whole map, and the BFS of the exploration a
+flood fill of a few shifts per step (first_reached()).
+"""
+
+import typing
+
+Pos = typing.Tuple[int, int]
+
+# certain(Kind, Pos)
+VISITED = 1 << 0
+BREEZE = 1 << 1
+NO_BREEZE = 1 << 2
+FLASH = 1 << 3
+NO_FLASH = 1 << 4
+GLOW = 1 << 5
+NO_GLOW = 1 << 6
+GOLD = 1 << 7
+NO_GOLD = 1 << 8
+POTION = 1 << 9
+NO_POTION = 1 << 10
+POWER_UP = 1 << 11
+NO_POWER_UP = 1 << 12
+PIT = 1 << 13
+NO_PIT = 1 << 14
+TELEPORTER = 1 << 15
+NO_TELEPORTER = 1 << 16
+SAFE = 1 << 17
+
+# possible_position(Kind, Pos, _)
+POSSIBLE_PIT = 1 << 0
+POSSIBLE_TELEPORTER = 1 << 1
+POSSIBLE_ENEMY = 1 << 2
+POSSIBLE_ANY = POSSIBLE_PIT | POSSIBLE_TELEPORTER | POSSIBLE_ENEMY
+
+# adjacent/3 clause order in pitfall.pl
+ADJACENT = [('south', (0, 1)), ('north', (0, -1)), ('west', (-1, 0)), ('east', (1, 0))]
+DELTA = dict(ADJACENT)
+
+# certain/2 kinds also kept as bitboards
+BOARD_KINDS = (VISITED, SAFE, NO_PIT, NO_TELEPORTER, BREEZE, FLASH, PIT, TELEPORTER)
+BOARD_MASK = VISITED | SAFE | NO_PIT | NO_TELEPORTER | BREEZE | FLASH | PIT | TELEPORTER
+# Up to this many cells, KnowledgeGrid.cells() takes the bits one by one instead of
+# going through the binary string of the whole board
+SPARSE_CELLS = 32
+
+# Default labyrinth size, as in pitfall.pl (map_size/2)
+WIDTH = 60
+HEIGHT = 35
+
+
+def without(board: int, mask: int) -> int:
+    """board & ~mask, without the negative ints (slow to AND when large) ~ makes."""
+    return board ^ (board & mask)
+
+
+def adjacent(pos: Pos, dir: str) -> Pos:
+    dx, dy = DELTA[dir]
+    return pos[0] + dx, pos[1] + dy
+
+
+class KnowledgeGrid():
+
+    def __init__(self, width: int = WIDTH, height: int = HEIGHT) -> None:
+        self.width = width
+        self.height = height
+        # Cells with no facts have no entry
+        self.certain: typing.Dict[Pos, int] = {}
+        self.possible: typing.Dict[Pos, int] = {}
+        self.blocked: typing.Set[Pos] = set()
+        self.stride = width + 1
+        # Bitboards of BOARD_KINDS and of the blocked cells
+        self.boards: typing.Dict[int, int] = dict.fromkeys(BOARD_KINDS, 0)
+        self.blocked_board = 0
+        # kb_version/1: bumped whenever a cell becomes or stops being walkable for a_star/5
+        # (SAFE or `blocked` changes), so planned paths know when they are out of date
+        self.version = 0
+        # dirty_cell/1: cells changed since the last inference
+        self.dirty: typing.Set[Pos] = set()
+
+    def copy(self) -> 'KnowledgeGrid':
+        other = KnowledgeGrid.__new__(KnowledgeGrid)
+        other.width = self.width
+        other.height = self.height
+        other.certain = dict(self.certain)
+        other.possible = dict(self.possible)
+        other.blocked = set(self.blocked)
+        other.stride = self.stride
+        # Ints are immutable, so the boards themselves are shared
+        other.boards = dict(self.boards)
+        other.blocked_board = self.blocked_board
+        other.version = self.version
+        other.dirty = set(self.dirty)
+        return other
+
+    def resize(self, width: int, height: int) -> None:
+        """set_map_size/2. Facts about cells left outside are kept but no longer consulted.
+
+        The row length changes, so the bitboards are built again, from the cells inside.
+        """
+        self.width = width
+        self.height = height
+        self.stride = width + 1
+        self.boards = {kind: self.board(pos for pos, c in self.certain.items() if c & kind and self.valid(pos))
+                       for kind in BOARD_KINDS}
+        self.blocked_board = self.board(pos for pos in self.blocked if self.valid(pos))
+        self.version += 1
+
+    def valid(self, pos: Pos) -> bool:
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.height
+
+    def neighbours(self, pos: Pos) -> typing.Iterator[Pos]:
+        """Valid adjacent cells, in adjacent/3 order."""
+        x, y = pos
+        for _, (dx, dy) in ADJACENT:
+            if 0 <= x + dx < self.width and 0 <= y + dy < self.height:
+                yield x + dx, y + dy
+
+    # Bitboards
+
+    def bit(self, pos: Pos) -> int:
+        return 1 << (pos[1] * self.stride + pos[0])
+
+    def board(self, cells: typing.Iterable[Pos]) -> int:
+        board = 0
+        for pos in cells:
+            board |= self.bit(pos)
+        return board
+
+    def cells(self, board: int) -> typing.Iterator[Pos]:
+        """Cells of board, row by row."""
+        s = self.stride
+        if board.bit_count() <= SPARSE_CELLS:
+            # Clearing the lowest bit is O(n) on an n bit int, but a few of those are
+            # cheaper than writing out the whole board
+            while board:
+                i = (board & -board).bit_length() - 1
+                yield i % s, i // s
+                board &= board - 1
+            return
+        bits = bin(board)[:1:-1]
+        i = bits.find('1')
+        while i >= 0:
+            yield i % s, i // s
+            i = bits.find('1', i + 1)
+
+    def spread(self, board: int) -> int:
+        """board and the cells next to it (off-map ones included, mask them out)."""
+        s = self.stride
+        return board | board << 1 | board >> 1 | board << s | board >> s
+
+    def frontier(self) -> int:
+        """explore_frontier/1: safe cells not visited yet (and not blocked)."""
+        return without(without(self.boards[SAFE], self.boards[VISITED]), self.blocked_board)
+
+    def first_reached(self, origin: Pos, passable: int, targets: int) -> typing.Optional[Pos]:
+        """First cell of targets a BFS from origin over passable cells finds.
+
+        Same result as a BFS queueing the new neighbours of each cell sorted by (x, y) and
+        stopping at the first target it queues (next_position_to_explore/1). The layers
+        of the BFS come from a flood fill, up to the first layer with targets in it, and
+        then are cut down to the cells on shortest paths to those targets. Every such cell
+        is queued by its first queued neighbour in the previous layer, so the first one
+        queued in a layer is the smallest (x, y) among those next to the first one queued
+        in the previous layer: one step per layer leads to the target.
+        """
+        layers = [self.bit(origin)]
+        reached = layers[0]
+        while True:
+            front = without(self.spread(layers[-1]) & passable, reached)
+            if not front:
+                return None
+            layers.append(front)
+            reached |= front
+            if front & targets:
+                break
+
+        cone = layers[-1] & targets
+        for k in range(len(layers) - 1, 0, -1):
+            layers[k] = cone
+            cone = self.spread(cone) & layers[k - 1]
+
+        pos = origin
+        for k in range(1, len(layers)):
+            pos = min(n for n in self.neighbours(pos) if layers[k] & self.bit(n))
+        return pos
+
+    # Single cell access. Facts about cells outside the grid are never consulted by
+    # the rules (valid_position/1 is always checked first), so they are dropped.
+
+    def has(self, kind: int, pos: Pos) -> bool:
+        return self.valid(pos) and bool(self.certain.get(pos, 0) & kind)
+
+    def add(self, kind: int, pos: Pos) -> None:
+        if self.valid(pos):
+            c = self.certain.get(pos, 0)
+            if kind & SAFE and not c & SAFE:
+                self.version += 1
+            self.certain[pos] = c | kind
+            new = kind & ~c & BOARD_MASK
+            if new:
+                bit = self.bit(pos)
+                for k in BOARD_KINDS:
+                    if new & k:
+                        self.boards[k] |= bit
+
+    def remove(self, kind: int, pos: Pos) -> None:
+        c = self.certain.get(pos, 0)
+        if c & kind and self.valid(pos):
+            if kind & SAFE and c & SAFE:
+                self.version += 1
+            gone = c & kind & BOARD_MASK
+            c &= ~kind
+            if c:
+                self.certain[pos] = c
+            else:
+                del self.certain[pos]
+            if gone:
+                bit = self.bit(pos)
+                for k in BOARD_KINDS:
+                    if gone & k:
+                        self.boards[k] ^= bit
+
+    def is_possible(self, kind: int, pos: Pos) -> bool:
+        return self.valid(pos) and bool(self.possible.get(pos, 0) & kind)
+
+    def add_possible(self, kind: int, pos: Pos) -> None:
+        if self.valid(pos):
+            self.possible[pos] = self.possible.get(pos, 0) | kind
+
+    def remove_possible(self, kind: int, pos: Pos) -> None:
+        c = self.possible.get(pos, 0)
+        if c & kind:
+            c &= ~kind
+            if c:
+                self.possible[pos] = c
+            else:
+                del self.possible[pos]
+
+    def is_blocked(self, pos: Pos) -> bool:
+        return pos in self.blocked and self.valid(pos)
+
+    def set_blocked(self, pos: Pos) -> None:
+        if self.valid(pos) and pos not in self.blocked:
+            self.blocked.add(pos)
+            self.blocked_board |= self.bit(pos)
+            self.version += 1
+
+    # Inference
+    #
+    # A hint cell's conclusion only depends on its own facts and on its neighbours being
+    # blocked or known clear, so after a tick only the cells that changed (`dirty`) and
+    # the cells next to them have to be looked at again.
+
+    def mark_dirty(self, pos: Pos) -> None:
+        if self.valid(pos):
+            self.dirty.add(pos)
+
+    def take_dirty(self) -> typing.Set[Pos]:
+        """take_dirty_cells/1: the dirty cells, emptying the worklist."""
+        cells, self.dirty = self.dirty, set()
+        return cells
+
+    def infer_dangerous(self, cells: typing.Iterable[Pos], hint: int, not_there: int, there: int) -> None:
+        """infer_dangerous_positions/1 for one (Hint, NotThere, There) trio.
+
+        A hint cell in or next to `cells` whose open neighbours are all known clear but one
+        has the danger there.
+        """
+        around = set(cells)
+        for pos in cells:
+            around.update(self.neighbours(pos))
+        certain = self.certain
+        for pos in around:
+            if not certain.get(pos, 0) & hint:
+                continue
+            maybe = [n for n in self.neighbours(pos) if n not in self.blocked]
+            unknown = [n for n in maybe if not certain.get(n, 0) & not_there]
+            if len(unknown) == 1:
+                # learn(There, Pos)
+                self.remove_possible(POSSIBLE_ANY, unknown[0])
+                self.add(there, unknown[0])
+
+    def infer_safe(self) -> None:
+        """infer_safe_positions/1: cells with no pit and no teleporter are safe.
+
+        One AND over the whole map. Cells only learn no_pit and no_teleporter while dirty,
+        so this finds the same cells as looking at the dirty ones.
+        """
+        boards = self.boards
+        for pos in self.cells(without(boards[NO_PIT] & boards[NO_TELEPORTER], boards[SAFE])):
+            # learn(safe, Pos)
+            self.remove_possible(POSSIBLE_ANY, pos)
+            self.add(SAFE, pos)
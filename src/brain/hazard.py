@@ -0,0 +1,106 @@
+"""hazard.py: Probability of a pit or a teleporter in each cell, over the whole map at once.
+
+possible_position/3 only says a cell may hold a danger, and infer_dangerous_positions/1
+only concludes anything once a single candidate is left around a breeze (or flash). Here
+every cell gets a probability instead, worked out with NumPy from the knowledge base
+bitboards (brain/grid.py):
+
+- a cell known clear (no_pit, no_teleporter, or safe or visited) or blocked has none, a
+  known one is certain;
+- any other cell starts at the prior, the share of cells LocalServer.py's caves give it;
+- a breeze says at least one of its n unknown neighbours has a pit, which happens with
+  probability 1 - (1 - prior)^n, so each of them is scaled by 1 / (1 - (1 - prior)^n),
+  up to certain when n is 1 (the single candidate of infer_dangerous_positions/1);
+- the scales of every breeze around a cell multiply (as if they were independent).
+
+Counting neighbours and gathering scales are both a 4-neighbour convolution (around()),
+so an update costs a few array operations over the map, whatever is known. The arrays
+are worked out again on the first lookup after the knowledge base changed:
+
+    hazard = HazardMap()
+    hazard.risk(kb, (x, y))     # pit or teleporter, 0..1
+    hazard.update(kb).pit       # the whole pit grid, indexed [y, x]
+"""
+
+import typing
+
+import numpy as np
+
+from brain import grid
+from brain.grid import KnowledgeGrid, Pos
+
+# Cells per pit and per teleporter in the caves of Map/Cave.py (LocalServer.py)
+PIT_PRIOR = 1 / 80
+TELEPORTER_PRIOR = 1 / 250
+
+
+def around(a: np.ndarray) -> np.ndarray:
+    """Sum of the 4 neighbours of each cell, off-map ones counting as 0."""
+    out = np.zeros_like(a)
+    out[1:, :] += a[:-1, :]
+    out[:-1, :] += a[1:, :]
+    out[:, 1:] += a[:, :-1]
+    out[:, :-1] += a[:, 1:]
+    return out
+
+
+def unpack(kb: KnowledgeGrid, board: int) -> np.ndarray:
+    """Bitboard of kb as a boolean array indexed [y, x]."""
+    n = kb.stride * kb.height
+    raw = np.frombuffer(board.to_bytes((n + 7) // 8, 'little'), dtype=np.uint8)
+    bits = np.unpackbits(raw, count=n, bitorder='little')
+    return bits.reshape(kb.height, kb.stride)[:, :kb.width].view(bool)
+
+
+def probability(prior: float, hint: np.ndarray, clear: np.ndarray, known: np.ndarray,
+                blocked: np.ndarray) -> np.ndarray:
+    """Danger probability of every cell from the cells it was felt from (see the module doc)."""
+    unknown = ~(clear | known | blocked)
+    # Breezes with a known pit next to them say nothing about the other neighbours
+    open_hints = hint & (around(known.astype(np.int8)) == 0)
+    candidates = around(unknown.astype(np.int8))
+    scale = np.zeros(hint.shape)
+    felt = open_hints & (candidates > 0)
+    scale[felt] = -np.log1p(-(1 - prior) ** candidates[felt])
+    p = np.where(unknown, prior * np.exp(around(scale)), 0.0)
+    # The last candidate of a breeze is certain
+    p[unknown & (around((felt & (candidates == 1)).astype(np.int8)) > 0)] = 1.0
+    p[known] = 1.0
+    return np.minimum(p, 1.0)
+
+
+class HazardMap():
+    """Pit and teleporter probability grids of a knowledge base, kept up to date lazily."""
+
+    def __init__(self) -> None:
+        self.pit: typing.Optional[np.ndarray] = None
+        self.teleporter: typing.Optional[np.ndarray] = None
+        self.danger: typing.Optional[np.ndarray] = None
+        # Inputs the grids were worked out from (ints are immutable, so `is` tells a change)
+        self.inputs: typing.Tuple[int, ...] = ()
+
+    def update(self, kb: KnowledgeGrid) -> 'HazardMap':
+        boards = kb.boards
+        inputs = (kb.stride, kb.height, kb.blocked_board, *(boards[k] for k in (
+            grid.VISITED, grid.SAFE, grid.BREEZE, grid.NO_PIT, grid.PIT,
+            grid.FLASH, grid.NO_TELEPORTER, grid.TELEPORTER)))
+        if len(inputs) == len(self.inputs) and all(a is b for a, b in zip(inputs, self.inputs)):
+            return self
+        self.inputs = inputs
+        blocked = unpack(kb, kb.blocked_board)
+        # Nobody stands on a pit, and a teleporter moves whoever steps on it elsewhere
+        seen = unpack(kb, boards[grid.VISITED] | boards[grid.SAFE])
+        self.pit = probability(PIT_PRIOR, unpack(kb, boards[grid.BREEZE]), seen | unpack(kb, boards[grid.NO_PIT]),
+                               unpack(kb, boards[grid.PIT]), blocked)
+        self.teleporter = probability(TELEPORTER_PRIOR, unpack(kb, boards[grid.FLASH]),
+                                      seen | unpack(kb, boards[grid.NO_TELEPORTER]),
+                                      unpack(kb, boards[grid.TELEPORTER]), blocked)
+        # Either of them
+        self.danger = 1 - (1 - self.pit) * (1 - self.teleporter)
+        return self
+
+    def risk(self, kb: KnowledgeGrid, pos: Pos) -> float:
+        """Probability of a pit or a teleporter at pos, 1 off the map."""
+        if not kb.valid(pos):
+            return 1.0
+        return float(self.update(kb).danger[pos[1], pos[0]])
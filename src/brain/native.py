@@ -0,0 +1,779 @@
+"""native.py: Decision engine running the rules of prolog/pitfall.pl in Python.
+
+Same public surface as prolog.prologquery.PrologQuery, with the knowledge base kept in
+the grids of brain.grid instead of SWI-Prolog facts, so a tick costs no foreign calls
+and no term parsing. Predicates are ported clause by clause, in clause order; the name
+of the predicate each method stands for is given in its docstring.
+"""
+
+import copy
+import heapq
+import logging
+import random
+import sys
+import time
+import typing
+
+from brain import grid, hazard
+from brain.grid import KnowledgeGrid, Pos, adjacent
+from brain.hazard import HazardMap
+from brain.types import Sensors, Position, Goal, Action, Inventory, AgentDeadError
+import metrics
+
+GoalTerm = typing.Tuple[typing.Any, ...]
+
+NONE: GoalTerm = ('none',)
+KILL: GoalTerm = ('kill',)
+FLEE: GoalTerm = ('flee',)
+FIND_ENEMY: GoalTerm = ('find_enemy',)
+
+CLOCKWISE = {'north': 'east', 'east': 'south', 'south': 'west', 'west': 'north'}
+ANTICLOCKWISE = {v: k for k, v in CLOCKWISE.items()}
+
+INITIAL_HEALTH = 100
+KILL_MODE_LIMIT = 6
+FIND_MODE_LIMIT = 20
+FLEE_LEVEL_START = 1
+FLEE_MODE_LIMIT = 20
+
+
+class _Failure(Exception):
+    """learn/3 failed."""
+
+
+class NativeQuery():
+
+    def __init__(self, width: int = grid.WIDTH, height: int = grid.HEIGHT, max_risk: typing.Optional[float] = None):
+        self.width = width
+        self.height = height
+        # Once no safe cell is left to explore, go for the least dangerous unknown one if
+        # its risk is at most this (risky_position_to_explore()). None: stay, as pitfall.pl
+        self.max_risk = max_risk
+        self.reset()
+
+    def reset(self):
+        self.kb = KnowledgeGrid(self.width, self.height)
+        self.hazard = HazardMap()
+        # certain(glow, _) and certain(potion, _) in assertion order, for ask_goal_KB/1
+        self.glow: typing.Dict[Pos, None] = {}
+        self.potion: typing.Dict[Pos, None] = {}
+
+        self.agent: Pos = (1, 1)
+        self.facing = 'east'
+        self.last_observation: typing.Optional[Sensors] = None
+        self.last_position: typing.Optional[Pos] = None
+        self.last_action: typing.Optional[str] = None
+        self.heard_steps = False
+        self.killed_enemy = False
+        self.got_hit = False
+        self.goal: typing.Optional[GoalTerm] = None
+        self.health: typing.Optional[int] = None
+        self.score: typing.Optional[int] = None
+
+        self.kill_mode_count = 0
+        self.last_saw_enemy: typing.Optional[typing.Tuple[Pos, int]] = None
+        self.find_mode_dir: typing.Optional[str] = None
+        self.find_mode_search_pos: typing.Optional[Pos] = None
+        self.flee_level: typing.Optional[int] = None
+        self.flee_mode_count = 0
+        self.flee_mode_next_position: typing.Optional[Pos] = None
+        # planned_path/3: goal -> (kb version, remaining path reversed, next step last)
+        self.plans: typing.Dict[Pos, typing.Tuple[int, typing.List[Pos]]] = {}
+
+        self.verbose = True
+
+    # PrologQuery interface
+    # ---------------------
+
+    def sense(self) -> Sensors:
+        if self.last_observation is None:
+            raise AgentDeadError
+        return self.last_observation
+
+    def set_observations(self, sensors: Sensors):
+        self.last_observation = Sensors(
+            sensors.steps, sensors.breeze, sensors.flash, sensors.glow,
+            sensors.impact, sensors.scream, sensors.potion,
+        )
+
+    def get_decision(self) -> Action:
+        try:
+            sensors = self.sense()
+            goal, action = self.learn(sensors)
+            logging.info(f'Goal: {goal}')
+            return action
+        except Exception:
+            return None
+
+    def tick(self, x: int, y: int, dir: str, energy: int, score: int, sensors: Sensors,
+             enemy_distance: typing.Optional[int] = None) -> typing.Optional[Action]:
+        """tick/8"""
+        self.set_position(x, y)
+        self.set_facing(dir)
+        self.set_energy(energy)
+        self.set_score(score)
+        self.set_observations(sensors)
+        if enemy_distance is not None:
+            self.set_detected_enemy(enemy_distance)
+        action = self.get_decision()
+        # learn/3 failing is no decision either
+        return action if isinstance(action, Action) else None
+
+    def print_map(self):
+        if self.verbose:
+            sys.stdout.write(self.render())
+
+    def snapshot(self) -> 'NativeQuery':
+        """Copy of the state render() reads, safe to render from another thread."""
+        view = copy.copy(self)
+        view.kb = self.kb.copy()
+        return view
+
+    def fork(self) -> 'NativeQuery':
+        """Independent copy of the whole state, to decide on without touching this one."""
+        other = copy.copy(self)
+        other.kb = self.kb.copy()
+        # The grids are replaced on update, never changed in place, so they can be shared
+        other.hazard = copy.copy(self.hazard)
+        other.glow = dict(self.glow)
+        other.potion = dict(self.potion)
+        # Paths are consumed in place
+        other.plans = {goal: (version, list(path)) for goal, (version, path) in self.plans.items()}
+        return other
+
+    def learn(self, sensors: Sensors) -> typing.Tuple[Goal, Action]:
+        timed = metrics.enabled
+        try:
+            t0 = time.perf_counter() if timed else 0.0
+            self.update_knowledge(sensors)
+            t1 = time.perf_counter() if timed else 0.0
+            goal = self.update_goal()
+            if goal is None:
+                raise _Failure
+            t2 = time.perf_counter() if timed else 0.0
+            action = self.next_action(goal)
+            if action is None:
+                raise _Failure
+            if timed:
+                t3 = time.perf_counter()
+                metrics.LEARN_PHASE_SECONDS.labels('update_knowledge').observe(t1 - t0)
+                metrics.LEARN_PHASE_SECONDS.labels('update_goal').observe(t2 - t1)
+                metrics.LEARN_PHASE_SECONDS.labels('next_action').observe(t3 - t2)
+        except _Failure:
+            logging.root.debug('Deu ruim na query')
+            return None, 'turn_clockwise'
+        self.last_action = action
+        return self.to_goal(goal), Action(action)
+
+    def act(self, action: Action) -> None:
+        # act/1 is not defined in pitfall.pl
+        pass
+
+    def set_facing(self, dir: typing.Literal['north', 'south', 'east', 'west']):
+        self.facing = dir
+
+    def set_position(self, x: int, y: int):
+        self.agent = (x, y)
+
+    def set_map_size(self, width: int, height: int):
+        """set_map_size/2"""
+        self.width = width
+        self.height = height
+        self.kb.resize(width, height)
+
+    def set_energy(self, energy: int):
+        self.health = energy if energy > 0 else 0
+
+    def set_score(self, score: int):
+        self.score = score
+
+    def set_detected_enemy(self, distance: int):
+        self.last_saw_enemy = (self.cell_at_direction(self.agent, self.facing, distance), 0)
+        self.find_mode_dir = self.facing
+
+    def set_got_hit(self):
+        self.got_hit = True
+
+    def get_health(self) -> int:
+        if self.health is None:
+            self.health = INITIAL_HEALTH
+        return self.health
+
+    def get_game_score(self) -> int:
+        if self.score is None:
+            self.score = 0
+        return self.score
+
+    def _player_is_at_correct_position(self) -> bool:
+        return True
+
+    def move_forward(self) -> bool:
+        self.act(Action('move_forward'))
+        return self._player_is_at_correct_position()
+
+    def turn_clockwise(self) -> bool:
+        self.act(Action('turn_clockwise'))
+        return True
+
+    def pick_up(self):
+        self.act(Action('pick_up'))
+
+    def shoot(self):
+        self.act(Action('shoot'))
+
+    def step_out(self):
+        self.act(Action('step_out'))
+
+    def get_inventory(self) -> Inventory:
+        return Inventory(0, 0, 0)
+
+    def disable_logging(self):
+        self.verbose = False
+
+    def close(self):
+        # Nothing held outside this object (PrologQuery gives its engine back)
+        pass
+
+    def enable_logging(self):
+        self.verbose = True
+
+    # Update knowledge
+    # ----------------
+
+    def update_knowledge(self, sensors: Sensors):
+        """update_knowledge/1"""
+        self.heard_steps = False
+        self.killed_enemy = False
+        self.update_impact(sensors.impact)
+        if sensors.scream:
+            self.killed_enemy = True
+        if sensors.steps:
+            self.heard_steps = True
+        self.update_breeze(sensors.breeze)
+        self.update_flash(sensors.flash)
+        self.update_glow(sensors.glow)
+        self.update_potion(sensors.potion)
+        self.set_visited_cell()
+        # Only the agent cell and its neighbours changed, besides cells learnt to be blocked
+        kb = self.kb
+        kb.mark_dirty(self.agent)
+        for p in kb.neighbours(self.agent):
+            kb.mark_dirty(p)
+        cells = kb.take_dirty()
+        kb.infer_dangerous(cells, grid.BREEZE, grid.NO_PIT, grid.PIT)
+        kb.infer_dangerous(cells, grid.FLASH, grid.NO_TELEPORTER, grid.TELEPORTER)
+        kb.infer_safe()
+
+    def update_impact(self, impact: bool):
+        """update_impact/1"""
+        if not impact:
+            return
+        if self.last_action == 'move_forward':
+            self.learn_blocked(adjacent(self.agent, self.facing))
+        elif self.last_action == 'move_backward':
+            self.learn_blocked(adjacent(self.agent, CLOCKWISE[CLOCKWISE[self.facing]]))
+        else:
+            raise _Failure
+
+    def update_breeze(self, breeze: bool):
+        """update_breeze/1 and update_pits/1"""
+        kb = self.kb
+        kb.add(grid.BREEZE if breeze else grid.NO_BREEZE, self.agent)
+        if not breeze:
+            self.learn_no_pit(self.agent)
+            for p in kb.neighbours(self.agent):
+                if not kb.is_blocked(p):
+                    self.learn_no_pit(p)
+        else:
+            for p in kb.neighbours(self.agent):
+                if not kb.is_blocked(p) and not kb.has(grid.NO_PIT, p):
+                    kb.add_possible(grid.POSSIBLE_PIT, p)
+
+    def update_flash(self, flash: bool):
+        """update_flash/1 and update_teleporter/1"""
+        kb = self.kb
+        kb.remove(grid.FLASH, self.agent)
+        kb.add(grid.FLASH if flash else grid.NO_FLASH, self.agent)
+        if not flash:
+            kb.add(grid.NO_TELEPORTER, self.agent)
+            for p in kb.neighbours(self.agent):
+                if not kb.is_blocked(p):
+                    self.learn_no_teleporter(p)
+        else:
+            for p in kb.neighbours(self.agent):
+                if not kb.is_blocked(p) and not kb.has(grid.NO_TELEPORTER, p):
+                    kb.add_possible(grid.POSSIBLE_TELEPORTER, p)
+
+    def update_glow(self, glow: bool):
+        """update_glow/1 and update_gold/1"""
+        kb = self.kb
+        ap = self.agent
+        kb.remove(grid.GLOW | grid.NO_GLOW, ap)
+        self.glow.pop(ap, None)
+        if glow:
+            kb.add(grid.GLOW | grid.GOLD, ap)
+            self.glow[ap] = None
+        else:
+            kb.remove(grid.GOLD, ap)
+            kb.add(grid.NO_GLOW | grid.NO_GOLD, ap)
+
+    def update_potion(self, potion: bool):
+        """update_potion/1 and update_power_up/1"""
+        kb = self.kb
+        ap = self.agent
+        kb.remove(grid.POTION | grid.NO_POTION, ap)
+        self.potion.pop(ap, None)
+        if potion:
+            kb.add(grid.POTION | grid.POWER_UP, ap)
+            self.potion[ap] = None
+        else:
+            kb.remove(grid.POWER_UP, ap)
+            kb.add(grid.NO_POTION | grid.NO_POWER_UP, ap)
+
+    def set_visited_cell(self):
+        """set_visited_cell/0"""
+        self.kb.add(grid.VISITED, self.agent)
+        self.last_position = self.agent
+
+    def learn_no_pit(self, p: Pos):
+        """learn(no_pit, P)"""
+        self.kb.remove_possible(grid.POSSIBLE_PIT, p)
+        self.kb.add(grid.NO_PIT, p)
+
+    def learn_no_teleporter(self, p: Pos):
+        """learn(no_teleporter, P)"""
+        self.kb.remove_possible(grid.POSSIBLE_TELEPORTER, p)
+        self.kb.remove(grid.TELEPORTER, p)
+        self.kb.add(grid.NO_TELEPORTER, p)
+
+    def learn_blocked(self, p: Pos):
+        """learn(blocked, P)"""
+        self.kb.remove(grid.SAFE, p)
+        self.kb.set_blocked(p)
+        self.kb.mark_dirty(p)
+
+    # Update goal
+    # -----------
+
+    def set_goal(self, goal: GoalTerm):
+        self.goal = goal
+
+    def update_goal(self) -> typing.Optional[GoalTerm]:
+        """update_goal/1"""
+        if self.goal is not None:
+            new = self._update_goal(self.goal)
+            if new is not None:
+                return new
+        return self._update_goal(NONE)
+
+    def _update_goal(self, curr: GoalTerm) -> typing.Optional[GoalTerm]:
+        """update_goal/2, one `if` per clause. Clauses that fail halfway keep their side effects."""
+        kind = curr[0]
+
+        if self.got_hit and self.update_flee_mode_next_position():
+            self.set_goal(FLEE)
+            self.reset_flee_mode()
+            return FLEE
+
+        if kind == 'flee' and self.flee_mode_count > FLEE_MODE_LIMIT:
+            self.reset_flee_mode()
+            new = self._update_goal(NONE)
+            if new is not None:
+                return new
+
+        if kind == 'flee' and self.flee_mode_count <= FLEE_MODE_LIMIT:
+            self.flee_mode_count += 1
+            if self.update_flee_mode_next_position():
+                return FLEE
+
+        if kind == 'find_enemy' and self.last_saw_enemy is not None and self.last_saw_enemy[1] > FIND_MODE_LIMIT:
+            self.goal = None
+            self.exit_find_mode()
+            new = self._update_goal(NONE)
+            if new is not None:
+                return new
+
+        if self.last_saw_enemy is not None and self.last_saw_enemy[1] <= FIND_MODE_LIMIT:
+            enemy_pos, rounds = self.last_saw_enemy
+            self.last_saw_enemy = (enemy_pos, rounds + 1)
+            self.set_goal(FIND_ENEMY)
+            return FIND_ENEMY
+
+        if kind == 'reach' and (not self.kb.valid(curr[1]) or self.kb.is_blocked(curr[1])):
+            self.goal = None
+            new = self._update_goal(NONE)
+            if new is not None:
+                return new
+
+        if kind == 'kill' and self.killed_enemy:
+            self.kill_mode_count = 0
+            self.goal = None
+            new = self._update_goal(NONE)
+            if new is not None and new != KILL:
+                return new
+
+        if kind == 'kill' and self.kill_mode_count >= KILL_MODE_LIMIT:
+            self.kill_mode_count = 0
+            self.goal = None
+            new = self._update_goal(NONE)
+            if new is not None:
+                return new
+
+        if kind == 'none':
+            new = self.ask_goal_kb()
+            if new is not None:
+                self.set_goal(new)
+                return new
+
+        if kind == 'reach' and self.agent == curr[1]:
+            self.goal = None
+            new = self._update_goal(NONE)
+            if new is not None:
+                return new
+
+        if kind == 'reach':
+            return curr
+
+        if kind == 'kill':
+            self.kill_mode_count += 1
+            return KILL
+
+        if kind == 'power_up':
+            if self.agent == curr[1] and self.kb.has(grid.NO_POWER_UP, curr[1]):
+                self.goal = None
+                new = self._update_goal(NONE)
+                if new is not None:
+                    return new
+            return ('pick_up', curr[1])
+
+        if kind == 'gold':
+            if self.agent == curr[1] and self.kb.has(grid.NO_GOLD, curr[1]):
+                self.goal = None
+                new = self._update_goal(NONE)
+                if new is not None:
+                    return new
+            return ('pick_up', curr[1])
+
+        return None
+
+    def ask_goal_kb(self) -> typing.Optional[GoalTerm]:
+        """ask_goal_KB/1"""
+        if self.heard_steps:
+            return KILL
+        pos = self.next_position_to_explore()
+        if pos is not None:
+            return ('reach', pos)
+        if self.get_health() <= 50 and len(self.potion) > 0:
+            return ('power_up', next(iter(self.potion)))
+        if len(self.glow) > 0:
+            return ('gold', next(iter(self.glow)))
+        if self.max_risk is not None:
+            pos = self.risky_position_to_explore()
+            if pos is not None:
+                return ('reach', pos)
+        return None
+
+    def next_position_to_explore(self) -> typing.Optional[Pos]:
+        """next_position_to_explore/1: BFS over safe cells up to the first one not visited yet.
+
+        The BFS is a flood fill over the bitboards (KnowledgeGrid.first_reached), skipped
+        altogether when the frontier is empty.
+        """
+        kb = self.kb
+        if not kb.has(grid.VISITED, self.agent):
+            return self.agent
+        frontier = kb.frontier()
+        if not frontier:
+            return None
+        return kb.first_reached(self.agent, grid.without(kb.boards[grid.SAFE], kb.blocked_board), frontier)
+
+    def risk(self, pos: Pos) -> float:
+        """Probability of a pit or a teleporter at pos (brain/hazard.py)."""
+        return self.hazard.risk(self.kb, pos)
+
+    def risky_position_to_explore(self) -> typing.Optional[Pos]:
+        """Least dangerous unknown cell next to the safe ones the agent can reach, the nearest
+        of them if several, unless its risk is over max_risk.
+
+        Not in pitfall.pl, where the agent has no goal once no safe cell is left to explore.
+        """
+        kb = self.kb
+        origin = kb.bit(self.agent)
+        passable = grid.without(kb.boards[grid.SAFE], kb.blocked_board) | origin
+        reached = origin
+        while True:
+            grown = kb.spread(reached) & passable
+            if grown == reached:
+                break
+            reached = grown
+        # Off-map bits of the spread are cut by unpack (guard column) or here (past the last row)
+        near = hazard.unpack(kb, kb.spread(reached) & ((1 << kb.stride * kb.height) - 1))
+        danger = self.hazard.update(kb).danger
+        candidates = near & (danger > 0) & (danger < 1) & (danger <= self.max_risk)
+        if not candidates.any():
+            return None
+        least = danger[candidates].min()
+        ys, xs = (candidates & (danger == least)).nonzero()
+        targets = kb.board(zip(xs.tolist(), ys.tolist()))
+        return kb.first_reached(self.agent, passable | targets, targets)
+
+    # Kill, find and flee modes
+    # -------------------------
+
+    def cell_at_direction(self, pos: Pos, dir: str, count: int) -> Pos:
+        for _ in range(count):
+            pos = adjacent(pos, dir)
+        return pos
+
+    def find_mode_update_search_pos(self):
+        """find_mode_update_search_pos/0"""
+        search_pos = self.find_mode_search_pos
+        reached = search_pos is not None and self.agent == search_pos and self.facing == self.find_mode_dir
+        if reached:
+            pos = self.find_mode_get_search_pos()
+            if pos is not None:
+                self.find_mode_search_pos = pos
+                return
+        if search_pos is None:
+            pos = self.find_mode_get_search_pos()
+            if pos is not None:
+                self.find_mode_search_pos = pos
+                return
+        if reached:
+            self.find_mode_search_pos = None
+
+    def find_mode_get_search_pos(self) -> typing.Optional[Pos]:
+        """find_mode_get_search_pos/1"""
+        if self.last_saw_enemy is None or self.find_mode_dir is None:
+            return None
+        rounds = self.last_saw_enemy[1]
+        for dist in range(rounds // 2, rounds + 1):
+            for dir in (CLOCKWISE[self.find_mode_dir], ANTICLOCKWISE[self.find_mode_dir]):
+                pos = self.cell_at_direction(self.agent, dir, dist)
+                if pos == self.find_mode_search_pos:
+                    continue
+                if not self.kb.valid(pos) or self.kb.is_blocked(pos) or pos == self.agent:
+                    continue
+                if self.next_action(('reach', pos)) is not None:
+                    return pos
+        return None
+
+    def exit_find_mode(self):
+        self.find_mode_dir = None
+        self.last_saw_enemy = None
+        self.find_mode_search_pos = None
+
+    def reset_flee_mode(self):
+        self.flee_level = FLEE_LEVEL_START
+        self.flee_mode_count = 0
+        self.flee_mode_next_position = None
+        self.got_hit = False
+
+    def update_flee_mode_next_position(self) -> bool:
+        """update_flee_mode_next_position/0"""
+        if self.flee_mode_next_position is None:
+            pos = self.get_flee_mode_next_position()
+            if pos is None:
+                return False
+            self.flee_mode_next_position = pos
+            logging.root.debug(f'Flee to {pos}')
+            return True
+        if self.agent == self.flee_mode_next_position:
+            pos = self.get_flee_mode_next_position()
+            if pos is not None:
+                self.flee_mode_next_position = pos
+                self.flee_level += 1
+        return True
+
+    def get_flee_mode_next_position(self) -> typing.Optional[Pos]:
+        """get_flee_mode_next_position/1"""
+        if self.flee_level is None:
+            return None
+        if self.flee_level == 1:
+            delta_x, delta_y = 1, 1
+        else:
+            delta_x = random.randrange(1, self.flee_level)
+            delta_y = random.randrange(1, self.flee_level)
+        # random(0, 1, R) in pitfall.pl, so always -1
+        dir_x = random.randrange(0, 1) * 2 - 1
+        dir_y = random.randrange(0, 1) * 2 - 1
+        x, y = self.agent
+        return x + dir_x * delta_x, y + dir_y * delta_y
+
+    # Actions
+    # -------
+
+    def next_action(self, goal: GoalTerm) -> typing.Optional[str]:
+        """next_action/2"""
+        kind = goal[0]
+        ap = self.agent
+
+        if self.kb.has(grid.GOLD, ap):
+            return 'pick_up'
+
+        if kind == 'reach':
+            pos = goal[1]
+            if adjacent(ap, self.facing) == pos:
+                return 'move_forward'
+            if adjacent(ap, CLOCKWISE[self.facing]) == pos:
+                return 'turn_clockwise'
+            if any(adjacent(ap, dir) == pos for dir, _ in grid.ADJACENT):
+                return 'turn_anticlockwise'
+            step = self.planned_step(ap, pos)
+            if step is not None:
+                return self.next_action(('reach', step))
+            return None
+
+        if kind == 'kill':
+            return 'turn_clockwise'
+
+        if kind == 'find_enemy':
+            if self.last_saw_enemy is not None and self.last_saw_enemy[1] == 1:
+                return 'shoot'
+            self.find_mode_update_search_pos()
+            pos = self.find_mode_search_pos
+            if pos is not None and ap == pos and self.find_mode_dir is not None:
+                action = self.next_action(('reach', adjacent(pos, self.find_mode_dir)))
+                if action is not None:
+                    return action
+            if pos is not None:
+                action = self.next_action(('reach', pos))
+                if action is not None:
+                    return action
+            logging.root.debug('gave_up_on_enemy')
+            self.exit_find_mode()
+            self.goal = None
+            return 'shoot'
+
+        if kind == 'flee':
+            if self.flee_mode_next_position is not None:
+                action = self.next_action(('reach', self.flee_mode_next_position))
+                if action is not None:
+                    return action
+            logging.root.debug('gave_up_on_fleeing')
+            self.goal = None
+            self.reset_flee_mode()
+            return 'turn_clockwise'
+
+        if kind in ('power_up', 'gold'):
+            pos = goal[1]
+            seen, not_seen = (grid.POTION, grid.NO_POTION) if kind == 'power_up' else (grid.GLOW, grid.NO_GLOW)
+            if ap == pos and self.kb.has(seen, pos):
+                return 'pick_up'
+            if ap == pos:
+                self.goal = None
+                self.kb.add(not_seen, pos)
+                return 'pick_up'
+            return self.next_action(('reach', pos))
+
+        return None
+
+    def planned_step(self, origin: Pos, goal: Pos) -> typing.Optional[Pos]:
+        """planned_step/3: next cell towards goal, searching with a_star/5 only when needed.
+
+        The path found on an earlier tick is followed while the map has not changed
+        (same kb version) and the agent is still on it.
+        """
+        version = self.kb.version
+        plan = self.plans.get(goal)
+        if plan is not None and plan[0] == version:
+            path = plan[1]
+            if path and path[-1] == origin:
+                path.pop()
+            if path and any(adjacent(origin, dir) == path[-1] for dir, _ in grid.ADJACENT):
+                return path[-1]
+
+        path = self.a_star(origin, goal)
+        # Plans from older versions are out of date for every goal
+        self.plans = {g: p for g, p in self.plans.items() if p[0] == version and g != goal}
+        if not path:
+            return None
+        path.reverse()
+        self.plans[goal] = (version, path)
+        return path[-1]
+
+    def a_star(self, origin: Pos, goal: Pos) -> typing.Optional[typing.List[Pos]]:
+        """a_star/5 with a_star_heuristic/3 and a_star_extend/3, path excluding the origin.
+
+        Like the Prolog version, the search gives up when it pops a cell with no way out.
+        """
+        kb = self.kb
+
+        def h(p: Pos) -> int:
+            return abs(goal[1] - p[1]) + abs(goal[0] - p[0])
+
+        counter = 0
+        queue = [(h(origin), counter, 0, origin)]
+        came_from: typing.Dict[Pos, typing.Optional[Pos]] = {origin: None}
+        while queue:
+            _, _, cost, pos = heapq.heappop(queue)
+            if pos == goal:
+                path = []
+                while came_from[pos] is not None:
+                    path.append(pos)
+                    pos = came_from[pos]
+                path.reverse()
+                return path
+            nexts = sorted(
+                n for n in kb.neighbours(pos)
+                if not kb.is_blocked(n) and (n == goal or kb.has(grid.SAFE, n))
+            )
+            if len(nexts) == 0:
+                return None
+            for n in nexts:
+                if n not in came_from:
+                    came_from[n] = pos
+                    counter += 1
+                    heapq.heappush(queue, (cost + 1 + h(n), counter, cost + 1, n))
+        return None
+
+    # Helpers
+    # -------
+
+    def to_goal(self, goal: GoalTerm) -> Goal:
+        if len(goal) > 1:
+            return Goal(goal[0], Position(*goal[1]))
+        return Goal(goal[0], None)
+
+    def render(self) -> str:
+        """Same map as print_cave/0."""
+        kb = self.kb
+        steps_around = set(kb.neighbours(self.agent)) if self.heard_steps else set()
+        enemy_pos = self.last_saw_enemy[0] if self.last_saw_enemy is not None else None
+        agent_glyph = {'north': '^', 'east': '>', 'west': '<', 'south': 'v'}
+        lines = []
+        for y in range(self.height):
+            cells = []
+            for x in range(self.width):
+                p = (x, y)
+                if p == self.agent and self.facing in agent_glyph:
+                    c = f'\033[48;5;35m{agent_glyph[self.facing]}\033[0m'
+                elif kb.is_blocked(p):
+                    c = '\033[48;5;231m\033[38;5;0mB\033[0m'
+                elif p == enemy_pos:
+                    c = '\033[48;5;208m?\033[0m'
+                elif p == self.find_mode_search_pos:
+                    c = '\033[48;5;208mf\033[0m'
+                elif kb.has(grid.VISITED, p):
+                    c = '\033[48;5;231m\033[38;5;0m.\033[0m'
+                elif kb.has(grid.SAFE, p):
+                    c = '\033[48;5;231m\033[38;5;0mS\033[0m'
+                elif kb.has(grid.PIT, p):
+                    c = '\033[48;5;238mP\033[0m'
+                elif kb.has(grid.TELEPORTER, p):
+                    c = '\033[48;5;26mT\033[0m'
+                elif kb.has(grid.GOLD | grid.POWER_UP, p):
+                    c = '\033[48;5;220mO\033[0m'
+                elif kb.is_possible(grid.POSSIBLE_PIT, p) and kb.is_possible(grid.POSSIBLE_TELEPORTER, p):
+                    c = '+'
+                elif kb.is_possible(grid.POSSIBLE_PIT, p):
+                    c = '\033[48;5;238mp\033[0m'
+                elif p in steps_around:
+                    c = '\033[48;5;208md\033[0m'
+                elif kb.is_possible(grid.POSSIBLE_TELEPORTER, p):
+                    c = '\033[48;5;26mt\033[0m'
+                else:
+                    c = '\033[48;5;0m\033[38;5;0m?\033[0m'
+                cells.append(c + ' ')
+            lines.append(''.join(cells) + '\n')
+        return ''.join(lines)
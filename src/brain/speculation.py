@@ -0,0 +1,117 @@
+"""speculation.py: The next decision, worked out while the replies to the last one are on their way.
+
+Once an action is sent, GameAI predicts the status and observations it will lead to
+(predict()) and a Speculation runs the brain's tick on them, on a fork of the brain
+(brain.fork()), on a thread of its own. When the replies arrive the decision uses the
+speculative result if the real inputs are the predicted ones (a fork fed the same inputs
+decides the same), adopting the fork as its brain; otherwise the fork is thrown away and
+the real brain, which was never touched, decides as usual. So it does too if the
+speculative tick failed.
+"""
+
+import concurrent.futures
+import logging
+import threading
+import typing
+
+from brain.types import Sensors
+
+# (x, y, dir, energy, score, sensor atoms, enemy distance, got hit)
+Inputs = typing.Tuple[int, int, str, int, int, typing.Tuple[str, ...], typing.Optional[int], bool]
+
+DELTAS = {'north': (0, -1), 'east': (1, 0), 'south': (0, 1), 'west': (-1, 0)}
+CLOCKWISE = {'north': 'east', 'east': 'south', 'south': 'west', 'west': 'north'}
+ANTICLOCKWISE = {v: k for k, v in CLOCKWISE.items()}
+
+# Score each action costs (the server's rules), 1 for the others
+ACTION_COSTS = {'shoot': 10, 'pick_up': 5}
+
+
+def inputs(x: int, y: int, dir: str, energy: int, score: int, sensors: Sensors,
+           enemy_distance: typing.Optional[int], got_hit: bool) -> Inputs:
+    """Decision inputs in comparable form."""
+    return (x, y, dir, energy, score, sensors.atoms(), enemy_distance, got_hit)
+
+
+def predict(action: typing.Optional[str], x: int, y: int, dir: str, energy: int, score: int,
+            cell_sensors: typing.Dict[typing.Tuple[int, int], Sensors]) -> typing.Tuple[Inputs, Sensors]:
+    """Inputs of the next decision if `action` works and nothing else happens.
+
+    Moves change the cell and turns the facing, and every action costs its score. The
+    observations are the last ones made on the cell (nothing, on a cell never visited)
+    but for the impact, only felt right after bumping into a wall; no enemy, hit or damage.
+    """
+    if action == 'move_forward':
+        dx, dy = DELTAS[dir]
+        x, y = x + dx, y + dy
+    elif action == 'move_backwards':
+        dx, dy = DELTAS[dir]
+        x, y = x - dx, y - dy
+    elif action == 'turn_clockwise':
+        dir = CLOCKWISE[dir]
+    elif action == 'turn_anticlockwise':
+        dir = ANTICLOCKWISE[dir]
+    if action is not None:
+        score -= ACTION_COSTS.get(action, 1)
+    seen = cell_sensors.get((x, y), Sensors())
+    sensors = Sensors(seen.steps, seen.breeze, seen.flash, seen.glow, False, seen.scream, seen.potion)
+    return inputs(x, y, dir, energy, score, sensors, None, False), sensors
+
+
+class Speculation():
+
+    def __init__(self, brain, predicted: Inputs, sensors: Sensors) -> None:
+        self.predicted = predicted
+        # Result: (fork, action), or None if the brain could not be forked
+        self.future = concurrent.futures.Future()
+        # Set once the real brain is free again (forked)
+        self.forked = threading.Event()
+        self.discarded = False
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, args=(brain, sensors), name='speculation', daemon=True).start()
+
+    def run(self, brain, sensors: Sensors) -> None:
+        try:
+            fork = brain.fork()
+        except Exception as ex:
+            logging.root.debug(f'Cannot fork the brain: {ex!r}')
+            fork = None
+        if fork is None:
+            self.future.set_result(None)
+        self.forked.set()
+        if fork is None:
+            return
+
+        x, y, dir, energy, score, _, _, _ = self.predicted
+        try:
+            action = fork.tick(x, y, dir, energy, score, sensors, None)
+        except Exception as ex:
+            fork.close()
+            self.future.set_exception(ex)
+            return
+        with self.lock:
+            if self.discarded:
+                fork.close()
+            else:
+                self.future.set_result((fork, action))
+
+    def take(self, actual: Inputs) -> typing.Optional[concurrent.futures.Future]:
+        """The speculative result if actual are the predicted inputs, else None (and it is discarded).
+
+        Returns once the real brain is free to use. The future may still fail afterwards
+        (its fork closed already), see GameAI.think().
+        """
+        self.forked.wait()
+        if self.future.done() and self.future.exception() is not None:
+            logging.root.debug(f'Speculative decision failed: {self.future.exception()!r}')
+        elif actual == self.predicted and not (self.future.done() and self.future.result() is None):
+            return self.future
+        self.discard()
+        return None
+
+    def discard(self) -> None:
+        self.forked.wait()
+        with self.lock:
+            self.discarded = True
+            if self.future.done() and self.future.exception() is None and self.future.result() is not None:
+                self.future.result()[0].close()
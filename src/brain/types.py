@@ -0,0 +1,101 @@
+"""types.py: Values exchanged between GameAI and the decision engines."""
+
+import typing
+import re
+
+class Sensors:
+    
+    def __init__(
+        self, steps: bool = False, breeze: bool = False, flash: bool = False,
+        glow: bool = False, impact: bool = False, scream: bool = False, potion: bool = False,
+    ) -> None:
+        self.steps = steps
+        self.breeze = breeze
+        self.flash = flash
+        self.glow = glow
+        self.impact = impact
+        self.scream = scream
+        self.potion = potion
+    
+    @staticmethod
+    def from_dict(values: typing.Dict[str, str]) -> 'Sensors':
+        steps = values['Steps'] == 'steps'
+        breeze = values['Breeze'] == 'breeze'
+        flash = values['Flash'] == 'flash'
+        glow = values['Glow'] == 'glow'
+        impact = values['Impact'] == 'impact'
+        scream = values['Scream'] == 'scream'
+        potion = values['Potion'] == 'potion'
+        return Sensors(steps, breeze, flash, glow, impact, scream, potion)
+    
+    @staticmethod
+    def from_atoms(atoms: typing.Sequence[str]) -> 'Sensors':
+        return Sensors(*[not atom.startswith('no_') for atom in atoms])
+
+    def atoms(self) -> typing.Tuple[str, ...]:
+        """(steps, no_breeze, ...), as sense/1 and learn/3 take them."""
+        sensors = ['steps', 'breeze', 'flash', 'glow', 'impact', 'scream', 'potion']
+        for i, sensor in enumerate(sensors):
+            if self.__getattribute__(sensor):
+                continue
+            sensors[i] = 'no_' + sensor
+        return tuple(sensors)
+
+    def __repr__(self) -> str:
+        return f'({", ".join(self.atoms())})'
+
+class Position:
+
+    def __init__(self, x: int, y: int) -> None:
+        self.x = x
+        self.y = y
+    
+    def __repr__(self) -> str:
+        return f'{self.x}, {self.y}'
+
+class Goal:
+
+    def __init__(self, type: str, value: typing.Optional[Position]) -> None:
+        self.type = type
+        self.value = value
+    
+    @staticmethod
+    def from_str(value: str) -> 'Goal':
+        re_match = re.match(r'([^(]+)', value)
+        type = re_match.group(1)
+        re_match = re.match(r'([^(]+)\(,\((\d+), ?(\d+)\)\)', value)
+        if re_match is None:
+            # No associated value
+            return Goal(type, None)
+        x = re_match.group(2)
+        y = re_match.group(3)
+        return Goal(type, Position(x, y))
+    
+    def __repr__(self) -> str:
+        s = f'{self.type}'
+        if self.value is not None:
+            s += f'({self.value})'
+        return s
+
+class Action:
+
+    def __init__(self, action: str) -> None:
+        self.action = action
+    
+    @staticmethod
+    def from_str(value: str) -> 'Action':
+        return Action(value)
+    
+    def __repr__(self) -> str:
+        return self.action
+    
+class Inventory:
+
+    def __init__(self, ammo: int, power_ups: int, gold: int) -> None:
+        self.ammo = ammo
+        self.power_ups = power_ups
+        self.gold = gold
+    
+
+class AgentDeadError(Exception):
+    pass
@@ -0,0 +1,63 @@
+"""viewer.py: On-demand rendering of the agent's map, off the decision thread.
+
+Drawing the map used to happen inside every decision. A MapViewer only asks the brain
+for a snapshot when a map is due (at most once every `interval` seconds), and renders and
+writes it on its own thread, so the decision thread pays for the snapshot alone. A brain
+that cannot be read from another thread draws the map itself and hands over a Rendered.
+"""
+
+import logging
+import sys
+import threading
+import time
+import typing
+
+
+class Rendered():
+    """Snapshot of a map drawn already."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def render(self) -> str:
+        return self.text
+
+
+class MapViewer():
+
+    def __init__(self, interval: float = 1.0, write: typing.Callable[[str], typing.Any] = sys.stdout.write) -> None:
+        self.interval = interval
+        self.write = write
+        self.last = float('-inf')
+        self.pending = None
+        self.ready = threading.Event()
+        self.thread: typing.Optional[threading.Thread] = None
+
+    def due(self) -> bool:
+        return self.pending is None and time.monotonic() - self.last >= self.interval
+
+    def request(self, brain) -> None:
+        """Queue a map of the brain's current state, unless one was drawn too recently.
+
+        brain.snapshot() may give None, for no map this time.
+        """
+        if not self.due():
+            return
+        self.last = time.monotonic()
+        self.pending = brain.snapshot()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='map-viewer', daemon=True)
+            self.thread.start()
+        self.ready.set()
+
+    def run(self) -> None:
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            snapshot, self.pending = self.pending, None
+            if snapshot is None:
+                continue
+            try:
+                self.write(snapshot.render())
+            except Exception as ex:
+                logging.root.debug(f'Map rendering failed: {ex}')
@@ -0,0 +1 @@
+"""Lets pytest, run from anywhere, import the modules in src/ as Program.py does."""
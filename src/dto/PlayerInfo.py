@@ -68,3 +68,13 @@ class PlayerInfo():
         self.dir: Direction = dir
         self.state: State = state
         self.color = color
+
+    # Refresh this player from a new player line, in place
+    #################################
+    def update(self, name: str, x: int, y: int, dir: int, state: int, color: typing.Tuple[int, int, int]):
+        self.name = name
+        self.x = x
+        self.y = y
+        self.dir = dir
+        self.state = state
+        self.color = color
@@ -66,3 +66,14 @@ class ScoreBoard():
         self.energy = energy
         self.color = color
 
+
+    # <summary>
+    # Refresh this entry from a new scoreboard, in place
+    # </summary>
+    def update(self, name: str, connected: bool, score: int, energy: int, color: typing.Tuple[int, int, int]):
+        self.name = name
+        self.connected = connected
+        self.score = score
+        self.energy = energy
+        self.color = color
+
@@ -0,0 +1,192 @@
+"""metrics.py: Fixed-memory latency histograms and counters, served in Prometheus text format.
+
+Instrumented code checks `metrics.enabled` before doing anything else, so with metrics
+off (the default) a probe costs one attribute lookup:
+
+    if metrics.enabled:
+        REPLY_SECONDS.labels('s').observe(rtt)
+
+serve(port) turns them on and answers GET /metrics on 127.0.0.1:port from a daemon thread.
+Histograms have a fixed set of buckets, so memory does not grow with the number of samples.
+"""
+
+import bisect
+import http.server
+import threading
+import typing
+
+# Off until serve() or enable() is called
+enabled = False
+
+# Seconds, from 50 us to 2.5 s: decisions, queries and server round trips all fit
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Counts, e.g. lines handled per read
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def format_labels(names: typing.Sequence[str], values: typing.Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram():
+    """Cumulative bucket counts, sum and count of one label set."""
+
+    def __init__(self, bounds: typing.Sequence[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name: str, label_names: typing.Sequence[str], label_values: typing.Sequence[str]) -> typing.List[str]:
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.bounds, counts):
+            cumulative += n
+            le = 'le="%g"' % bound
+            lines.append(f'{name}_bucket{format_labels(label_names, label_values, le)} {cumulative}')
+        le = 'le="+Inf"'
+        lines.append(f'{name}_bucket{format_labels(label_names, label_values, le)} {count}')
+        lines.append(f'{name}_sum{format_labels(label_names, label_values)} {total:.9g}')
+        lines.append(f'{name}_count{format_labels(label_names, label_values)} {count}')
+        return lines
+
+
+class Counter():
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def render(self, name: str, label_names: typing.Sequence[str], label_values: typing.Sequence[str]) -> typing.List[str]:
+        return [f'{name}{format_labels(label_names, label_values)} {self.value}']
+
+
+class Family():
+    """A metric and its children, one per combination of label values."""
+
+    def __init__(self, kind: str, name: str, help: str, label_names: typing.Sequence[str],
+                 factory: typing.Callable[[], typing.Any]) -> None:
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.factory = factory
+        self.children: typing.Dict[typing.Tuple[str, ...], typing.Any] = {}
+        self.lock = threading.Lock()
+        if len(self.label_names) == 0:
+            # Shown (as zero) before the first sample
+            self.labels()
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    # Unlabelled families are used directly
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def inc(self, amount: int = 1) -> None:
+        self.labels().inc(amount)
+
+    def render(self) -> typing.List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self.children.items()):
+            lines.extend(child.render(self.name, self.label_names, values))
+        return lines
+
+
+class Registry():
+
+    def __init__(self) -> None:
+        self.families: typing.Dict[str, Family] = {}
+        self.lock = threading.Lock()
+
+    def add(self, family: Family) -> Family:
+        with self.lock:
+            return self.families.setdefault(family.name, family)
+
+    def render(self) -> str:
+        with self.lock:
+            families = list(self.families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def histogram(name: str, help: str, labels: typing.Sequence[str] = (),
+              buckets: typing.Sequence[float] = LATENCY_BUCKETS) -> Family:
+    return REGISTRY.add(Family('histogram', name, help, labels, lambda: Histogram(buckets)))
+
+
+def counter(name: str, help: str, labels: typing.Sequence[str] = ()) -> Family:
+    return REGISTRY.add(Family('counter', name, help, labels, Counter))
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        pass
+
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+
+def serve(port: int, host: str = '127.0.0.1') -> http.server.ThreadingHTTPServer:
+    """Turn metrics on and serve them at http://host:port/metrics from a daemon thread."""
+    enable()
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+# Metrics of the bot, declared here so every module shares them
+REPLY_SECONDS = histogram('bot_reply_seconds', 'Time from the q/o request to its s/o reply', ['reply'])
+DECISION_SECONDS = histogram('bot_decision_seconds', 'Time in GameAI.GetDecision, brain call included')
+IDLE_DECISIONS = counter('bot_idle_decisions_total', 'Decisions that sent no action')
+DECISIONS = counter('bot_decisions_total', 'Decisions made')
+SPECULATIONS = counter('bot_speculations_total', 'Speculative decisions, by whether the replies confirmed them', ['outcome'])
+LATE_DECISIONS = counter('bot_late_decisions_total', 'Decisions that ran out of budget and sent the fallback action')
+RECEIVE_BACKLOG = histogram('client_receive_backlog_lines', 'Lines handled per read from the server socket',
+                            buckets=SIZE_BUCKETS)
+SEND_BACKLOG = histogram('client_send_backlog_commands', 'Commands waiting in the outgoing buffer or queue at each write',
+                         buckets=SIZE_BUCKETS)
+QUERY_SECONDS = histogram('prolog_query_seconds', 'Time per pitfall.pl predicate call (PrologQuery methods)', ['predicate'])
+LEARN_PHASE_SECONDS = histogram('brain_learn_phase_seconds', 'Time in each phase of learn/3', ['phase'])
@@ -6,6 +6,7 @@
 :- meta_predicate a_star(+, +, +, 3, 2, -).
 
 :- use_module(library(heaps)).
+:- use_module(library(assoc)).
 
 init(H, E) :-
     deinit,
@@ -40,6 +41,18 @@ get_from_queue(Queue, heap_element(AccCost,Position,Path), NewQueue) :-
 nodes_positions(Nodes, Positions) :-
     findall(P, member(node(P,_), Nodes), Positions).
 
+% Positions not visited yet, in order, and Visited with them added.
+% Visited is an assoc: O(log n) per position however large the map is
+new_positions([], Visited, Visited, []).
+new_positions([P|Ps], Visited, NewVisited, New) :-
+    (   get_assoc(P, Visited, _)
+    ->  Visited1 = Visited,
+        New = New1
+    ;   put_assoc(P, Visited, true, Visited1),
+        New = [P|New1]
+    ),
+    new_positions(Ps, Visited1, NewVisited, New1).
+
 
 % a_star/5
 % a_star(+Origin, +Goal, +Heuristic, +Expand, -Path)
@@ -49,8 +62,9 @@ a_star(Origin, Goal, Heuristic, Expand, Path) :-
     call(Heuristic, Origin, Goal, H),
     %                   heap_element(AccCost,Pos,Path)
     singleton_heap(Queue, H, heap_element(0,Origin,[])),
+    list_to_assoc([Origin-true], Visited),
     % Do the search
-    a_star(Queue, Goal, [Origin], Heuristic, Expand, node(Goal,Answer)),
+    a_star(Queue, Goal, Visited, Heuristic, Expand, node(Goal,Answer)),
     reverse(Answer, Path),
     deinit,
     !.
@@ -68,7 +82,7 @@ a_star(Queue, Goal, Visited, Heuristic, Expand, Result) :-
     ;   setof(node(Next,[Next|Path]), call(Expand, Goal, Position, Next), Nodes),
         % Exclude visited nodes
         nodes_positions(Nodes, ExpandedPositions),
-        ord_union(Visited, ExpandedPositions, NewVisited, NewPositions),
+        new_positions(ExpandedPositions, Visited, NewVisited, NewPositions),
         % Add new open nodes (with tag-along processes) to search heap
         queue_add_nodes(AccCost, RemainingQueue, NewPositions, Nodes, Goal, NewQueue),
         % Carry on searching
@@ -0,0 +1,128 @@
+"""engines.py: A bounded pool of SWI-Prolog engines, one per agent.
+
+PrologMT attaches a new engine to every thread that happens to run a query and never
+lets it go, so each receive thread and Timer thread ended up with an engine of its own.
+Here engines are created explicitly (PL_create_engine), at most `size` of them, and leased
+to agents. pitfall.pl keeps its knowledge base in thread_local predicates, which are
+private to each engine, so agents sharing the runtime do not see each other's facts.
+
+Whatever thread runs an agent's query switches to the agent's engine for the duration of
+the call (PL_set_engine) and back afterwards; no engine is attached per thread.
+"""
+
+import ctypes
+import threading
+import typing
+
+from pyswip import core
+
+_lib = core._lib
+
+PL_engine_t = ctypes.c_void_p
+
+PL_create_engine = _lib.PL_create_engine
+PL_create_engine.argtypes = [ctypes.c_void_p]
+PL_create_engine.restype = PL_engine_t
+
+PL_set_engine = _lib.PL_set_engine
+PL_set_engine.argtypes = [PL_engine_t, ctypes.POINTER(PL_engine_t)]
+PL_set_engine.restype = ctypes.c_int
+
+PL_destroy_engine = _lib.PL_destroy_engine
+PL_destroy_engine.argtypes = [PL_engine_t]
+PL_destroy_engine.restype = ctypes.c_int
+
+PL_ENGINE_SET = 0
+PL_ENGINE_INVAL = 2
+PL_ENGINE_INUSE = 3
+
+
+class EngineError(RuntimeError):
+    pass
+
+
+class Engine():
+    """One SWI-Prolog engine, used by one thread at a time."""
+
+    def __init__(self) -> None:
+        handle = PL_create_engine(None)
+        if not handle:
+            raise EngineError('PL_create_engine failed')
+        self.handle = PL_engine_t(handle)
+        self.lock = threading.RLock()
+        self.local = threading.local()
+
+    def __enter__(self) -> 'Engine':
+        """Switch the calling thread to this engine (nested uses are free)."""
+        self.lock.acquire()
+        depth = getattr(self.local, 'depth', 0)
+        if depth == 0:
+            old = PL_engine_t()
+            status = PL_set_engine(self.handle, ctypes.byref(old))
+            if status != PL_ENGINE_SET:
+                self.lock.release()
+                raise EngineError(f'PL_set_engine failed ({status})')
+            self.local.old = old
+        self.local.depth = depth + 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            # Back to the thread's own engine, or none
+            PL_set_engine(self.local.old, None)
+            self.local.old = None
+        self.lock.release()
+
+    def destroy(self) -> None:
+        with self.lock:
+            PL_destroy_engine(self.handle)
+            self.handle = None
+
+
+class EnginePool():
+    """At most `size` engines, created on demand and reused once released."""
+
+    def __init__(self, size: int = 16) -> None:
+        self.size = size
+        self.created = 0
+        self.idle: typing.List[Engine] = []
+        self.available = threading.Condition()
+
+    def acquire(self, timeout: typing.Optional[float] = None) -> Engine:
+        """An idle engine, a new one while under `size`, or wait for one to be released."""
+        with self.available:
+            while len(self.idle) == 0 and self.created >= self.size:
+                if not self.available.wait(timeout):
+                    raise EngineError(f'all {self.size} Prolog engines are in use')
+            if len(self.idle) > 0:
+                return self.idle.pop()
+            engine = Engine()
+            self.created += 1
+            return engine
+
+    def release(self, engine: Engine) -> None:
+        with self.available:
+            self.idle.append(engine)
+            self.available.notify()
+
+    def close(self) -> None:
+        """Destroy the idle engines."""
+        with self.available:
+            for engine in self.idle:
+                engine.destroy()
+            self.created -= len(self.idle)
+            self.idle.clear()
+
+
+_default: typing.Optional[EnginePool] = None
+_default_lock = threading.Lock()
+
+
+def default_pool() -> EnginePool:
+    """Process-wide pool PrologQuery leases from unless given another one."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = EnginePool()
+        return _default
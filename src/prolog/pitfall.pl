@@ -1,4 +1,4 @@
-% Labyrinth size: 59x34
+% Labyrinth size: 60x35 by default, see set_map_size/2
 % Agent's initial energy: 100
 % Enemies' initial energy: 100
 % Ammo damage: 10
@@ -13,8 +13,19 @@
     facing/1,
     set_agent_position/1,
     set_agent_facing/1,
+    set_map_size/2,
     sense_learn_act/2,
+    tick/8,
+    reset_kb/0,
+    export_kb/1,
+    import_kb/1,
+    enable_phase_timing/0,
+    take_phase_times/3,
+    start_profiling/0,
+    stop_profiling/0,
+    profile_rows/1,
     print_cave/0,
+    render_cave/1,
     disable_logging/0,
     enable_logging/0,
     force_update_position/1,
@@ -34,10 +45,12 @@
     set_got_hit/0
 ]).
 
+:- use_module(library(assoc)).
+:- use_module(library(statistics)).
 :- use_module(a_star).
 :- use_module(logging).
 
-:- dynamic([
+:- thread_local([
     world_position/2,
     world_count/2,
     possible_position/3,
@@ -59,12 +72,22 @@
     blocked_position/1,
     last_saw_enemy/2,
     find_mode_search_pos/1,
+    find_mode_dir/1,
     flee_level/1,
     got_hit/0,
     flee_mode_count/1,
-    flee_mode_next_position/1
+    flee_mode_next_position/1,
+    kb_version/1,
+    planned_path/3,
+    explore_frontier/1,
+    dirty_cell/1,
+    last_phase_time/2,
+    map_size/2
 ]).
 
+% Process-wide switch, unlike the knowledge base above (see timed_phase/2)
+:- dynamic(phase_timing/0).
+
 :- enable_logging.
 
 % assert_new/1
@@ -76,13 +99,57 @@ assert_new(Term) :-
     !.
 assert_new(_).
 
-agent_position((1,1)).
-
-collected(gold_ring, 0).
-collected(gold_coin, 0).
-collected(power_up_10, 0).
-collected(power_up_20, 0).
-collected(power_up_50, 0).
+%
+% Knowledge base reset
+% --------------------
+% The knowledge base is thread_local: every Prolog engine (one per agent, see
+% prolog/engines.py) has its own, empty until reset_kb/0 fills it with the
+% initial_fact/1 clauses spread through this file. A new round does the same.
+
+:- discontiguous(initial_fact/1).
+
+:- initialization(reset_kb).
+
+initial_fact(agent_position((1,1))).
+
+initial_fact(kb_version(0)).
+
+initial_fact(collected(gold_ring, 0)).
+initial_fact(collected(gold_coin, 0)).
+initial_fact(collected(power_up_10, 0)).
+initial_fact(collected(power_up_20, 0)).
+initial_fact(collected(power_up_50, 0)).
+
+% kb_dynamic_predicate/1
+% kb_dynamic_predicate(-Head)
+% Most general Head of each knowledge base predicate of this module
+kb_dynamic_predicate(Head) :-
+    predicate_property(pitfall:Head, thread_local),
+    predicate_property(pitfall:Head, implementation_module(pitfall)).
+
+% reset_kb/0
+% Empties this engine's knowledge base and asserts the initial facts
+reset_kb :-
+    forall(kb_dynamic_predicate(Head), retractall(Head)),
+    forall(initial_fact(Fact), assertz(Fact)).
+
+% export_kb/1
+% export_kb(-Key)
+% Records a copy of this engine's knowledge base (recorded/3 is shared by all engines)
+% under a new integer Key, for import_kb/1 in another engine (PrologQuery.fork())
+export_kb(Key) :-
+    findall(Fact, (kb_dynamic_predicate(Fact), call(Fact)), Facts),
+    flag(pitfall_kb_export, Key, Key + 1),
+    recordz(pitfall_kb_export(Key), Facts).
+
+% import_kb/1
+% import_kb(+Key)
+% Replaces this engine's knowledge base with the copy exported under Key, which is erased
+import_kb(Key) :-
+    recorded(pitfall_kb_export(Key), Facts, Ref),
+    erase(Ref),
+    forall(kb_dynamic_predicate(Head), retractall(Head)),
+    forall(member(Fact, Facts), assertz(Fact)).
 
 %
 % World information
@@ -132,7 +199,7 @@ cell_at_direction(Pos, Dir, Count, Cell) :-
     cell_at_direction(NextPos, Dir, C, Cell),
     !.
 
-facing(east).
+initial_fact(facing(east)).
 
 dir(north).
 dir(east).
@@ -160,14 +227,32 @@ adjacent((X1, Y), (X2, Y), west) :-
 adjacent((X1, Y), (X2, Y), east) :-
     X2 is X1 + 1.
 
-minX(0). maxX(59).
-minY(0). maxY(34).
+% map_size/2
+% map_size(?Width, ?Height)
+% Cells are (0, 0) to (Width - 1, Height - 1). Only the bounds are stored: the knowledge
+% base holds facts about the cells met so far, so it grows with them, not with the map.
+initial_fact(map_size(60, 35)).
+
+% set_map_size/2
+% set_map_size(+Width, +Height)
+% Sets the bounds for this engine (e.g. from the config, or grown to fit a position the
+% server reported), dropping frontier cells left outside and invalidating planned paths
+set_map_size(Width, Height) :-
+    retractall(map_size(_, _)),
+    assertz(map_size(Width, Height)),
+    forall(
+        (explore_frontier(P), \+ valid_position(P)),
+        retractall(explore_frontier(P))
+    ),
+    bump_kb_version.
 
 % valid_position/1
 % valid_position(+Pos)
+% Bounds check with arithmetic, Pos is always bound (no between/3 to enumerate the map)
 valid_position((X, Y)) :-
-    minX(MinX), maxX(MaxX), between(MinX, MaxX, X),
-    minY(MinY), maxY(MaxY), between(MinY, MaxY, Y).
+    map_size(Width, Height),
+    X >= 0, X < Width,
+    Y >= 0, Y < Height.
 
 
 % Cave Elements
@@ -176,7 +261,7 @@ valid_position((X, Y)) :-
 % world_position/2
 % world_position contains absolute world knowledge and should not be queried for decision making
 
-world_position(agent, (1, 1)).
+initial_fact(world_position(agent, (1, 1))).
 
 % Print cave for debugging
 
@@ -184,11 +269,17 @@ print_cave :-
     \+ logging:verbose,
     !.
 print_cave :-
-    minY(MinY), maxY(MaxY),
-    between(MinY, MaxY, Y),
-    print_cave_line(Y),
-    fail.
-print_cave.
+    render_cave(Text),
+    log('~w', [Text]).
+
+% render_cave/1
+% render_cave(-Text)
+% The cave as print_cave/0 draws it, whether logging is enabled or not
+render_cave(Text) :-
+    map_size(_, Height),
+    MaxY is Height - 1,
+    with_output_to(string(Text), forall(between(0, MaxY, Y), print_cave_line(Y))).
+
 % print_cave :-
 %     get_agent_health(H),
 %     get_game_score(S),
@@ -201,94 +292,99 @@ print_cave.
     %     [H, S, A, G, NP]
     % ).
 print_cave_line(Y) :-
-    minX(MinX), maxX(MaxX),
-    between(MinX, MaxX, X),
-    print_cave_cell(X, Y),
-    log(' '),
+    map_size(Width, _),
+    MaxX is Width - 1,
+    between(0, MaxX, X),
+    cave_cell(X, Y, Glyph),
+    format('~w ', [Glyph]),
     fail.
-print_cave_line(_) :- log('~n').
-print_cave_cell(X, Y) :-
+print_cave_line(_) :- nl.
+
+% cave_cell/3
+% cave_cell(+X, +Y, -Glyph)
+% How the cell is drawn, from what the agent knows about it
+cave_cell(X, Y, Glyph) :-
     world_position(agent, (X, Y)),
     facing(north),
-    log('\033[48;5;35m^\033[0m'),
+    Glyph = '\033[48;5;35m^\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     world_position(agent, (X, Y)),
     facing(east),
-    log('\033[48;5;35m>\033[0m'),
+    Glyph = '\033[48;5;35m>\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     world_position(agent, (X, Y)),
     facing(west),
-    log('\033[48;5;35m<\033[0m'),
+    Glyph = '\033[48;5;35m<\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     world_position(agent, (X, Y)),
     facing(south),
-    log('\033[48;5;35mv\033[0m'),
+    Glyph = '\033[48;5;35mv\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     blocked_position((X, Y)),
-    log('\033[48;5;231m\033[38;5;0mB\033[0m'),
+    Glyph = '\033[48;5;231m\033[38;5;0mB\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     last_saw_enemy((X,Y), _),
-    log('\033[48;5;208m?\033[0m'),
+    Glyph = '\033[48;5;208m?\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     find_mode_search_pos((X,Y)),
-    log('\033[48;5;208mf\033[0m'),
+    Glyph = '\033[48;5;208mf\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     certain(visited, (X,Y)),
-    log('\033[48;5;231m\033[38;5;0m.\033[0m'),
+    Glyph = '\033[48;5;231m\033[38;5;0m.\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     certain(safe, (X,Y)),
-    log('\033[48;5;231m\033[38;5;0mS\033[0m'),
+    Glyph = '\033[48;5;231m\033[38;5;0mS\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     certain(pit, (X,Y)),
-    log('\033[48;5;238mP\033[0m'),
+    Glyph = '\033[48;5;238mP\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     certain(teleporter, (X,Y)),
-    log('\033[48;5;26mT\033[0m'),
+    Glyph = '\033[48;5;26mT\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     certain(gold, (X,Y)),
-    log('\033[48;5;220mO\033[0m'),
+    Glyph = '\033[48;5;220mO\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     certain(power_up, (X,Y)),
-    log('\033[48;5;220mO\033[0m'),
+    Glyph = '\033[48;5;220mO\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     possible_position(pit, (X,Y), _),
     possible_position(teleporter, (X,Y), _),
-    log('+'),
+    Glyph = '+',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     possible_position(pit, (X,Y), _),
     possible_position(teleporter, (X,Y), _),
-    log('+'),
+    Glyph = '+',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     possible_position(pit, (X,Y), _),
-    log('\033[48;5;238mp\033[0m'),
+    Glyph = '\033[48;5;238mp\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     agent_position(AP),
     adjacent((X,Y), AP, _),
     heard_steps,
-    log('\033[48;5;208md\033[0m'),
+    Glyph = '\033[48;5;208md\033[0m',
     !.
-print_cave_cell(X, Y) :-
+cave_cell(X, Y, Glyph) :-
     possible_position(teleporter, (X,Y), _),
-    log('\033[48;5;26mt\033[0m'),
+    Glyph = '\033[48;5;26mt\033[0m',
     !.
-print_cave_cell(_, _) :-
-    log('\033[48;5;0m\033[38;5;0m?\033[0m'),
+cave_cell(_, _, Glyph) :-
+    Glyph = '\033[48;5;0m\033[38;5;0m?\033[0m',
     !.
 
 
@@ -476,6 +572,24 @@ sense_learn_act(Goal, Action) :-
     print_cave,
     log('Goal: ~w~nAction: ~w~n', [Goal, Action]).
 
+% tick/8
+% tick(+Pos, +Dir, +Health, +Score, +Observation, +EnemyDistance, -Goal, -Action)
+% Everything GameAI needs on a decision tick in a single call: sets the agent status and
+% last observation, then senses and learns. The cave is not printed here, see render_cave/1.
+% EnemyDistance is none when no enemy was seen since the last tick.
+tick(Pos, Dir, Health, Score, Observation, EnemyDistance, Goal, Action) :-
+    ignore(set_agent_position(Pos)),
+    ignore(set_agent_facing(Dir)),
+    ignore(update_agent_health(Health, 0)),
+    ignore(set_game_score(Score)),
+    ignore(set_last_observation(Observation)),
+    (   EnemyDistance == none
+    ->  true
+    ;   ignore(set_detected_enemy(EnemyDistance))
+    ),
+    sense(Sensors),
+    learn(Sensors, Goal, Action).
+
 % sense/1
 % sense(-Sensors)
 sense((Steps, Breeze, Flash, Glow, Impact, Scream, Potion)) :-
@@ -485,11 +599,91 @@ sense((Steps, Breeze, Flash, Glow, Impact, Scream, Potion)) :-
 % learn/3
 % learn(+Sensors, -Goal, -Action)
 learn(Sensors, Goal, Action) :-
-    update_knowledge(Sensors),
-    update_goal(Goal),
-    next_action(Goal, Action),
+    timed_phase(update_knowledge, update_knowledge(Sensors)),
+    timed_phase(update_goal, update_goal(Goal)),
+    timed_phase(next_action, next_action(Goal, Action)),
     set_last_action(Action).
 
+% Phase timing
+% ------------
+% Once enable_phase_timing/0 is called (by the metrics endpoint), learn/3 records how long
+% each of its phases took; take_phase_times/3 hands them over. Off, a phase costs one call.
+
+enable_phase_timing :-
+    phase_timing,
+    !.
+enable_phase_timing :-
+    assertz(phase_timing).
+
+% timed_phase/2
+% timed_phase(+Phase, :Goal)
+timed_phase(Phase, Goal) :-
+    phase_timing,
+    !,
+    get_time(T0),
+    call(Goal),
+    get_time(T1),
+    Seconds is T1 - T0,
+    retractall(last_phase_time(Phase, _)),
+    assertz(last_phase_time(Phase, Seconds)).
+timed_phase(_, Goal) :-
+    call(Goal).
+
+% take_phase_times/3
+% take_phase_times(-UpdateKnowledge, -UpdateGoal, -NextAction)
+% Seconds in each phase of the last learn/3, which are then forgotten
+take_phase_times(UpdateKnowledge, UpdateGoal, NextAction) :-
+    last_phase_time(update_knowledge, UpdateKnowledge),
+    last_phase_time(update_goal, UpdateGoal),
+    last_phase_time(next_action, NextAction),
+    retractall(last_phase_time(_, _)).
+
+% Profiling
+% ---------
+% SWI's sampling profiler, for PrologQuery.profile(). Once started it keeps counting in
+% this engine across queries (ticks) until stopped, so profile_rows/1 covers all of them.
+
+start_profiling :-
+    reset_profiler,
+    profiler(_, cputime).
+
+stop_profiling :-
+    profiler(_, false).
+
+% profile_rows/1
+% profile_rows(-Rows)
+% row(Predicate, Calls, Redos, SelfSeconds, InclusiveSeconds) for every predicate profiled,
+% Predicate being Module:Name/Arity as an atom. Inclusive time adds that of the callees.
+profile_rows(Rows) :-
+    profile_data(Data),
+    get_dict(summary, Data, Summary),
+    get_dict(ticks, Summary, Ticks),
+    get_dict(time, Summary, Time),
+    (   Ticks > 0
+    ->  TickSeconds is Time / Ticks
+    ;   TickSeconds = 0.0
+    ),
+    get_dict(nodes, Data, Nodes),
+    findall(row(Name, Calls, Redos, Self, Inclusive),
+            (   member(Node, Nodes),
+                get_dict(predicate, Node, PI),
+                format(atom(Name), '~q', [PI]),
+                node_count([call, ncalls], Node, Calls),
+                node_count([redo, nredo], Node, Redos),
+                get_dict(ticks_self, Node, SelfTicks),
+                get_dict(ticks_siblings, Node, CalleeTicks),
+                Self is float(SelfTicks * TickSeconds),
+                Inclusive is float((SelfTicks + CalleeTicks) * TickSeconds)
+            ),
+            Rows).
+
+% The port count keys differ between SWI-Prolog versions
+node_count(Keys, Node, Count) :-
+    member(Key, Keys),
+    get_dict(Key, Node, Count),
+    !.
+node_count(_, _, 0).
+
 
 % Sensors
 % -----
@@ -536,8 +730,10 @@ update_knowledge(Sensors) :-
     update_glow(Glow),
     update_potion(Potion),
     set_visited_cell,
-    infer_dangerous_positions,
-    infer_safe_positions.
+    mark_observed_cells_dirty,
+    take_dirty_cells(Cells),
+    infer_dangerous_positions(Cells),
+    infer_safe_positions(Cells).
 
 clear_transient_flags :-
     retractall(heard_steps),
@@ -546,6 +742,7 @@ clear_transient_flags :-
 set_visited_cell :-
     agent_position(AP),
     assert_new(certain(visited, AP)),
+    retractall(explore_frontier(AP)),
     set_last_position(AP),
     log('~t~2|visited: ~w~n', [AP]).
 
@@ -733,23 +930,89 @@ learn(safe, P) :-
     fail.
 learn(safe, P) :-
     assert_new(certain(safe, P)),
+    bump_kb_version,
+    update_explore_frontier(P),
     log('~t~2|safe: ~w~n', [P]).
+learn(blocked, P) :-
+    % Do nothing if already known to be blocked
+    blocked_position(P),
+    \+ certain(safe, P),
+    !.
 learn(blocked, P) :-
     retractall(certain(safe, P)),
-    assert_new(blocked_position(P)).
-
-
-% infer_dangerous_positions/0
+    assert_new(blocked_position(P)),
+    retractall(explore_frontier(P)),
+    mark_dirty(P),
+    bump_kb_version.
+
+% update_explore_frontier/1
+% update_explore_frontier(+Pos)
+% Keeps explore_frontier/1 as the set of safe cells not visited yet (and not blocked), i.e. the
+% cells next_position_to_explore/1 looks for.
+update_explore_frontier(P) :-
+    certain(safe, P),
+    \+ certain(visited, P),
+    \+ blocked_position(P),
+    !,
+    assert_new(explore_frontier(P)).
+update_explore_frontier(P) :-
+    retractall(explore_frontier(P)).
+
+% bump_kb_version/0
+% Marks the paths planned so far as out of date. Called whenever blocked_position/1 or
+% certain(safe, _) change, as those are the only facts a_star_extend/3 depends on.
+bump_kb_version :-
+    retract(kb_version(V)),
+    succ(V, NV),
+    assertz(kb_version(NV)).
+
+
+% mark_dirty/1
+% mark_dirty(+Pos)
+% Queues Pos for the next inference round. Conclusions about a hint cell only depend on
+% its own facts and on its neighbours being blocked or known clear, so only the cells
+% that changed since the last round and their neighbours have to be looked at again.
+mark_dirty(P) :-
+    assert_new(dirty_cell(P)).
+
+% mark_observed_cells_dirty/0
+% The observation of a tick only changes facts about the agent cell and its neighbours
+mark_observed_cells_dirty :-
+    agent_position(AP),
+    mark_dirty(AP),
+    forall(
+        (adjacent(AP, P, _), valid_position(P)),
+        mark_dirty(P)
+    ).
+
+% take_dirty_cells/1
+% take_dirty_cells(-Cells)
+% Gets the queued cells, emptying the queue
+take_dirty_cells(Cells) :-
+    findall(P, dirty_cell(P), Cells),
+    retractall(dirty_cell(_)).
+
+% infer_dangerous_positions/1
+% infer_dangerous_positions(+Cells)
 % Use current knowledge to consolidate possible positions of dangers into certainties.
-% Used for enemies, teleporters and pits.
+% Used for enemies, teleporters and pits. Only hint cells in or next to Cells are checked.
 % Eg. If there were steps at one cell with 4 neighbors and the agent is certain that 3
 % of those have no enemies, than the enemy has to be on the fourth one.
-infer_dangerous_positions :-
+infer_dangerous_positions(Cells) :-
+    % Hint cells whose neighbourhood may have changed
+    setof(HintPos, C^Dir^(
+        member(C, Cells),
+        (   HintPos = C
+        ;   adjacent(C, HintPos, Dir),
+            valid_position(HintPos)
+        )
+    ), HintCells),
     % For each danger trio (Hint, NotThere, There)
     % e.g. (steps, no_enemy, enemy) or (breeze, no_pit, pit)
     Dangers = [(breeze, no_pit, pit), (flash, no_teleporter, teleporter)],
     member((Hint, NotThere, There), Dangers),
     % For each known Hint (e.g. steps) location
+    member(Pos, HintCells),
     certain(Hint, Pos),
     % Get valid neighboring cells
     findall(MaybeDangerPos, (
@@ -776,15 +1039,18 @@ infer_dangerous_positions :-
     learn(There, DangerPos),
     % Backtrack
     fail.
-infer_dangerous_positions.
+infer_dangerous_positions(_).
 
-% infer_safe_positions/0
-infer_safe_positions :-
+% infer_safe_positions/1
+% infer_safe_positions(+Cells)
+% Only cells that changed can have become free of pits and teleporters
+infer_safe_positions(Cells) :-
+    member(Pos, Cells),
     certain(no_pit, Pos),
     certain(no_teleporter, Pos),
     learn(safe, Pos),
     fail.
-infer_safe_positions.
+infer_safe_positions(_).
 
 
 %
@@ -792,7 +1058,7 @@ infer_safe_positions.
 % ---------
 
 kill_mode_limit(6).
-kill_mode_count(0).
+initial_fact(kill_mode_count(0)).
 
 reset_kill_mode_count :-
     retractall(kill_mode_count(_)),
@@ -897,7 +1163,7 @@ set_got_hit :-
 
 flee_level_start(1).
 flee_mode_limit(20).
-flee_mode_count(0).
+initial_fact(flee_mode_count(0)).
 % flee_mode_next_position(Pos)
 
 reset_flee_mode :-
@@ -1119,38 +1385,59 @@ ask_goal_KB(gold(Pos)) :-
 
 % next_position_to_explore/1
 % next_position_to_explore(-Pos)
-% Gets the next position to try to reach when exploring the cave
-next_position_to_explore(Pos) :-
+% Gets the next position to try to reach when exploring the cave: the agent position if
+% not visited yet, else the first explore_frontier/1 cell found by a BFS over safe cells
+next_position_to_explore(AP) :-
     agent_position(AP),
-    next_position_to_explore([AP], [], Pos).
-
-% next_position_to_explore/3
-% next_position_to_explore(+Queue, +Explored, -Pos)
-% Expands neighbours in a BFS fashion until a safe unexplored position is found
-next_position_to_explore([], _, _) :- !, fail.
-next_position_to_explore([Pos | _], _, Pos) :-
-    % If the next in the queue has not been visited, pick it to explore
-    \+ certain(visited, Pos),
+    \+ certain(visited, AP),
     !.
-next_position_to_explore([Next | QueueTail], Explored, Pos) :-
-    setof(
-        Neighbour,
-        Dir^(
-            adjacent(Next, Neighbour, Dir),
-            valid_position(Neighbour),
-            \+ blocked_position(Neighbour),
-            certain(safe, Neighbour),
-            \+ member(Neighbour, Explored),
-            \+ member(Neighbour, QueueTail)
-        ),
-        QueueAdd
-    ),
-    append(QueueTail, QueueAdd, Queue),
+next_position_to_explore(_) :-
+    % Nothing left to explore, no need to search
+    \+ explore_frontier(_),
     !,
-    next_position_to_explore(Queue, [Next | Explored], Pos).
-next_position_to_explore([Failed | QueueTail], Explored, Pos) :-
+    fail.
+next_position_to_explore(Pos) :-
+    agent_position(AP),
+    list_to_assoc([AP-true], Seen),
+    next_position_to_explore([AP], [], Seen, Pos).
+
+% next_position_to_explore/4
+% next_position_to_explore(+Level, +NextLevel, +Seen, -Pos)
+% Expands neighbours in a BFS fashion, one level at a time, until a safe unexplored
+% position is found. NextLevel is kept reversed; Seen holds every cell ever queued.
+% As the queue is FIFO, the first unexplored cell queued is the first one dequeued, so
+% it is returned right away.
+next_position_to_explore([], [], _, _) :- !, fail.
+next_position_to_explore([], NextLevel, Seen, Pos) :-
     !,
-    next_position_to_explore(QueueTail, [Failed | Explored], Pos).
+    reverse(NextLevel, Level),
+    next_position_to_explore(Level, [], Seen, Pos).
+next_position_to_explore([Next | Level], NextLevel, Seen, Pos) :-
+    (   setof(
+            Neighbour,
+            Dir^(
+                adjacent(Next, Neighbour, Dir),
+                valid_position(Neighbour),
+                \+ blocked_position(Neighbour),
+                certain(safe, Neighbour),
+                \+ get_assoc(Neighbour, Seen, _)
+            ),
+            QueueAdd
+        )
+    ->  true
+    ;   QueueAdd = []
+    ),
+    (   member(Pos, QueueAdd),
+        \+ certain(visited, Pos)
+    ->  true
+    ;   foldl(mark_seen, QueueAdd, Seen, NewSeen),
+        reverse(QueueAdd, Added),
+        append(Added, NextLevel, NewNextLevel),
+        next_position_to_explore(Level, NewNextLevel, NewSeen, Pos)
+    ).
+
+mark_seen(Pos, Seen, NewSeen) :-
+    put_assoc(Pos, Seen, true, NewSeen).
 
 unknown(Pos) :-
     valid_position(Pos),
@@ -1213,7 +1500,7 @@ next_action(reach(Pos), Action) :-
     % If goal is to reach a position and the agent is not next to the position
     % try to reach an adjacent position
     agent_position(AP),
-    a_star(AP, Pos, a_star_heuristic, a_star_extend, [Next | _]),
+    planned_step(AP, Pos, Next),
     next_action(reach(Next), Action),
     !.
 next_action(kill, turn_clockwise).
@@ -1293,6 +1580,36 @@ next_action(gold(Pos), Action) :-
     next_action(reach(Pos), Action),
     !.
 
+% planned_step/3
+% planned_step(+Origin, +Goal, -Next)
+% Gets the Next cell on the way from Origin to Goal. The path planned on an earlier tick
+% is followed while the map is unchanged (same kb_version) and the agent is still on it;
+% otherwise a new one is searched with a_star/5.
+planned_step(Origin, Goal, Next) :-
+    kb_version(V),
+    planned_path(Goal, V, Path),
+    follow_path(Origin, Path, [Next | Rest]),
+    adjacent(Origin, Next, _),
+    retractall(planned_path(Goal, _, _)),
+    assertz(planned_path(Goal, V, [Next | Rest])),
+    !.
+planned_step(Origin, Goal, Next) :-
+    kb_version(V),
+    % Plans from older versions are out of date for every goal
+    forall(
+        (planned_path(G, OV, _), (G == Goal ; OV \== V)),
+        retractall(planned_path(G, OV, _))
+    ),
+    a_star(Origin, Goal, a_star_heuristic, a_star_extend, [Next | Rest]),
+    assertz(planned_path(Goal, V, [Next | Rest])),
+    !.
+
+% follow_path/3
+% follow_path(+Pos, +Path, -Remaining)
+% Drops the head of Path once the agent has reached it
+follow_path(Pos, [Pos | Rest], Rest) :- !.
+follow_path(_, Path, Path).
+
 % a_star_heuristic/3
 % a_star_heuristic(+Origin, +Goal, -EstCost)
 % Estimates the cost from Origin to Goal
@@ -0,0 +1,220 @@
+"""prepared.py: Calls into pitfall.pl without building and parsing query strings.
+
+A query string such as f'learn({sensors}, Goal, Action)' has to be read, parsed and
+compiled by SWI-Prolog on every call, and pyswip turns every binding back into a dict of
+strings. A PreparedQuery resolves its predicate handle once; each call puts the Python
+arguments straight into term references and converts only the output arguments, from the
+terms themselves.
+"""
+
+import ctypes
+import functools
+import logging
+import time
+import typing
+
+from pyswip import core
+
+from .multithreadprolog import PrologMT
+import metrics
+from brain.types import Sensors, Position, Goal, Action
+
+# Term references are not valid outside the call, so outputs are converted right away
+Converter = typing.Callable[[int], typing.Any]
+
+_functors: typing.Dict[typing.Tuple[str, int], int] = {}
+
+
+def functor(name: str, arity: int) -> int:
+    """Functor handle for name/arity, created once."""
+    key = (name, arity)
+    if key not in _functors:
+        _functors[key] = core.PL_new_functor(core.PL_new_atom(name), arity)
+    return _functors[key]
+
+
+def put_term(t: int, value: typing.Any) -> None:
+    """Put a Python value in term reference t.
+
+    int -> integer, str -> atom, tuple -> ','/2 chain (e.g. (X, Y) positions),
+    Sensors -> its seven atoms, None -> left as a fresh variable.
+    """
+    if value is None:
+        return
+    if isinstance(value, Sensors):
+        value = value.atoms()
+    if isinstance(value, bool):
+        raise TypeError('booleans have no Prolog counterpart here, use atoms')
+    if isinstance(value, int):
+        core.PL_put_integer(t, value)
+    elif isinstance(value, str):
+        core.PL_put_atom_chars(t, value)
+    elif isinstance(value, tuple):
+        if len(value) == 1:
+            put_term(t, value[0])
+            return
+        args = core.PL_new_term_refs(2)
+        put_term(args, value[0])
+        put_term(args + 1, value[1:])
+        core.PL_cons_functor_v(t, functor(',', 2), args)
+    else:
+        raise TypeError(f'cannot put {type(value).__name__} in a Prolog term')
+
+
+def name_arity(t: int) -> typing.Tuple[str, int]:
+    name = core.atom_t()
+    arity = ctypes.c_int()
+    if not core.PL_get_name_arity(t, ctypes.byref(name), ctypes.byref(arity)):
+        raise TypeError('not an atom or compound term')
+    return core.PL_atom_chars(name).decode(), arity.value
+
+
+def arg(index: int, t: int) -> int:
+    """Term reference to the index-th (1-based) argument of compound t."""
+    a = core.PL_new_term_ref()
+    core.PL_get_arg(index, t, a)
+    return a
+
+
+def to_int(t: int) -> int:
+    value = ctypes.c_long()
+    if not core.PL_get_long(t, ctypes.byref(value)):
+        raise TypeError('not an integer')
+    return value.value
+
+
+def to_float(t: int) -> float:
+    value = ctypes.c_double()
+    if not core.PL_get_float(t, ctypes.byref(value)):
+        raise TypeError('not a float')
+    return value.value
+
+
+def to_atom(t: int) -> str:
+    name, arity = name_arity(t)
+    if arity != 0:
+        raise TypeError('not an atom')
+    return name
+
+
+def to_text(t: int) -> str:
+    """String (or atom) contents."""
+    s = ctypes.c_char_p()
+    if not core.PL_get_chars(t, ctypes.byref(s), core.CVT_ATOM | core.CVT_STRING | core.REP_UTF8):
+        raise TypeError('not text')
+    return s.value.decode('utf-8')
+
+
+def to_list(convert: Converter) -> Converter:
+    """Converter for a proper list, converting each element with `convert`."""
+    def to_list_of(t: int) -> list:
+        items = []
+        tail = core.PL_copy_term_ref(t)
+        head = core.PL_new_term_ref()
+        while core.PL_get_list(tail, head, tail):
+            items.append(convert(head))
+        if not core.PL_get_nil(tail):
+            raise TypeError('not a list')
+        return items
+    return to_list_of
+
+
+def to_args(*converts: Converter) -> Converter:
+    """Converter for a compound term, e.g. row(A, B), to the tuple of its converted arguments."""
+    def to_tuple(t: int) -> tuple:
+        return tuple(convert(arg(i + 1, t)) for i, convert in enumerate(converts))
+    return to_tuple
+
+
+def to_position(t: int) -> Position:
+    """(X, Y)"""
+    return Position(to_int(arg(1, t)), to_int(arg(2, t)))
+
+
+def to_goal(t: int) -> Goal:
+    """Goal atom (kill, flee, ...) or Goal((X, Y))."""
+    name, arity = name_arity(t)
+    if arity == 0:
+        return Goal(name, None)
+    return Goal(name, to_position(arg(1, t)))
+
+
+def to_action(t: int) -> Action:
+    return Action(to_atom(t))
+
+
+def to_sensors(t: int) -> Sensors:
+    """(Steps, Breeze, Flash, Glow, Impact, Scream, Potion)"""
+    atoms = []
+    for _ in range(6):
+        atoms.append(to_atom(arg(1, t)))
+        t = arg(2, t)
+    atoms.append(to_atom(t))
+    return Sensors.from_atoms(atoms)
+
+
+class PreparedQuery():
+    """Deterministic call to Module:Name/Arity, inputs first and outputs last.
+
+    Calling it with the input values returns the converted outputs as a tuple (empty if
+    there are none), or None when the goal fails or raises. As a class attribute, it runs
+    in the `engine` (engines.py) of the instance it is looked up on, if that has one.
+    """
+
+    def __init__(self, name: str, inputs: int, outputs: typing.Sequence[Converter] = (),
+                 module: str = 'pitfall') -> None:
+        self.name = name
+        self.module = module
+        self.inputs = inputs
+        self.outputs = list(outputs)
+        self.arity = inputs + len(self.outputs)
+        self.predicate = None
+
+    def __get__(self, instance: typing.Any, owner: type) -> typing.Callable[..., typing.Optional[tuple]]:
+        engine = getattr(instance, 'engine', None)
+        if engine is None:
+            return self
+        return functools.partial(self.call_in, engine)
+
+    def call_in(self, engine, *args: typing.Any) -> typing.Optional[tuple]:
+        with engine:
+            return self(*args)
+
+    def __call__(self, *args: typing.Any) -> typing.Optional[tuple]:
+        if len(args) != self.inputs:
+            raise TypeError(f'{self} takes {self.inputs} inputs, got {len(args)}')
+        if metrics.enabled:
+            t0 = time.perf_counter()
+            try:
+                return self.call(args)
+            finally:
+                metrics.QUERY_SECONDS.labels(self.name).observe(time.perf_counter() - t0)
+        return self.call(args)
+
+    def call(self, args: typing.Sequence[typing.Any]) -> typing.Optional[tuple]:
+        PrologMT._init_prolog_thread()
+        if self.predicate is None:
+            self.predicate = core.PL_predicate(self.name, self.arity, self.module)
+
+        fid = core.PL_open_foreign_frame()
+        try:
+            t0 = core.PL_new_term_refs(self.arity) if self.arity > 0 else 0
+            for i, value in enumerate(args):
+                put_term(t0 + i, value)
+            qid = core.PL_open_query(None, core.PL_Q_NODEBUG | core.PL_Q_CATCH_EXCEPTION, self.predicate, t0)
+            try:
+                if not core.PL_next_solution(qid):
+                    if core.PL_exception(qid):
+                        logging.root.debug(f'{self} raised an exception')
+                    return None
+                return tuple(convert(t0 + self.inputs + i) for i, convert in enumerate(self.outputs))
+            finally:
+                core.PL_cut_query(qid)
+        except TypeError as ex:
+            logging.root.debug(f'{self}: {ex}')
+            return None
+        finally:
+            core.PL_discard_foreign_frame(fid)
+
+    def __repr__(self) -> str:
+        return f'{self.module}:{self.name}/{self.arity}'
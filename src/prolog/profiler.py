@@ -0,0 +1,66 @@
+"""profiler.py: Hot predicates of pitfall.pl, from SWI-Prolog's profiler, over many ticks.
+
+PrologQuery.profile() turns the profiler on in the agent's engine and, when the block
+ends, adds what it sampled to a Profile. One Profile can take any number of blocks (e.g.
+one per recorded game) and ranks the predicates by inclusive time:
+
+    profile = Profile()
+    with brain.profile(profile):
+        for ...:
+            brain.tick(...)
+    print(profile.table())
+"""
+
+import typing
+
+
+class ProfileRow():
+    """One predicate. Times in seconds; inclusive time adds that of its callees."""
+    __slots__ = ('predicate', 'calls', 'redos', 'self_seconds', 'inclusive_seconds')
+
+    def __init__(self, predicate: str, calls: int = 0, redos: int = 0,
+                 self_seconds: float = 0.0, inclusive_seconds: float = 0.0) -> None:
+        self.predicate = predicate
+        self.calls = calls
+        self.redos = redos
+        self.self_seconds = self_seconds
+        self.inclusive_seconds = inclusive_seconds
+
+
+class Profile():
+    """Profiler rows summed by predicate, with the ticks and inferences they cover."""
+
+    def __init__(self) -> None:
+        self.rows: typing.Dict[str, ProfileRow] = {}
+        self.ticks = 0
+        self.inferences = 0
+        self.seconds = 0.0
+
+    def add(self, rows: typing.Iterable[typing.Tuple[str, int, int, float, float]]) -> None:
+        """Rows of profile_rows/1: (predicate, calls, redos, self seconds, inclusive seconds)."""
+        for predicate, calls, redos, self_seconds, inclusive_seconds in rows:
+            row = self.rows.get(predicate)
+            if row is None:
+                row = self.rows[predicate] = ProfileRow(predicate)
+            row.calls += calls
+            row.redos += redos
+            row.self_seconds += self_seconds
+            row.inclusive_seconds += inclusive_seconds
+
+    def ranked(self) -> typing.List[ProfileRow]:
+        return sorted(self.rows.values(), key=lambda r: (r.inclusive_seconds, r.self_seconds, r.calls), reverse=True)
+
+    def table(self, limit: typing.Optional[int] = 30) -> str:
+        """The `limit` predicates with the most inclusive time (all with None)."""
+        ticks = max(self.ticks, 1)
+        lines = [
+            f'{self.ticks} ticks, {self.seconds:.3f} s, {self.inferences} inferences '
+            f'({self.inferences // ticks} per tick)',
+            f'{"predicate":<48}{"calls":>10}{"calls/tick":>12}{"redos":>9}{"self ms":>10}{"incl ms":>10}{"incl %":>8}',
+        ]
+        total = sum(r.self_seconds for r in self.rows.values()) or 1.0
+        for row in self.ranked()[:limit]:
+            lines.append(f'{row.predicate[:47]:<48}{row.calls:>10}{row.calls / ticks:>12.1f}{row.redos:>9}'
+                         f'{1000 * row.self_seconds:>10.1f}{1000 * row.inclusive_seconds:>10.1f}'
+                         f'{100 * row.inclusive_seconds / total:>8.1f}')
+        return '\n'.join(lines)
@@ -1,123 +1,125 @@
 # from pyswip import Prolog
 from .multithreadprolog import PrologMT as Prolog
+from .prepared import PreparedQuery, to_int, to_float, to_atom, to_text, to_list, to_args, to_goal, to_action, to_sensors
+from .profiler import Profile
+from .engines import EngineError, EnginePool, default_pool
+from brain import grid
+from brain.viewer import Rendered
+from brain.types import Sensors, Goal, Action, Inventory, AgentDeadError
+import contextlib
 import os
 import typing
-import re
 import logging
 import threading
-
-class Sensors:
-    
-    def __init__(
-        self, steps: bool = False, breeze: bool = False, flash: bool = False,
-        glow: bool = False, impact: bool = False, scream: bool = False, potion: bool = False,
-    ) -> None:
-        self.steps = steps
-        self.breeze = breeze
-        self.flash = flash
-        self.glow = glow
-        self.impact = impact
-        self.scream = scream
-        self.potion = potion
-    
-    @staticmethod
-    def from_dict(values: typing.Dict[str, str]) -> 'Sensors':
-        steps = values['Steps'] == 'steps'
-        breeze = values['Breeze'] == 'breeze'
-        flash = values['Flash'] == 'flash'
-        glow = values['Glow'] == 'glow'
-        impact = values['Impact'] == 'impact'
-        scream = values['Scream'] == 'scream'
-        potion = values['Potion'] == 'potion'
-        return Sensors(steps, breeze, flash, glow, impact, scream, potion)
-    
-    def __repr__(self) -> str:
-        sensors = ['steps', 'breeze', 'flash', 'glow', 'impact', 'scream', 'potion']
-        for i, sensor in enumerate(sensors):
-            if self.__getattribute__(sensor):
-                continue
-            sensors[i] = 'no_' + sensor
-        return f'({", ".join(sensors)})'
-
-class Position:
-
-    def __init__(self, x: int, y: int) -> None:
-        self.x = x
-        self.y = y
-    
-    def __repr__(self) -> str:
-        return f'{self.x}, {self.y}'
-
-class Goal:
-
-    def __init__(self, type: str, value: typing.Optional[Position]) -> None:
-        self.type = type
-        self.value = value
-    
-    @staticmethod
-    def from_str(value: str) -> 'Goal':
-        re_match = re.match(r'([^(]+)', value)
-        type = re_match.group(1)
-        re_match = re.match(r'([^(]+)\(,\((\d+), ?(\d+)\)\)', value)
-        if re_match is None:
-            # No associated value
-            return Goal(type, None)
-        x = re_match.group(2)
-        y = re_match.group(3)
-        return Goal(type, Position(x, y))
-    
-    def __repr__(self) -> str:
-        s = f'{self.type}'
-        if self.value is not None:
-            s += f'({self.value})'
-        return s
-
-class Action:
-
-    def __init__(self, action: str) -> None:
-        self.action = action
-    
-    @staticmethod
-    def from_str(value: str) -> 'Action':
-        return Action(value)
-    
-    def __repr__(self) -> str:
-        return self.action
-    
-class Inventory:
-
-    def __init__(self, ammo: int, power_ups: int, gold: int) -> None:
-        self.ammo = ammo
-        self.power_ups = power_ups
-        self.gold = gold
-    
-
-class AgentDeadError(Exception):
-    pass
+import time
+import metrics
 
 class PrologQuery():
 
-    def __init__(self):
+    # pitfall.pl predicates, resolved on first call (see prepared.py)
+    _sense = PreparedQuery('sense', 0, [to_sensors])
+    _set_last_observation = PreparedQuery('set_last_observation', 1)
+    _learn = PreparedQuery('learn', 1, [to_goal, to_action])
+    _tick = PreparedQuery('tick', 6, [to_goal, to_action])
+    _print_cave = PreparedQuery('print_cave', 0)
+    _render_cave = PreparedQuery('render_cave', 0, [to_text])
+    _set_agent_facing = PreparedQuery('set_agent_facing', 1)
+    _set_agent_position = PreparedQuery('set_agent_position', 1)
+    _set_map_size = PreparedQuery('set_map_size', 2)
+    _update_agent_health = PreparedQuery('update_agent_health', 2)
+    _set_game_score = PreparedQuery('set_game_score', 1)
+    _set_detected_enemy = PreparedQuery('set_detected_enemy', 1)
+    _set_got_hit = PreparedQuery('set_got_hit', 0)
+    _get_agent_health = PreparedQuery('get_agent_health', 0, [to_int])
+    _get_game_score = PreparedQuery('get_game_score', 0, [to_int])
+    _get_inventory = PreparedQuery('get_inventory', 0, [to_int, to_int])
+    _collected = PreparedQuery('collected', 1, [to_int])
+    _disable_logging = PreparedQuery('disable_logging', 0)
+    _reset_kb = PreparedQuery('reset_kb', 0)
+    _export_kb = PreparedQuery('export_kb', 0, [to_int])
+    _import_kb = PreparedQuery('import_kb', 1)
+    _enable_phase_timing = PreparedQuery('enable_phase_timing', 0)
+    _take_phase_times = PreparedQuery('take_phase_times', 0, [to_float, to_float, to_float])
+    LEARN_PHASES = ('update_knowledge', 'update_goal', 'next_action')
+    _start_profiling = PreparedQuery('start_profiling', 0)
+    _stop_profiling = PreparedQuery('stop_profiling', 0)
+    _profile_rows = PreparedQuery('profile_rows', 0, [to_list(to_args(to_atom, to_int, to_int, to_float, to_float))])
+    _statistics = PreparedQuery('statistics', 1, [to_int])
+
+    # pitfall.pl is consulted once per process, its code being shared by all engines
+    _loaded = False
+    _load_lock = threading.Lock()
+    # enable_phase_timing/0 was called (it is process-wide)
+    _phase_timing = False
+    # Seconds to wait for a free engine before giving up (EngineError)
+    engine_timeout = 10.0
+
+    def __init__(self, pool: typing.Optional[EnginePool] = None, width: int = grid.WIDTH, height: int = grid.HEIGHT):
+        self.prolog = Prolog()
+        # map_size/2, set again on every reset
+        self.width = width
+        self.height = height
+        # This agent's engine, holding its knowledge base (thread_local in pitfall.pl);
+        # every query of this instance runs in it, from whatever thread
+        self.pool = pool if pool is not None else default_pool()
+        self.engine = self.pool.acquire(timeout=self.engine_timeout)
+        # Profile being filled while in profile()
+        self.profiling: typing.Optional[Profile] = None
         self.reset()
+
+    def fork(self) -> typing.Optional['PrologQuery']:
+        """Another agent with a copy of this one's knowledge base, in an engine of its own.
+
+        None if the pool has no engine to spare right now.
+        """
+        other = PrologQuery.__new__(PrologQuery)
+        other.prolog = self.prolog
+        other.pool = self.pool
+        other.width = self.width
+        other.height = self.height
+        other.profiling = None
+        try:
+            other.engine = self.pool.acquire(timeout=0)
+        except EngineError:
+            return None
+        key = self._export_kb()
+        if key is None or other._import_kb(key[0]) is None:
+            other.close()
+            return None
+        return other
+
+    def close(self):
+        """Give the engine back to the pool, for the next agent."""
+        if self.engine is not None:
+            self.pool.release(self.engine)
+            self.engine = None
     
-    def reset(self):
-        self.prolog = Prolog()
-        logging.root.debug(__file__)
-        package_dir = os.path.dirname(__file__)
-        kb_file = f'{os.path.relpath(package_dir, start=os.curdir)}/pitfall.pl'
-        self.prolog.consult(kb_file)
+    def reset(self, reload: bool = False):
+        """Back to the knowledge base of a new round.
+
+        The knowledge base is put back to the initial facts of pitfall.pl (reset_kb/0),
+        with no disk I/O or recompilation. pitfall.pl is consulted before that the first
+        time, or again with `reload`, e.g. after editing it.
+        """
+        with PrologQuery._load_lock:
+            if not PrologQuery._loaded or reload:
+                logging.root.debug(__file__)
+                package_dir = os.path.dirname(__file__)
+                kb_file = f'{os.path.relpath(package_dir, start=os.curdir)}/pitfall.pl'
+                self.prolog.consult(kb_file)
+                PrologQuery._loaded = True
+        if self._reset_kb() is None:
+            logging.root.debug('Deu ruim na query')
+        self._set_map_size(self.width, self.height)
         
     def sense(self) -> Sensors:
-        query = 'sense((Steps, Breeze, Flash, Glow, Impact, Scream, Potion))'
-        result = self.get_first_result(query)
-        try:
-            return Sensors.from_dict(result)
-        except:
+        result = self._sense()
+        if result is None:
             raise AgentDeadError
+        return result[0]
     
     def set_observations(self, sensors: Sensors):
-        query = f'set_last_observation({sensors})'
-        _ = self.get_first_result(query)
+        self._set_last_observation(sensors)
     
     def get_decision(self) -> Action:
         try:
@@ -128,68 +130,130 @@ class PrologQuery():
         except Exception:
             return None
     
+    def tick(self, x: int, y: int, dir: str, energy: int, score: int, sensors: Sensors,
+             enemy_distance: typing.Optional[int] = None) -> typing.Optional[Action]:
+        """Status, observations and decision of one tick in a single query (tick/8).
+
+        Same as the set_* calls followed by get_decision and print_map.
+        """
+        enemy = 'none' if enemy_distance is None else enemy_distance
+        result = self._tick((x, y), dir, energy, score, sensors, enemy)
+        if self.profiling is not None:
+            self.profiling.ticks += 1
+        if metrics.enabled:
+            self.record_phase_times()
+        if result is None:
+            logging.root.debug('Deu ruim na query')
+            return None
+        goal, action = result
+        logging.info(f'Goal: {goal}')
+        return action
+
+    def record_phase_times(self):
+        """Feed the learn/3 phase times of the last tick to metrics (turning the timing on first)."""
+        if not PrologQuery._phase_timing:
+            self._enable_phase_timing()
+            PrologQuery._phase_timing = True
+            return
+        times = self._take_phase_times()
+        if times is not None:
+            for phase, seconds in zip(self.LEARN_PHASES, times):
+                metrics.LEARN_PHASE_SECONDS.labels(phase).observe(seconds)
+
+    @contextlib.contextmanager
+    def profile(self, profile: typing.Optional[Profile] = None) -> typing.Iterator[Profile]:
+        """Run SWI-Prolog's profiler on this agent's queries in the with block.
+
+        What it sampled is added to `profile` (a new one if None) when the block ends, so the
+        same Profile can sum up many games. tick() and learn() count the ticks; other callers
+        can add to profile.ticks themselves.
+        """
+        profile = profile if profile is not None else Profile()
+        before = self._statistics('inferences')
+        t0 = time.perf_counter()
+        self._start_profiling()
+        self.profiling = profile
+        try:
+            yield profile
+        finally:
+            self.profiling = None
+            self._stop_profiling()
+            profile.seconds += time.perf_counter() - t0
+            after = self._statistics('inferences')
+            if before is not None and after is not None:
+                profile.inferences += after[0] - before[0]
+            rows = self._profile_rows()
+            if rows is None:
+                logging.root.warning('No profile data (profile_rows/1 failed)')
+            else:
+                profile.add(rows[0])
+
     def print_map(self):
-        query = f'print_cave'
-        _ = self.get_first_result(query)
+        self._print_cave()
+
+    def snapshot(self) -> typing.Optional[Rendered]:
+        # The knowledge base is only in this agent's engine, which the viewer thread would
+        # hold while rendering (and a speculative fork may have closed by then), so the
+        # map is drawn here, on the decision thread
+        if self.engine is None:
+            return None
+        return Rendered(self.render())
+
+    def render(self) -> str:
+        """The cave as print_cave/0 draws it (render_cave/1), even with logging disabled."""
+        result = self._render_cave()
+        return result[0] if result is not None else ''
 
     
     def learn(self, sensors: Sensors) -> typing.Tuple[Goal, Action]:
-        query = f'learn({sensors}, Goal, Action)'
-        result = self.get_first_result(query)
+        result = self._learn(sensors)
+        if self.profiling is not None:
+            self.profiling.ticks += 1
         if result is None:
             logging.root.debug('Deu ruim na query')
             return None, 'turn_clockwise'
-        goal_str = result['Goal']
-        action_str = result['Action']
-        goal = Goal.from_str(goal_str)
-        action = Action.from_str(action_str)
-        return goal, action
+        return result
     
     def act(self, action: Action) -> None:
         query = f'act({action})'
         _ = self.get_first_result(query)
     
     def set_facing(self, dir: typing.Literal['north', 'south', 'east', 'west']):
-        query = f'set_agent_facing({dir})'
-        _ = self.get_first_result(query)
+        self._set_agent_facing(dir)
 
     def set_position(self, x: int, y: int):
-        query = f'set_agent_position(({x, y}))'
-        _ = self.get_first_result(query)
+        self._set_agent_position((x, y))
+
+    def set_map_size(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self._set_map_size(width, height)
 
     def set_energy(self, energy: int):
-        query = f'update_agent_health({energy}, 0)'
-        _ = self.get_first_result(query)
+        self._update_agent_health(energy, 0)
 
     def set_score(self, score: int):
-        query = f'set_game_score(({score}))'
-        _ = self.get_first_result(query)
+        self._set_game_score(score)
     
     def set_detected_enemy(self, distance: int):
-        query = f'set_detected_enemy({distance})'
-        _ = self.get_first_result(query)
+        self._set_detected_enemy(distance)
     
     def set_got_hit(self):
-        query = 'set_got_hit'
-        _ = self.get_first_result(query)
+        self._set_got_hit()
     
     def get_health(self) -> int:
-        query = 'get_agent_health(Health)'
-        result = self.get_first_result(query)
+        result = self._get_agent_health()
         if result is None:
             logging.root.debug('Deu ruim na query')
             return 100
-        health_str = result['Health']
-        return int(health_str)
+        return result[0]
     
     def get_game_score(self) -> int:
-        query = 'get_game_score(Score)'
-        result = self.get_first_result(query)
+        result = self._get_game_score()
         if result is None:
             logging.root.debug('Deu ruim na query')
             return 0
-        score_str = result['Score']
-        return int(score_str)
+        return result[0]
     
     def _player_is_at_correct_position(self) -> bool:
         query = f'agent_position(AP), world_position(agent, AP).'
@@ -215,31 +279,32 @@ class PrologQuery():
         self.act(Action('step_out'))
     
     def get_inventory(self) -> Inventory:
-        query = 'get_inventory(Ammo,PowerUps).'
-        res = self.get_first_result(query)
+        res = self._get_inventory()
         if res is None:
             logging.root.debug('Deu ruim na query')
             return Inventory(0, 0, 0)
-        ammo = int(res['Ammo'])
-        power_ups = int(res['PowerUps'])
-        query = 'collected(gold,Gold).'
-        res = self.get_first_result(query)
+        ammo, power_ups = res
+        res = self._collected('gold')
         if res is None:
             logging.root.debug('Deu ruim na query')
             return Inventory(ammo, power_ups, 0)
-        gold = int(res['Gold'])
-        return Inventory(ammo, power_ups, gold)
+        return Inventory(ammo, power_ups, res[0])
 
     def get_first_result(self, query):
         try:
-            for res in self.prolog.query(query):
-                return res
+            with self.engine:
+                results = self.prolog.query(query)
+                try:
+                    for res in results:
+                        return res
+                finally:
+                    # Close the query before leaving the engine
+                    results.close()
         except:
             return None
     
     def disable_logging(self):
-        query = 'disable_logging'
-        _ = self.get_first_result(query)
+        self._disable_logging()
     
 
 if __name__ == "__main__":
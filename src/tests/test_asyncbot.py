@@ -0,0 +1,58 @@
+"""Several AsyncBots on one event loop, against an in-process LocalServer."""
+
+import asyncio
+import threading
+
+from AsyncBot import AsyncBot
+from Map.Cave import Cave
+import Socket.Protocol as Protocol
+from Server.LocalServer import GameServer, LocalServer
+
+
+def serve() -> LocalServer:
+    game = GameServer(lambda round: Cave.generate(seed=round, pits=0, teleporters=0), fast=True, seed=1)
+    server = LocalServer(('127.0.0.1', 0), game)
+    threading.Thread(target=server.serve, daemon=True).start()
+    return server
+
+
+def test_bots_on_one_loop_decide_from_their_own_status():
+    server = serve()
+    port = server.server_address[1]
+    # Per bot: the last status received, and (status then, position decided from) per decision
+    status = {}
+    decisions = {}
+
+    async def play():
+        bots = [AsyncBot('127.0.0.1', port, 'native', None, 0.01, f'bot{i}') for i in range(3)]
+        for bot in bots:
+            status[bot.name] = None
+            decisions[bot.name] = []
+
+            def receive(s, bot=bot):
+                status[bot.name] = (s.x, s.y)
+
+            def decide(x, y, *args, bot=bot, decide=bot.gameAi.decide):
+                decisions[bot.name].append((status[bot.name], (x, y)))
+                return decide(x, y, *args)
+
+            bot.dispatcher.register(Protocol.Status, receive)
+            bot.gameAi.decide = decide
+        games = [asyncio.create_task(bot.run()) for bot in bots]
+        await asyncio.wait(games, timeout=2)
+        for bot, game in zip(bots, games):
+            bot.client.disconnect()
+            game.cancel()
+        await asyncio.gather(*games, return_exceptions=True)
+        return bots
+
+    try:
+        bots = asyncio.run(play())
+    finally:
+        server.shutdown()
+    assert len({id(bot.gameAi.player) for bot in bots}) == len(bots)
+    for name, made in decisions.items():
+        assert len(made) > 10, name
+        assert all(got == decided for got, decided in made), name
+    # They spawned apart, so reading another bot's position would have shown above
+    assert len({made[0][1] for made in decisions.values()}) == len(bots)
@@ -0,0 +1,126 @@
+"""GameAI state kept per instance, with several bots in one process."""
+
+import asyncio
+import time
+
+import pytest
+
+from GameAI import GameAI
+
+
+def ticks(ai: GameAI) -> list:
+    """Record the (x, y) of every tick of ai's brain."""
+    seen = []
+    tick = ai.brain.tick
+
+    def recording(x, y, *args):
+        seen.append((x, y))
+        return tick(x, y, *args)
+
+    ai.brain.tick = recording
+    return seen
+
+
+def test_players_are_separate():
+    a, b = GameAI('native'), GameAI('native')
+    a_ticks, b_ticks = ticks(a), ticks(b)
+    try:
+        for step in range(5):
+            a.SetStatus(1 + step, 1, 'east', 'game', 0, 100)
+            b.SetStatus(20, 10 + step, 'south', 'game', 0, 100)
+            a.GetObservationsClean()
+            b.GetObservationsClean()
+            a.GetDecision()
+            b.GetDecision()
+        assert a.player is not b.player
+        assert (a.player.x, a.player.y) == (5, 1)
+        assert (b.player.x, b.player.y) == (20, 14)
+        assert a_ticks == [(1 + step, 1) for step in range(5)]
+        assert b_ticks == [(20, 10 + step) for step in range(5)]
+    finally:
+        a.close()
+        b.close()
+
+
+def test_speculation_uses_own_player():
+    a, b = GameAI('native', speculative=True), GameAI('native', speculative=True)
+    try:
+        a.SetStatus(3, 3, 'east', 'game', 0, 100)
+        b.SetStatus(30, 20, 'west', 'game', 0, 100)
+        for ai in (a, b):
+            ai.GetObservationsClean()
+            ai.sent_action = 'turn_clockwise'
+            ai.speculate()
+        assert a.speculation.predicted[:3] == (3, 3, 'south')
+        assert b.speculation.predicted[:3] == (30, 20, 'north')
+    finally:
+        a.close()
+        b.close()
+
+
+def test_budget_does_not_block_the_loop():
+    ai = GameAI('native', decision_budget=0.1)
+    tick = ai.brain.tick
+    ai.brain.tick = lambda *args: time.sleep(0.3) or tick(*args)
+    ai.SetStatus(1, 1, 'east', 'game', 0, 100)
+    ai.GetObservationsClean()
+
+    async def play():
+        beats = 0
+
+        async def heartbeat():
+            nonlocal beats
+            while True:
+                await asyncio.sleep(0.01)
+                beats += 1
+
+        beating = asyncio.create_task(heartbeat())
+        decision = await ai.GetDecisionAsync()
+        beating.cancel()
+        return decision, beats
+
+    try:
+        decision, beats = asyncio.run(play())
+        # Out of budget: the fallback, with the loop running all along
+        assert decision == 'virar_direita'
+        assert ai.late_decisions == 1
+        assert beats >= 5
+    finally:
+        ai.close()
+
+
+@pytest.mark.parametrize('budget, asynchronous', [(None, False), (1.0, False), (1.0, True)])
+@pytest.mark.parametrize('delay', [0.0, 0.1])
+def test_failed_speculation_falls_back_to_the_brain(budget, asynchronous, delay):
+    ai = GameAI('native', decision_budget=budget, speculative=True)
+    fork = ai.brain.fork
+
+    def failing_fork():
+        other = fork()
+
+        def tick(*args):
+            time.sleep(delay)
+            raise RuntimeError('speculative tick')
+
+        other.tick = tick
+        return other
+
+    try:
+        ai.SetStatus(1, 1, 'east', 'game', 0, 100)
+        ai.GetObservationsClean()
+        ai.GetDecision()
+        ai.brain.fork = failing_fork
+        ai.speculate()
+        # The replies are the predicted ones, so only the failure rules the speculation out
+        x, y, dir, energy, score = ai.speculation.predicted[:5]
+        if delay == 0.0:
+            # Failed before the replies arrive, or after (delay > 0)
+            ai.speculation.future.exception()
+        ai.SetStatus(x, y, dir, 'game', score, energy)
+        ai.GetObservationsClean()
+        decision = asyncio.run(ai.GetDecisionAsync()) if asynchronous else ai.GetDecision()
+        assert decision != ''
+        assert ai.late_decisions == 0
+        assert 'tick' not in vars(ai.brain)
+    finally:
+        ai.close()